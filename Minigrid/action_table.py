@@ -0,0 +1,65 @@
+import hashlib, os
+import numpy as np
+
+from observation_table import observation_key
+
+ACTION_CACHE=os.environ.get("ACTION_CACHE", "~/.cache/minigrid_actions")
+
+
+def policy_file(policyname):
+    # DQN.load appends .zip when it is missing, do the same
+    return policyname if os.path.isfile(policyname) else f"{policyname}.zip"
+
+def file_hash(filename):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+class ActionTable:
+    """
+    The deterministic action of a policy in every state of the env, as an
+    int8 array indexed by env.state_id (-1 for states the agent cannot be in).
+
+    The table is computed once in batches and cached on disk by the hash of
+    the policy zip together with the observation_key of the observations it
+    was computed from.
+    """
+    def __init__(self, env, policy, policyname, observation_table=None, batch_size=256, cache_dir=ACTION_CACHE):
+        base = env.unwrapped
+        env.reset()
+        self.base = base
+        cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.filename = os.path.join(cache_dir, f"{observation_key(env)}_{file_hash(policy_file(policyname))}.npy")
+        if os.path.exists(self.filename):
+            self.actions = np.load(self.filename)
+        else:
+            self.actions = self._build(env, policy, observation_table, batch_size)
+            tmp_filename = f"{self.filename}.{os.getpid()}.tmp.npy"
+            np.save(tmp_filename, self.actions)
+            os.replace(tmp_filename, self.filename)
+
+    def _build(self, env, policy, observation_table, batch_size):
+        actions = np.full(self.base.num_state_ids(), -1, dtype=np.int8)
+        states = self.base.all_states()
+        for start in range(0, len(states), batch_size):
+            batch = states[start:start + batch_size]
+            if observation_table is not None:
+                observations = observation_table.observations(batch)
+            else:
+                observations = np.stack([env.reset(state=state) for state in batch])
+            batch_actions, _ = policy.predict(observations, deterministic=True)
+            actions[[self.base.state_id(state) for state in batch]] = batch_actions
+        env.reset()
+        return actions
+
+    def __getitem__(self, state):
+        return int(self.actions[self.base.state_id(state)])
+
+    def current(self, env):
+        """Action in the state the env's agent is currently in."""
+        base = env.unwrapped
+        return int(self.actions[(base.agent_pos[0] + base.grid.width * base.agent_pos[1]) * 4 + base.agent_dir])
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+import argparse, json, os, platform, shutil, subprocess, sys, tempfile, time
+from contextlib import redirect_stdout
+import gym
+import numpy as np
+from stable_baselines3 import DQN
+
+import test_model
+from test_model import make_env, observe_states, translate_grid_to_prism, update_prism_file, compare_min_max
+from gym_minigrid.minigrid import isSlippery, isOneWay
+from artifacts import ArtifactStore
+from restriction import DIRECTIONS, PrismRestriction, state_guards
+from gym_minigrid.wrappers import RGBImgObsWrapper, ImgObsWrapper, MiniWrapper
+import observation_table
+from action_table import ActionTable
+from value_iteration import SparseModelChecker
+
+# the envs of the IMT experiments, from the smallest to the largest model
+ENVS = ["MyCliffWalking-S9-v0", "MyCliffWalking-S17-v0", "MyCliffWalking-S25-v0", "MyCliffWalking-S33-v0", "Barcelona-v0"]
+
+# the envs of --restriction-scaling, one layout at growing sizes
+SCALING_ENVS = ["MyCliffWalking-S9-v0", "MyCliffWalking-S17-v0", "MyCliffWalking-S25-v0", "MyCliffWalking-S33-v0"]
+
+# the envs of --check-caches, small enough to fill the tables quickly
+CACHE_ENVS = ["MyCliffWalking-S9-v0"]
+
+# the envs of --check-frames and --check-observations, with doors that are opened and unlocked in place
+FRAME_ENVS = ["MiniGrid-KeyCorridorS3R3-v0", "MiniGrid-DoorKey-8x8-v0", "MyCliffWalking-S9-v0", "Barcelona-v0"]
+
+CONVERTER = "./Minigrid2PRISM/build/main"
+
+# tempest output files the suite reads, a fixtures directory holds them per env as <directory>/<env>/<file>
+FIXTURE_FILES = ["results_maximize", "results_minimize", "action_ranking", "model.prism"]
+
+# the formulas and the label update_prism_file rewrites in the model Minigrid2PRISM writes
+PRISM_HEADER = """mdp
+
+formula AgentIsFixed = false;
+formula AgentSlipperyTurnLeftAllowed = true;
+formula AgentSlipperyTurnRightAllowed = true;
+formula AgentSlipperyMoveForwardAllowed = true;
+
+label "decidedStates" = false;
+
+"""
+
+
+def measure(fn, calls, setup=None):
+    """
+    Times calls calls of fn(k), each after setup(k) which is not timed, and
+    returns the statistics of the time per call in seconds.
+    """
+    times = np.empty(calls)
+    for k in range(calls):
+        if setup is not None: setup(k)
+        start = time.perf_counter()
+        fn(k)
+        times[k] = time.perf_counter() - start
+    return {"calls": calls, "median": float(np.median(times)), "mean": float(times.mean()), "min": float(times.min()), "max": float(times.max())}
+
+def skipped(reason):
+    return {"skipped": reason}
+
+def state_line(state, text, done=False):
+    """A line of tempest's text output, the valuation as StateValuations::toString(state, true) writes it."""
+    return f"[xAgent={state.pos_x}\t& yAgent={state.pos_y}\t& viewAgent={state.dir}\t& {'' if done else '!'}AgentDone]  {text}\n"
+
+def write_fixtures(env, directory, seed=0):
+    """
+    Stand-ins for the tempest output of the layout of env in directory: the
+    min/max values and the action ranking of every state in tempest's text
+    format, with random values and the done copies of the states on goal and
+    lava cells, and a PRISM model with one command per state and action in
+    place of the one Minigrid2PRISM writes.
+    """
+    rng = np.random.default_rng(seed)
+    grid = env.unwrapped.grid
+    states = env.unwrapped.all_states()
+    terminal = lambda state: grid.get(state.pos_x, state.pos_y) is not None and grid.get(state.pos_x, state.pos_y).type in ("goal", "lava")
+    lines = [(state, False) for state in states] + [(state, True) for state in states if terminal(state)]
+    os.makedirs(directory, exist_ok=True)
+    max_values = rng.random(len(lines))
+    min_values = max_values * rng.random(len(lines))
+    # tempest writes the values with std::fixed and setprecision(5), the choice values too
+    with open(os.path.join(directory, "results_maximize"), "w") as f:
+        f.writelines(state_line(state, f"Result:{value:.5f}", done) for (state, done), value in zip(lines, max_values))
+    with open(os.path.join(directory, "results_minimize"), "w") as f:
+        f.writelines(state_line(state, f"Result:{value:.5f}", done) for (state, done), value in zip(lines, min_values))
+    with open(os.path.join(directory, "action_ranking"), "w") as f:
+        for (state, done), value in zip(lines, max_values):
+            labels = ["Agent_done"] if terminal(state) and not done else [""] if done else ["Agent_turn_left", "Agent_turn_right", f"Agent_move_{DIRECTIONS[state.dir]}"]
+            choices = ",".join(f"{label}:{choice_value:.5f}" for label, choice_value in zip(labels, rng.random(len(labels))))
+            f.write(state_line(state, f"Value:{value:.5f}\t Choices:{choices}", done))
+    with open(os.path.join(directory, "model.prism"), "w") as f:
+        f.write(PRISM_HEADER)
+        f.write(f"module Agent\n\txAgent : [0..{env.unwrapped.grid.width - 1}] init 1;\n\tyAgent : [0..{env.unwrapped.grid.height - 1}] init 1;\n\tviewAgent : [0..3] init 0;\n\n")
+        for state in states:
+            guard = f"xAgent={state.pos_x}&yAgent={state.pos_y}&viewAgent={state.dir}"
+            f.write(f"\t[Agent_turn_left] !AgentIsFixed & {guard} -> (viewAgent'={(state.dir - 1) % 4});\n")
+            f.write(f"\t[Agent_turn_right] !AgentIsFixed & {guard} -> (viewAgent'={(state.dir + 1) % 4});\n")
+            f.write(f"\t[Agent_move_{DIRECTIONS[state.dir]}] !AgentIsFixed & {guard} -> true;\n")
+        f.write("endmodule\n")
+
+def fixture_sources(fixtures, name, env, directory):
+    """Path of every fixture file of env: in the fixtures directory if it has the file, generated into directory otherwise."""
+    sources = dict()
+    for f in FIXTURE_FILES:
+        provided = os.path.join(fixtures, name, f) if fixtures else None
+        if provided is not None and os.path.exists(provided):
+            sources[f] = provided
+            continue
+        if not os.path.exists(os.path.join(directory, f)): write_fixtures(env, directory)
+        sources[f] = os.path.join(directory, f)
+    return sources
+
+def load_policy(env, policyname):
+    if policyname:
+        return DQN.load(policyname)
+    # an untrained network of the architecture train.py uses costs the same per prediction
+    return DQN("CnnPolicy", env, buffer_size=1, learning_starts=0, device="cpu")
+
+def benchmark_env(name, policyname, fixtures, calls, batch_size, trimmed):
+    env = make_env(name)
+    env.reset()
+    base = env.unwrapped
+    states = base.all_states()
+    store = ArtifactStore(f"benchmark_{name}", root=tempfile.mkdtemp())
+    sources = fixture_sources(fixtures, name, env, store.path("fixtures"))
+    copy = lambda *files: [shutil.copy(sources[f], store.path(f)) for f in files]
+    copy(*FIXTURE_FILES)
+    policy = load_policy(env, policyname)
+    operations = dict()
+
+    operations["reset_state"] = measure(lambda k: env.reset(state=states[k % len(states)]), calls)
+    operations["full_rgb_observation"] = measure(lambda k: env.observe(), calls, setup=lambda k: env.reset(state=states[k % len(states)]))
+
+    observations = observe_states(env, states[:batch_size])
+    operations["predict_single"] = measure(lambda k: policy.predict(observations[k % len(observations)], deterministic=True), calls)
+    operations["predict_batched"] = measure(lambda k: policy.predict(observations, deterministic=True), max(1, calls // 10))
+    operations["predict_batched"]["batch_size"] = len(observations)
+
+    for operation, is_tile in (("step_slippery", isSlippery), ("step_oneway", isOneWay)):
+        tile_states = [state for state in states if is_tile(base.grid.get(state.pos_x, state.pos_y))]
+        if not tile_states:
+            operations[operation] = skipped(f"{name} has no such tiles")
+            continue
+        operations[operation] = measure(lambda k: env.step(base.actions.forward), calls, setup=lambda k: env.reset(state=tile_states[k % len(tile_states)]))
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        operations["print_grid"] = measure(lambda k: base.printGrid(init=True), calls)
+    oneways = any(isOneWay(base.grid.get(state.pos_x, state.pos_y)) for state in states)
+    if os.path.exists(CONVERTER):
+        operations["translate_grid_to_prism"] = measure(lambda k: translate_grid_to_prism(env, store.path("converted"), oneways), max(1, calls // 10))
+    else:
+        operations["translate_grid_to_prism"] = skipped(f"{CONVERTER} is not built")
+    operations["export_explicit"] = measure(lambda k: base.export_explicit(store.path("explicit"), "SafetyNoBFS"), max(1, calls // 10))
+
+    # a late iteration: the tested states of one iteration are trimmed and half of all states are decided
+    rng = np.random.default_rng(0)
+    tested = [states[k] for k in rng.choice(len(states), size=min(trimmed, len(states)), replace=False)]
+    actions, _ = policy.predict(observe_states(env, tested), deterministic=True)
+    state_actions_to_trim = list(zip(tested, actions))
+    decided_states = set(states[k] for k in rng.choice(len(states), size=len(states) // 2, replace=False))
+    operations["update_prism_file"] = measure(lambda k: update_prism_file(env, store.path("model"), state_actions_to_trim, decided_states, store.path("trimmed")), calls)
+
+    # compare_min_max renames the results it read, every call gets fresh copies
+    operations["compare_min_max"] = measure(lambda k: compare_min_max(base, 0, store), calls, setup=lambda k: copy("results_maximize", "results_minimize"))
+    operations["fill_state_ranking"] = measure(lambda k: base.fillStateRanking(store.path("action_ranking"), decided_states), calls)
+
+    # the in-process numpy backend answers the safety properties of one iteration
+    checker = SparseModelChecker(base.export_explicit(store.path("explicit"), "SafetyNoBFS"), "SafetyNoBFS")
+    os.makedirs(store.path("numpy_backend"), exist_ok=True)
+    operations["numpy_backend_check"] = measure(lambda k: checker.check(100, 0.5, safety=True, directory=store.path("numpy_backend")), max(1, calls // 10))
+
+    env.close()
+    shutil.rmtree(os.path.dirname(store.root), ignore_errors=True)
+    return {"width": base.grid.width, "height": base.grid.height, "states": len(states), "fixtures": {f: "generated" if os.path.dirname(path) == store.path("fixtures") else path for f, path in sources.items()}, "operations": operations}
+
+def explicit_guard(state):
+    return f"(xAgent={state.pos_x}&yAgent={state.pos_y}&viewAgent={state.dir})"
+
+def restriction_scaling(name, iterations, trimmed):
+    """
+    Size of the restriction formulas and the decidedStates label over a
+    simulated IMT run on env: every iteration trims trimmed random states, and
+    the decided states grow as a region around a random cell until they cover
+    the layout. Every iteration reports the characters of the state sets in the
+    encoding of PrismRestriction and in the one term per state encoding, and
+    the time to write the restricted model.
+    """
+    env = make_env(name)
+    env.reset()
+    base = env.unwrapped
+    states = base.all_states()
+    directory = tempfile.mkdtemp()
+    write_fixtures(env, directory)
+    restriction = PrismRestriction(os.path.join(directory, "model"))
+    rng = np.random.default_rng(0)
+    center = states[rng.integers(len(states))]
+    by_distance = sorted(states, key=lambda state: abs(state.pos_x - center.pos_x) + abs(state.pos_y - center.pos_y))
+    per_iteration = list()
+    for i in range(1, iterations + 1):
+        tested = [states[k] for k in rng.choice(len(states), size=min(trimmed, len(states)), replace=False)]
+        state_actions_to_trim = [(state, int(action)) for state, action in zip(tested, rng.integers(len(base.actions), size=len(tested)))]
+        decided_states = set(by_distance[:len(states) * i // iterations])
+        start = time.perf_counter()
+        restriction.update(env, state_actions_to_trim, decided_states, os.path.join(directory, "trimmed"))
+        write = time.perf_counter() - start
+        state_sets = [restriction.fixed, decided_states] + list(restriction.excluded.values())
+        per_iteration.append({"iteration": i, "decided_states": len(decided_states), "fixed_states": len(restriction.fixed),
+                              "explicit_chars": sum(len(" | ".join(explicit_guard(state) for state in state_set)) for state_set in state_sets),
+                              "compact_chars": sum(len(" | ".join(state_guards(state_set))) for state_set in state_sets),
+                              "model_chars": os.path.getsize(os.path.join(directory, "trimmed.prism")), "write_s": write})
+    env.close()
+    shutil.rmtree(directory, ignore_errors=True)
+    return {"width": base.grid.width, "height": base.grid.height, "states": len(states), "iterations": per_iteration}
+
+def version():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()}
+
+def compare(report, baseline_file, tolerance):
+    """Prints the median time of every operation relative to a previous report, returns whether none got slower than tolerance allows."""
+    with open(baseline_file, "r") as f:
+        baseline = json.load(f)
+    ok = True
+    for name, env_report in report["envs"].items():
+        for operation, stats in env_report["operations"].items():
+            old = baseline.get("envs", {}).get(name, {}).get("operations", {}).get(operation, {})
+            if "median" not in stats or "median" not in old: continue
+            ratio = stats["median"] / old["median"]
+            regression = ratio > tolerance
+            ok = ok and not regression
+            print(f"{'SLOWER' if regression else 'ok':6}\t{ratio:6.2f}x\t{name}\t{operation}")
+    return ok
+
+def main_scaling(envs, iterations, trimmed, output):
+    test_model.LOG_MODE = False
+    report = {"version": version(), "created": time.time(), "restriction_scaling": dict()}
+    print(f"{'env':24}\tstates\texplicit\tcompact\twrite ms")
+    for name in envs:
+        report["restriction_scaling"][name] = restriction_scaling(name, iterations, trimmed)
+        last = report["restriction_scaling"][name]["iterations"][-1]
+        print(f"{name:24}\t{report['restriction_scaling'][name]['states']}\t{last['explicit_chars']}\t\t{last['compact_chars']}\t{last['write_s'] * 1e3:.3f}")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    return True
+
+def check_frames(envs, steps, seed=0):
+    """
+    Steps every env with seeded random actions (toggling doors included) and
+    compares every observation of RGBImgObsWrapper, patched from the cached
+    background frame, with the frame rendered from scratch.
+    """
+    matching = True
+    for name in envs:
+        env = RGBImgObsWrapper(gym.make(name))
+        base = env.unwrapped
+        env.reset(seed=seed)
+        rng = np.random.default_rng(seed)
+        mismatches = toggles = 0
+        for step in range(steps):
+            action = int(rng.integers(len(base.actions)))
+            toggles += len(base.actions) > 3 and action == base.actions.toggle
+            obs, _, terminated, truncated, _ = env.step(action)
+            if not np.array_equal(obs["image"], base.get_frame(highlight=False, tile_size=env.tile_size)): mismatches += 1
+            if terminated or truncated: env.reset(seed=seed + step + 1)
+        print(f"{name:28}	{steps} steps	{toggles} toggles	{mismatches} mismatching frames")
+        matching &= mismatches == 0
+        env.close()
+    return matching
+
+class ConstantPolicy:
+    """Stands in for the DQN of --check-caches, only the names of the cached tables are checked."""
+    def predict(self, observations, deterministic=True):
+        return np.zeros(len(observations), dtype=np.int64), None
+
+def check_caches(envs):
+    """
+    Fills the observation and action tables of every env for two tile sizes
+    and a bumped RENDER_VERSION in a temporary directory, and checks that each
+    of them gets tables of its own.
+    """
+    matching = True
+    version = observation_table.RENDER_VERSION
+    with tempfile.TemporaryDirectory() as directory:
+        policyname = os.path.join(directory, "policy.zip")
+        with open(policyname, "wb") as f:
+            f.write(b"policy")
+        for name in envs:
+            filenames = set()
+            for tile_size, render_version in [(8, version), (6, version), (8, version + 1)]:
+                observation_table.RENDER_VERSION = render_version
+                try:
+                    env = MiniWrapper(ImgObsWrapper(RGBImgObsWrapper(gym.make(name), tile_size=tile_size)))
+                    observations = observation_table.ObservationTable(env, cache_dir=directory)
+                    actions = ActionTable(env, ConstantPolicy(), policyname, observations, cache_dir=directory)
+                finally:
+                    observation_table.RENDER_VERSION = version
+                filenames.update([observations.filename, actions.filename])
+                env.close()
+            print(f"{name:28}\t{len(filenames)} of 6 tables distinct")
+            matching &= len(filenames) == 6
+    return matching
+
+def check_observations(envs, steps, seed=0):
+    """
+    Steps the wrapper stack of test_model over every env with seeded random
+    actions and checks that the observations of the unwrapped env stay inside
+    its observation_space, and those of the wrappers inside theirs.
+    """
+    matching = True
+    for name in envs:
+        env = make_env(name)
+        base = env.unwrapped
+        observation = env.reset(seed=seed)
+        base_observation, _ = base.reset(seed=seed)
+        rng = np.random.default_rng(seed)
+        invalid = int(not base.observation_space.contains(base_observation)) + int(not env.observation_space.contains(observation))
+        for step in range(steps):
+            base_observation, _, terminated, truncated, _ = base.step(int(rng.integers(len(base.actions))))
+            invalid += not base.observation_space.contains(base_observation)
+            if terminated or truncated: base.reset(seed=seed + step + 1)
+        print(f"{name:28}\t{steps} steps\t{invalid} observations outside the observation space")
+        matching &= invalid == 0
+        env.close()
+    return matching
+
+def main(envs, policies, fixtures, calls, batch_size, trimmed, output, baseline, tolerance):
+    test_model.LOG_MODE = False
+    report = {"version": version(), "created": time.time(), "calls": calls, "envs": dict()}
+    for name in envs:
+        print(f"Benchmarking {name}")
+        report["envs"][name] = benchmark_env(name, policies.get(name), fixtures, calls, batch_size, trimmed)
+        for operation, stats in report["envs"][name]["operations"].items():
+            print(f"\t{operation:24}\t{stats['skipped'] if 'skipped' in stats else format(stats['median'] * 1e3, '10.3f') + ' ms'}")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    return compare(report, baseline, tolerance) if baseline else True
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Times the operations of the IMT loop on the experiment envs and writes the results as JSON. Run it from the directory of test_model.py.")
+    parser.add_argument('--envs', type=str, nargs='+', required=False, default=None, help='(optional) Env ids to benchmark, defaults to the CliffWalking sizes and Barcelona (only the CliffWalking sizes with --restriction-scaling).')
+    parser.add_argument('--policy', type=str, nargs='*', required=False, default=[], help='(optional) ENV=POLICY pairs of trained policies, envs without one use an untrained network of the same architecture.')
+    parser.add_argument('--fixtures', type=str, required=False, default=None, help='(optional) Directory with the tempest output per env (<env>/results_maximize, results_minimize, action_ranking, model.prism), missing files are generated.')
+    parser.add_argument('--calls', type=int, required=False, default=200, help='(optional) Number of timed calls per operation, defaults to 200.')
+    parser.add_argument('--batch-size', type=int, required=False, default=256, help='(optional) Number of observations of a batched prediction, defaults to 256.')
+    parser.add_argument('--trimmed', type=int, required=False, default=15, help='(optional) Number of tested states update_prism_file trims, defaults to 15.')
+    parser.add_argument('--output', type=str, required=False, default="benchmark.json", help='(optional) JSON file for the results, defaults to benchmark.json.')
+    parser.add_argument('--compare', type=str, required=False, default=None, help='(optional) JSON file of a previous run, the median times are compared to it.')
+    parser.add_argument('--restriction-scaling', action='store_true', help='(optional) Instead of timing the operations, report the size of the restriction formulas and labels over a simulated run per env.')
+    parser.add_argument('--iterations', type=int, required=False, default=30, help='(optional) Number of simulated iterations of --restriction-scaling, defaults to 30.')
+    parser.add_argument('--check-frames', action='store_true', help='(optional) Instead of timing the operations, check that the cached RGB observations match frames rendered from scratch over random steps per env.')
+    parser.add_argument('--check-caches', action='store_true', help='(optional) Instead of timing the operations, check that the observation and action tables are cached apart per tile size and RENDER_VERSION.')
+    parser.add_argument('--check-observations', action='store_true', help='(optional) Instead of timing the operations, check that the observations of the wrapped envs stay inside the observation space of the unwrapped env over random steps per env.')
+    parser.add_argument('--steps', type=int, required=False, default=300, help='(optional) Number of random steps per env of --check-frames and --check-observations, defaults to 300.')
+    parser.add_argument('--tolerance', type=float, required=False, default=1.2, help='(optional) Ratio to the previous median above which an operation counts as slower, defaults to 1.2.')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parseArgs()
+    policies = dict(pair.split("=", 1) for pair in args.policy)
+    if args.check_caches:
+        sys.exit(0 if check_caches(args.envs or CACHE_ENVS) else 1)
+    if args.check_observations:
+        sys.exit(0 if check_observations(args.envs or FRAME_ENVS, args.steps) else 1)
+    if args.check_frames:
+        sys.exit(0 if check_frames(args.envs or FRAME_ENVS, args.steps) else 1)
+    if args.restriction_scaling:
+        sys.exit(0 if main_scaling(args.envs or SCALING_ENVS, args.iterations, args.trimmed, args.output) else 1)
+    sys.exit(0 if main(args.envs or ENVS, policies, args.fixtures, args.calls, args.batch_size, args.trimmed, args.output, args.compare, args.tolerance) else 1)
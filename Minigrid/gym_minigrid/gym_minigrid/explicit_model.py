@@ -0,0 +1,143 @@
+import os
+import numpy as np
+from collections import defaultdict
+from dataclasses import dataclass
+
+from gym_minigrid.minigrid import isOneWay, isSlippery
+from gym_minigrid.tempest_results import VALUATIONS_FILE
+from gym_minigrid.transition_model import cannot_turn, step_distribution
+
+# viewAgent -> direction used in the choice labels of Minigrid2PRISM
+DIRECTIONS = ["east", "south", "west", "north"]
+
+# dtype of the state valuations tempest writes with --binaryresults
+VALUATION_DTYPE = [("xAgent", np.int64), ("yAgent", np.int64), ("viewAgent", np.int64), ("AgentDone", bool)]
+
+# the reward structures of Minigrid2PRISM, as the reward of a state on a goal or lava cell, done or not, with the BFS reward of its cell
+REWARD_STRUCTURES = {
+    "SafetyNoBFS":          lambda goal, lava, done, bfs: -100 * (lava and not done),
+    "SafetyNoBFSAndGoal":   lambda goal, lava, done, bfs: 100 * (goal and not done) - 100 * (lava and not done),
+    "Time":                 lambda goal, lava, done, bfs: -1 * (not goal) + 100 * (goal and not done) - 100 * (lava and not done),
+    "SafetyWithBFS":        lambda goal, lava, done, bfs: -100 * (lava and not done) + bfs,
+    "SafetyWithBFSAndGoal": lambda goal, lava, done, bfs: 100 * (goal and not done) - 100 * (lava and not done) + bfs,
+}
+
+
+def choice_label(action_name, dir):
+    """Label of the choice an env action corresponds to, like the commands of Minigrid2PRISM."""
+    if action_name == "left": return "Agent_turn_left"
+    if action_name == "right": return "Agent_turn_right"
+    if action_name == "forward": return f"Agent_move_{DIRECTIONS[dir]}"
+    return "Agent_stuck"
+
+
+@dataclass
+class ExplicitModel:
+    """
+    The MDP of one layout in tempest's explicit format. State i has the
+    valuation valuations[i]; the states on goal and lava cells have a done
+    copy, reached by their only choice Agent_done. choices[i] lists the
+    (label, {target: probability}) of every choice of state i, labels maps a
+    state label to its states and rewards a reward structure to the reward
+    of every state.
+    """
+    valuations: np.ndarray
+    choices: list
+    labels: dict
+    rewards: dict
+    index: dict
+
+    def state_index(self, state):
+        return self.index[(state.pos_x, state.pos_y, state.dir)]
+
+    def write(self, name, reward_structure, fixed=None, decided_states=()):
+        """
+        Writes name.tra, name.lab, name.choicelab and name.rew (the state
+        rewards of reward_structure), and the state valuations next to them.
+        fixed maps state indices to the label of the only choice they keep.
+        """
+        if reward_structure not in self.rewards: raise ValueError(f"{reward_structure} is not one of the reward structures {list(self.rewards)}.")
+        fixed = fixed or dict()
+        labels = dict(self.labels, decidedStates=sorted(self.state_index(state) for state in decided_states))
+        with open(f"{name}.tra", "w") as tra, open(f"{name}.choicelab", "w") as choicelab:
+            tra.write("mdp\n")
+            for state, choices in enumerate(self.choices):
+                kept = [choice for choice in choices if choice[0] == fixed[state]] if state in fixed else choices
+                for choice, (label, transitions) in enumerate(kept or choices):
+                    tra.writelines(f"{state} {choice} {target} {probability}\n" for target, probability in transitions.items())
+                    if label: choicelab.write(f"{state} {choice} {label}\n")
+        state_labels = defaultdict(list)
+        for label, states in labels.items():
+            for state in states: state_labels[state].append(label)
+        with open(f"{name}.lab", "w") as lab:
+            lab.write("#DECLARATION\n" + " ".join(labels) + "\n#END\n")
+            lab.writelines(f"{state} {' '.join(state_labels[state])}\n" for state in sorted(state_labels))
+        with open(f"{name}.rew", "w") as rew:
+            rew.writelines(f"{state} {reward}\n" for state, reward in enumerate(self.rewards[reward_structure]) if reward != 0)
+        np.save(os.path.join(os.path.dirname(name), VALUATIONS_FILE), self.valuations)
+
+
+def build_explicit_model(env, cell_labels=None):
+    """
+    Enumerates the states and the left, right and forward choices of the
+    current layout of the (unwrapped) env, with the outcomes of
+    MiniGridEnv.step: slippery tiles spread a move over their neighbourhood,
+    one-way tiles cannot be entered against their direction, and a step
+    with lava or the goal in front ends on that cell. Envs with more actions
+    get an Agent_stuck choice for the ones that do not move the agent.
+    cell_labels maps extra state labels to the cells whose states they hold.
+    """
+    grid, actions = env.grid, env.actions
+    cells = [(x, y) for y in range(grid.height) for x in range(grid.width) if grid.get(x, y) is None or grid.get(x, y).can_overlap()]
+    terminal = {(x, y): grid.get(x, y).type for x, y in cells if grid.get(x, y) is not None and grid.get(x, y).type in ("goal", "lava")}
+    states = [(x, y, dir, False) for x, y in cells for dir in range(4)]
+    states += [(x, y, dir, True) for x, y in terminal for dir in range(4)]
+    index = {(x, y, dir): i for i, (x, y, dir, done) in enumerate(states) if not done}
+    done_index = {(x, y, dir): i for i, (x, y, dir, done) in enumerate(states) if done}
+    moves = [actions.left, actions.right, actions.forward] + ([actions.done] if len(actions) > 3 else [])
+
+    choices = list()
+    for x, y, dir, done in states:
+        if done:
+            choices.append([(None, {done_index[(x, y, dir)]: 1.0})])
+            continue
+        if (x, y) in terminal:
+            choices.append([("Agent_done", {done_index[(x, y, dir)]: 1.0})])
+            continue
+        state_choices = list()
+        for action in moves:
+            transitions = defaultdict(float)
+            distribution = step_distribution(env, x, y, dir, action)
+            total = sum(p for p, *_ in distribution)
+            for p, new_dir, (fx, fy), fwd_cell, moved in distribution:
+                if p == 0: continue
+                target = (x, y)
+                if fwd_cell is not None and isOneWay(fwd_cell) and abs(fwd_cell.direction - new_dir) == 2:
+                    pass
+                elif (fx, fy) in terminal or (moved and (fwd_cell is None or fwd_cell.can_overlap())):
+                    target = (fx, fy)
+                transitions[index[(*target, new_dir)]] += p / total
+            state_choices.append((choice_label(actions(action).name, dir), dict(transitions)))
+        choices.append(state_choices)
+
+    on = lambda predicate: [i for i, (x, y, dir, done) in enumerate(states) if predicate(x, y, done)]
+    start = (*env.agent_start_pos, env.agent_start_dir) if env.agent_start_pos is not None else (*env.agent_pos, env.agent_dir)
+    labels = {
+        "init": [index[start]],
+        "AgentIsInGoal": on(lambda x, y, done: terminal.get((x, y)) == "goal"),
+        "AgentIsInLava": on(lambda x, y, done: terminal.get((x, y)) == "lava"),
+        "AgentIsInGoalAndNotDone": on(lambda x, y, done: terminal.get((x, y)) == "goal" and not done),
+        "AgentIsInLavaAndNotDone": on(lambda x, y, done: terminal.get((x, y)) == "lava" and not done),
+        "AgentDone": on(lambda x, y, done: done),
+        "AgentCannotTurn": on(lambda x, y, done: cannot_turn(grid, x, y)),
+        "AgentIsOnSlippery": on(lambda x, y, done: isSlippery(grid.get(x, y))),
+        "AgentIsOnOneWay": on(lambda x, y, done: isOneWay(grid.get(x, y))),
+    }
+    for label, label_cells in (cell_labels or dict()).items():
+        label_cells = set(map(tuple, label_cells))
+        labels[label] = on(lambda x, y, done: (x, y) in label_cells)
+
+    bfs = lambda x, y: env.bfs_reward[x + grid.width * y] if env.bfs_reward else 0
+    rewards = {structure: np.array([reward(terminal.get((x, y)) == "goal", terminal.get((x, y)) == "lava", done, bfs(x, y)) for x, y, dir, done in states], dtype=float)
+               for structure, reward in REWARD_STRUCTURES.items()}
+    return ExplicitModel(np.array(states, dtype=VALUATION_DTYPE), choices, labels, rewards, index)
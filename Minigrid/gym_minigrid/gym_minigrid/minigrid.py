@@ -12,6 +12,7 @@ from gym.utils import seeding
 
 from collections import deque
 from copy import deepcopy
+from functools import lru_cache
 import colorsys
 
 
@@ -29,12 +30,16 @@ from gym_minigrid.rendering import (
     point_in_rect,
     point_in_triangle,
     rotate_fn,
+    shape_mask,
+    TileCache,
 )
 from gym_minigrid.window import Window
 
 #from gym_minigrid.Task import DoRandom, TaskManager, DoNothing, GoTo, PlaceObject, PickUpObject, Task
 
 TILE_PIXELS = 32
+# bump whenever the rendering of tiles changes, it is part of the key of the cached observation tables
+RENDER_VERSION = 1
 
 # Map of color names to RGB values
 COLORS = {
@@ -87,6 +92,10 @@ def color_states(value, ranking, nr_bins):
                 inter_value = (value - bin_bound_values[i])/(bin_bound_values[i+1] - bin_bound_values[i])
             return (color_values[i+1] - color_values[i]) * inter_value + color_values[i]
 
+def pixel_color(color):
+    # the colour as it ends up in a uint8 image
+    return tuple(np.asarray(color).astype(np.uint8).tolist())
+
 def isSlippery(cell):
     if isinstance(cell, SlipperyNorth):
         return True
@@ -148,6 +157,10 @@ STATE_TO_IDX = {
     "locked": 2,
 }
 
+# Encoding of an empty cell and of the (grey) walls around a sliced grid
+EMPTY_ENCODING = (OBJECT_TO_IDX["empty"], 0, 0)
+WALL_ENCODING = (OBJECT_TO_IDX["wall"], COLOR_TO_IDX["grey"], 0)
+
 # Map of agent direction indices to vectors
 DIR_TO_VEC = [
     # Pointing right (positive X)
@@ -426,6 +439,10 @@ class WorldObj:
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def render_key(self):
+        """Tuple that is equal for objects that render the same, used to cache rendered tiles"""
+        return self.encode()
+
     @staticmethod
     def decode(type_idx, color_idx, state):
         """Create an object from a 3-tuple state description"""
@@ -577,10 +594,13 @@ class Door(WorldObj):
             if isinstance(env.carrying, Key) and env.carrying.color == self.color:
                 self.is_locked = False
                 self.is_open = True
+                env.grid.set(*pos, self)
                 return True
             return False
 
         self.is_open = not self.is_open
+        # the grid keeps the encoding of its cells
+        env.grid.set(*pos, self)
         return True
 
     def encode(self):
@@ -863,23 +883,12 @@ tri_11 = point_in_triangle(
 )
 
 def tri_mask(width, heigth):
-    list22 = []
-    list33 = []
-    list00 = []
-    list11 = []
-    for x in range(width):
-        for y in range(heigth):
-            yf = (y + 0.5) / heigth
-            xf = (x + 0.5) / width
-            if tri_22(xf,yf):
-                list22.append((x,y))
-            elif tri_33(xf,yf):
-                list33.append((x,y))
-            elif tri_00(xf,yf):
-                list00.append((x,y))
-            elif tri_11(xf,yf):
-                list11.append((x,y))
-    return np.array(list22), np.array(list33), np.array(list00), np.array(list11)
+    # (x, y) pairs in x-major order, a pixel on the border of two triangles belongs to the first one
+    mask22 = shape_mask(tri_22, heigth, width).T
+    mask33 = shape_mask(tri_33, heigth, width).T & ~mask22
+    mask00 = shape_mask(tri_00, heigth, width).T & ~mask22 & ~mask33
+    mask11 = shape_mask(tri_11, heigth, width).T & ~mask22 & ~mask33 & ~mask00
+    return np.argwhere(mask22), np.argwhere(mask33), np.argwhere(mask00), np.argwhere(mask11)
 
 list22, list33, list00, list11 = tri_mask(96, 96)
 
@@ -900,6 +909,9 @@ class HeatMapTile(WorldObj):
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def render_key(self):
+        return self.encode() + tuple(pixel_color(color_states(self.tile_values[dir], self.ranking, self.nr_bins)) for dir in range(4))
+
     def render(self, img):
         img[tuple(list22.T)] = color_states(self.tile_values[2], self.ranking, self.nr_bins)
         img[tuple(list33.T)] = color_states(self.tile_values[3], self.ranking, self.nr_bins)
@@ -915,6 +927,9 @@ class FixedMapTile(WorldObj):
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX[self.color], 0)
 
+    def render_key(self):
+        return self.encode() + tuple(pixel_color(self.tile_values[dir]) for dir in range(4))
+
     def render(self, img):
         img[tuple(list22.T)] = self.tile_values[2]
         img[tuple(list33.T)] = self.tile_values[3]
@@ -936,6 +951,8 @@ class RGBTile(WorldObj):
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX["blue"], 0)
 
+    def render_key(self):
+        return self.encode() + pixel_color(self.color)
 
     def render(self, img):
         fill_coords(img, point_in_rect(0, 1, 0, 1), self.color)
@@ -958,18 +975,64 @@ class HeatMapTileReduced(WorldObj):
         """Encode the a description of this object as a 3-tuple of integers"""
         return (OBJECT_TO_IDX[self.type], COLOR_TO_IDX["blue"], 0)
 
+    def render_key(self):
+        return self.encode() + pixel_color(self.color)
 
     def render(self, img):
         fill_coords(img, point_in_rect(0, 1, 0, 1), self.color)
 
 
+def opaque_cells(encoding):
+    """Cells of an encoded grid the agent cannot see behind, like WorldObj.see_behind: walls and closed doors"""
+    types = encoding[:, :, 0]
+    return (types == OBJECT_TO_IDX["wall"]) | ((types == OBJECT_TO_IDX["door"]) & (encoding[:, :, 2] != STATE_TO_IDX["open"]))
+
+def spread(seeds, transparent):
+    """
+    Cells of a row a left to right scan passes the view on from: transparent
+    cells after a seed without an opaque cell in between. The last cell has no
+    cell to pass it on to.
+    """
+    index = np.arange(len(seeds))
+    last_seed = np.maximum.accumulate(np.where(seeds & transparent, index, -1))
+    last_opaque = np.maximum.accumulate(np.where(transparent, -1, index))
+    passes = transparent & (last_seed > last_opaque)
+    passes[-1] = False
+    return passes
+
+@lru_cache(maxsize=2**14)
+def visibility(opaque, width, height, agent_x, agent_y):
+    """
+    Grid.process_vis of a grid whose opaque cells are given as the bytes of a
+    (width, height) bool array. The view only depends on them, so masks are
+    shared by all grids and views with the same pattern.
+    """
+    transparent = ~np.frombuffer(opaque, dtype=bool).reshape(width, height)
+    mask = np.zeros((width, height), dtype=bool)
+    mask[agent_x, agent_y] = True
+    for j in reversed(range(0, height)):
+        row = transparent[:, j]
+        # left to right, then right to left with the cells made visible before
+        right = spread(mask[:, j], row)
+        mask[1:, j] |= right[:-1]
+        left = spread(mask[::-1, j], row[::-1])[::-1]
+        mask[:-1, j] |= left[1:]
+        if j > 0:
+            # every cell passing the view on also shows the cells above it and the next one
+            mask[:, j - 1] |= right | left
+            mask[1:, j - 1] |= right[:-1]
+            mask[:-1, j - 1] |= left[1:]
+    mask.flags.writeable = False
+    return mask
+
+
 class Grid:
     """
     Represent a grid and operations on it
     """
 
-    # Static cache of pre-renderer tiles
-    tile_cache = {}
+    # Static cache of pre-rendered tiles
+    tile_cache = TileCache()
 
     def __init__(self, width, height):
         assert width >= 3
@@ -978,9 +1041,36 @@ class Grid:
         self.width = width
         self.height = height
 
-        self.grid = [None] * width * height
+        # objects holds the WorldObj of every cell, encoding their (type, color, state) in (width, height, 3) layout.
+        # Grids made from an encoding (decode, slice, rotate_left) create the objects only when a cell is read
+        self.objects = [None] * width * height
+        self.encoding = np.zeros((width, height, 3), dtype=np.uint8)
+        self.encoding[:, :, 0] = OBJECT_TO_IDX["empty"]
+        self.materialized = True
         self.background = [None] * width * height
 
+    @property
+    def grid(self):
+        if not self.materialized:
+            for k in range(len(self.objects)):
+                j, i = divmod(k, self.width)
+                self.get(i, j)
+            self.materialized = True
+        return self.objects
+
+    @grid.setter
+    def grid(self, objects):
+        self.objects = objects
+        self.materialized = True
+        encoding = np.array([EMPTY_ENCODING if v is None else v.encode() for v in objects], dtype=np.uint8)
+        self.encoding = np.ascontiguousarray(encoding.reshape(self.height, self.width, 3).transpose(1, 0, 2))
+
+    def restore(self, objects, encoding):
+        """Replaces all cells with objects, encoding has to be their encoding"""
+        self.objects = objects
+        self.encoding = encoding.copy()
+        self.materialized = True
+
     def __contains__(self, key):
         if isinstance(key, WorldObj):
             for e in self.grid:
@@ -997,9 +1087,7 @@ class Grid:
         return False
 
     def __eq__(self, other):
-        grid1 = self.encode()
-        grid2 = other.encode()
-        return np.array_equal(grid2, grid1)
+        return np.array_equal(self.encoding, other.encoding)
 
     def __ne__(self, other):
         return not self == other
@@ -1010,12 +1098,16 @@ class Grid:
     def set(self, i, j, v):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        self.grid[j * self.width + i] = v
+        self.objects[j * self.width + i] = v
+        self.encoding[i, j] = EMPTY_ENCODING if v is None else v.encode()
 
     def get(self, i, j):
         assert i >= 0 and i < self.width
         assert j >= 0 and j < self.height
-        return self.grid[j * self.width + i]
+        v = self.objects[j * self.width + i]
+        if v is None and not self.materialized and self.encoding[i, j, 0] > OBJECT_TO_IDX["empty"]:
+            v = self.objects[j * self.width + i] = WorldObj.decode(*self.encoding[i, j].tolist())
+        return v
 
     def set_background(self, i, j, v):
         assert i >= 0 and i < self.width
@@ -1045,38 +1137,38 @@ class Grid:
         self.vert_wall(x, y, h, obj_type=obj_type)
         self.vert_wall(x + w - 1, y, h, obj_type=obj_type)
 
-    def rotate_left(self):
+    def rotate_left(self, times=1):
         """
-        Rotate the grid to the left (counter-clockwise)
+        Rotate the grid to the left (counter-clockwise), times times
         """
 
-        grid = Grid(self.height, self.width)
-
-        for i in range(self.width):
-            for j in range(self.height):
-                v = self.get(i, j)
-                grid.set(j, grid.height - 1 - i, v)
+        width, height = (self.width, self.height) if times % 2 == 0 else (self.height, self.width)
+        grid = Grid(width, height)
+        grid.encoding = np.ascontiguousarray(np.rot90(self.encoding, times, axes=(1, 0)))
+        objects = np.empty(len(self.objects), dtype=object)
+        objects[:] = self.objects
+        grid.objects = np.rot90(objects.reshape(self.height, self.width), times).ravel().tolist()
+        grid.materialized = self.materialized
 
         return grid
 
     def slice(self, topX, topY, width, height):
         """
-        Get a subset of the grid
+        Get a subset of the grid, cells outside of it are walls
         """
 
         grid = Grid(width, height)
-
-        for j in range(0, height):
-            for i in range(0, width):
-                x = topX + i
-                y = topY + j
-
-                if x >= 0 and x < self.width and y >= 0 and y < self.height:
-                    v = self.get(x, y)
-                else:
-                    v = Wall()
-
-                grid.set(i, j, v)
+        grid.encoding[:, :] = WALL_ENCODING
+
+        x0, x1 = max(topX, 0), min(topX + width, self.width)
+        y0, y1 = max(topY, 0), min(topY + height, self.height)
+        if x0 < x1 and y0 < y1:
+            grid.encoding[x0 - topX:x1 - topX, y0 - topY:y1 - topY] = self.encoding[x0:x1, y0:y1]
+            for y in range(y0, y1):
+                k = (y - topY) * width + x0 - topX
+                grid.objects[k:k + x1 - x0] = self.objects[y * self.width + x0:y * self.width + x1]
+        # the walls outside are created when read
+        grid.materialized = False
 
         return grid
 
@@ -1089,16 +1181,20 @@ class Grid:
         """
         # Hash map lookup key for the cache
         # this prevents re-rendering tiles
-        key = (agent_dir, highlight, tile_size)
+        key = (agent_dir, highlight, tile_size, subdivs)
         if obj:
-            key = key + obj.encode()
+            key = key + obj.render_key()
+        key = key + (None,)
         if background:
-            key = key + background.encode()
+            key = key + background.render_key()
+        key = key + (None,)
         if carrying:
-            key = key + carrying.encode()
+            key = key + carrying.render_key()
 
-        if key in cls.tile_cache and cache:
-            return cls.tile_cache[key]
+        if cache:
+            img = cls.tile_cache.get(key)
+            if img is not None:
+                return img
 
         img = np.zeros(
             shape=(tile_size * subdivs, tile_size * subdivs, 3), dtype=np.uint8
@@ -1143,10 +1239,11 @@ class Grid:
             highlight_img(img)
 
         # Downsample the image to perform supersampling/anti-aliasing
-        img = downsample(img, subdivs)
+        img = downsample(img, subdivs).astype(np.uint8)
 
         # Cache the rendered tile
-        cls.tile_cache[key] = img
+        if cache:
+            cls.tile_cache.put(key, img)
 
         return img
 
@@ -1195,24 +1292,9 @@ class Grid:
         """
 
         if vis_mask is None:
-            vis_mask = np.ones((self.width, self.height), dtype=bool)
-
-        array = np.zeros((self.width, self.height, 3), dtype="uint8")
+            return self.encoding.copy()
 
-        for i in range(self.width):
-            for j in range(self.height):
-                if vis_mask[i, j]:
-                    v = self.get(i, j)
-
-                    if v is None:
-                        array[i, j, 0] = OBJECT_TO_IDX["empty"]
-                        array[i, j, 1] = 0
-                        array[i, j, 2] = 0
-
-                    else:
-                        array[i, j, :] = v.encode()
-
-        return array
+        return self.encoding * vis_mask[:, :, None]
 
     @staticmethod
     def decode(array):
@@ -1223,54 +1305,22 @@ class Grid:
         width, height, channels = array.shape
         assert channels == 3
 
-        vis_mask = np.ones(shape=(width, height), dtype=bool)
+        vis_mask = array[:, :, 0] != OBJECT_TO_IDX["unseen"]
 
+        # the objects are decoded when read, unseen cells are empty
         grid = Grid(width, height)
-        for i in range(width):
-            for j in range(height):
-                type_idx, color_idx, state = array[i, j]
-                v = WorldObj.decode(type_idx, color_idx, state)
-                grid.set(i, j, v)
-                vis_mask[i, j] = type_idx != OBJECT_TO_IDX["unseen"]
+        grid.encoding = np.where((array[:, :, 0] > OBJECT_TO_IDX["empty"])[:, :, None], array, EMPTY_ENCODING).astype(np.uint8)
+        grid.materialized = False
 
         return grid, vis_mask
 
     def process_vis(self, agent_pos):
-        mask = np.zeros(shape=(self.width, self.height), dtype=bool)
-
-        mask[agent_pos[0], agent_pos[1]] = True
-
-        for j in reversed(range(0, self.height)):
-            for i in range(0, self.width - 1):
-                if not mask[i, j]:
-                    continue
+        mask = visibility(opaque_cells(self.encoding).tobytes(), self.width, self.height, *agent_pos).copy()
 
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i + 1, j] = True
-                if j > 0:
-                    mask[i + 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-            for i in reversed(range(1, self.width)):
-                if not mask[i, j]:
-                    continue
-
-                cell = self.get(i, j)
-                if cell and not cell.see_behind():
-                    continue
-
-                mask[i - 1, j] = True
-                if j > 0:
-                    mask[i - 1, j - 1] = True
-                    mask[i, j - 1] = True
-
-        for j in range(0, self.height):
-            for i in range(0, self.width):
-                if not mask[i, j]:
-                    self.set(i, j, None)
+        hidden = ~mask
+        self.encoding[hidden] = EMPTY_ENCODING
+        for k in np.flatnonzero(hidden.T):
+            self.objects[k] = None
 
         return mask
 
@@ -1284,6 +1334,74 @@ class Grid:
         return neighbours
 
 
+class FrameCache:
+    """
+    Full frame of a grid without highlighting, in (width, height, 3) pixel
+    layout. The cells are rendered once into a background frame, a frame is a
+    copy of it with the agent's tile drawn in. Cells that render differently
+    since are re-rendered into the background first: a cell counts as changed
+    if its object or background was replaced, its encoding changed (objects
+    changed in place, like opened doors, are set again) or, for objects whose
+    render_key is more than their encoding, that key changed.
+    """
+    def __init__(self, tile_size):
+        self.tile_size = tile_size
+        self.background = None
+        self.cells = None
+        self.background_cells = None
+        self.encoding = None
+        self.keys = dict()
+
+    @staticmethod
+    def has_key(obj):
+        return obj is not None and type(obj).render_key is not WorldObj.render_key
+
+    def cell_keys(self, grid, cells=None):
+        """render_key of the object and background of the given cells (all by default) whose key is more than their encoding."""
+        objects, backgrounds = grid.grid, grid.background
+        cells = range(len(objects)) if cells is None else cells
+        return {k: (objects[k].render_key() if self.has_key(objects[k]) else None, backgrounds[k].render_key() if self.has_key(backgrounds[k]) else None)
+                for k in cells if self.has_key(objects[k]) or self.has_key(backgrounds[k])}
+
+    def render_cell(self, grid, i, j, agent_dir=None, carrying=None):
+        tile = Grid.render_tile(grid.get(i, j), grid.get_background(i, j), agent_dir=agent_dir, tile_size=self.tile_size, carrying=carrying)
+        return tile.transpose(1, 0, 2)
+
+    def update(self, grid):
+        ts = self.tile_size
+        if self.background is None or self.background.shape[:2] != (grid.width * ts, grid.height * ts):
+            self.background = np.zeros((grid.width * ts, grid.height * ts, 3), dtype=np.uint8)
+            changed = set(range(len(grid.grid)))
+            keys = self.cell_keys(grid)
+        else:
+            changed = set()
+            if grid.grid != self.cells or grid.background != self.background_cells:
+                changed.update(k for k in range(len(grid.grid)) if grid.grid[k] is not self.cells[k] or grid.background[k] is not self.background_cells[k])
+            # the encoding is in (width, height) layout, the cells are numbered row by row
+            changed.update(np.flatnonzero(np.any(grid.encoding != self.encoding, axis=2).T).tolist())
+            # with the same objects in place only the keys of the cells that had one can change
+            keys = self.cell_keys(grid) if changed else self.cell_keys(grid, self.keys)
+            changed.update(k for k in keys.keys() | self.keys.keys() if keys.get(k) != self.keys.get(k))
+            if not changed:
+                return
+        for k in changed:
+            j, i = divmod(k, grid.width)
+            self.background[i * ts:(i + 1) * ts, j * ts:(j + 1) * ts] = self.render_cell(grid, i, j)
+        self.cells = list(grid.grid)
+        self.background_cells = list(grid.background)
+        self.encoding = grid.encoding.copy()
+        self.keys = keys
+
+    def frame(self, grid, agent_pos, agent_dir, carrying=None):
+        self.update(grid)
+        # a new array per frame, callers keep observations around (e.g. to stack them into batches)
+        frame = self.background.copy()
+        i, j = agent_pos
+        ts = self.tile_size
+        frame[i * ts:(i + 1) * ts, j * ts:(j + 1) * ts] = self.render_cell(grid, i, j, agent_dir, carrying)
+        return frame
+
+
 class MiniGridEnv(gym.Env):
     """
     2D grid world game environment
@@ -1397,6 +1515,7 @@ class MiniGridEnv(gym.Env):
         self.highlight = highlight
         self.tile_size = tile_size
         self.agent_pov = agent_pov
+        self.frame_cache = None
 
         # safety violations
         self.safety_violations = []
@@ -1405,6 +1524,13 @@ class MiniGridEnv(gym.Env):
         self.safety_violations_this_episode = None
         self.episode_count = 0
 
+        # gen_obs skips the partial view if a wrapper replaces it anyway (partial_obs) or nobody reads it (skip_obs)
+        self.partial_obs = True
+        self.skip_obs = False
+        # the image gen_obs returns then, an empty view keeps the observation inside observation_space
+        self.blank_image = np.zeros(image_observation_space.shape, dtype=np.uint8)
+        self.blank_image.setflags(write=False)
+
     def reset(self, *, state=None, seed=None, options=None):
         super().reset(seed=seed)
         # Reinitialize episode-specific variables
@@ -1416,7 +1542,7 @@ class MiniGridEnv(gym.Env):
             self.agent_dir = -1
 
         # Generate a new random grid at the start of each episode
-        self._gen_grid(self.width, self.height)
+        self._gen_layout(self.width, self.height)
 
         # These fields should be defined by _gen_grid
         assert (
@@ -1456,7 +1582,8 @@ class MiniGridEnv(gym.Env):
         """
         sample_hash = hashlib.sha256()
 
-        to_encode = [self.grid.encode().tolist(), self.agent_pos, self.agent_dir]
+        sample_hash.update(self.grid.encoding.tobytes())
+        to_encode = [self.agent_pos, self.agent_dir]
         for item in to_encode:
             sample_hash.update(str(item).encode("utf8"))
 
@@ -1578,6 +1705,10 @@ class MiniGridEnv(gym.Env):
     def _gen_grid(self, width, height):
         pass
 
+    def _gen_layout(self, width, height):
+        # reset builds the grid through here, envs with a fixed layout restore a cached one instead
+        self._gen_grid(width, height)
+
     def _reward(self):
         """
         Compute the reward to be given upon success
@@ -2094,10 +2225,7 @@ class MiniGridEnv(gym.Env):
 
         agent_view_size = agent_view_size or self.agent_view_size
 
-        grid = self.grid.slice(topX, topY, agent_view_size, agent_view_size)
-
-        for i in range(self.agent_dir + 1):
-            grid = grid.rotate_left()
+        grid = self.grid.slice(topX, topY, agent_view_size, agent_view_size).rotate_left(self.agent_dir + 1)
 
         # Process occluders and visibility
         # Note that this incurs some performance cost
@@ -2124,10 +2252,13 @@ class MiniGridEnv(gym.Env):
         Generate the agent's view (partially observable, low-resolution encoding)
         """
 
-        grid, vis_mask = self.gen_obs_grid()
+        if self.partial_obs and not self.skip_obs:
+            grid, vis_mask = self.gen_obs_grid()
 
-        # Encode the partially observable view into a numpy array
-        image = grid.encode(vis_mask)
+            # Encode the partially observable view into a numpy array
+            image = grid.encode(vis_mask)
+        else:
+            image = self.blank_image
 
         # Observations are dictionaries containing:
         # - an image (partially observable view of the environment)
@@ -2158,6 +2289,9 @@ class MiniGridEnv(gym.Env):
         """
         Render a non-paratial observation for visualization
         """
+        if not highlight:
+            return self.grid.render(tile_size, self.agent_pos, self.agent_dir, highlight_mask=None, carrying=self.carrying)
+
         # Compute which cells are visible to the agent
         _, vis_mask = self.gen_obs_grid()
 
@@ -2197,12 +2331,21 @@ class MiniGridEnv(gym.Env):
             tile_size,
             self.agent_pos,
             self.agent_dir,
-            highlight_mask=highlight_mask if highlight else None,
+            highlight_mask=highlight_mask,
             carrying=self.carrying,
         )
 
         return img
 
+    def get_full_frame(self, tile_size):
+        """
+        Full frame without highlighting like get_frame(highlight=False), but in
+        (width, height, 3) pixel layout and patched from a pre-rendered background.
+        """
+        if self.frame_cache is None or self.frame_cache.tile_size != tile_size:
+            self.frame_cache = FrameCache(tile_size)
+        return self.frame_cache.frame(self.grid, self.agent_pos, self.agent_dir, self.carrying)
+
     def get_frame(
         self,
         highlight: bool = True,
@@ -8,6 +8,9 @@ import numpy as np
 
 from copy import deepcopy
 
+from gym_minigrid.tempest_results import read_ranking
+from gym_minigrid.explicit_model import build_explicit_model
+
 
 @dataclass(frozen=True)
 class State:
@@ -41,12 +44,23 @@ def transform(action_list):
 
 def convert(tuples):
     return dict(tuples)
+
+@dataclass(frozen=True)
+class Layout:
+    grid: list
+    encoding: np.ndarray
+    background: list
+    bfs_reward: list
+    mission: str
 class PolicyRepairEnv(MiniGridEnv):
     def __init__(self, width=9, height=9, agent_start_pos=(1, 1), agent_start_dir=0, **kwargs):
         self.agent_start_pos = agent_start_pos
         self.agent_start_dir = agent_start_dir
         self.state_ranking = dict()
         self.reset_state = None
+        self.layout = None
+        # renders the plots in the background if set, see save_map
+        self.plotter = None
 
         mission_space = MissionSpace(
             mission_func=lambda: "get to the green goal square"
@@ -63,46 +77,20 @@ class PolicyRepairEnv(MiniGridEnv):
 
 
 
-    def fillStateRanking(self, file_name, decided_states, match=""):
-        self.state_ranking.clear()
-        done_states = list()
-        if match:
-            skip_line = re.compile(f"(\[|&\s){match}")
+    def fillStateRanking(self, file_name, decided_states=(), match=""):
         try:
-            with open(file_name, "r") as f:
-                file_content = f.readlines()
-            for line in file_content:
-                if match and skip_line.match(line): continue
-                stateMapping = convert(re.findall(r"([a-zA-Z]*[a-zA-Z])=(\d+)?", line))
-                if "[AgentDone" in line:
-                    done_states.append(State(int(stateMapping["xAgent"]), int(stateMapping["yAgent"]), int(stateMapping["viewAgent"])))
-                #print("stateMapping", stateMapping)
-                choices = convert(re.findall(r"[a-zA-Z_]*(left|right|east|west|north|south|forward|done)[a-zA-Z_]*:(-?\d+\.?\d*)", line))
-                #print("choices", choices)
-                ranking_value = float(re.search(r"Value:([+-]?(\d*\.\d+)|\d+)", line)[0].replace("Value:",""))
-                #print("ranking_value", ranking_value)
-                state = State(int(stateMapping["xAgent"]), int(stateMapping["yAgent"]), int(stateMapping["viewAgent"]))
-                if state in decided_states: continue
-                value = StateValue(ranking_value, choices)
-                self.state_ranking[state] = value
-            for state in done_states:
-                del self.state_ranking[state]
-            if len(self.state_ranking) == 0: return
-            all_values = [x.ranking for x in self.state_ranking.values()]
-            max_value = max(all_values)
-            min_value = min(all_values)
-            new_state_ranking = {}
-            for state, value in self.state_ranking.items():
-                choices = value.choices
-                try:
-                    new_value = (value.ranking - min_value) / (max_value - min_value)
-                except ZeroDivisionError as e:
-                    new_value = 0.0
-                new_state_ranking[state] = StateValue(new_value, choices)
-            self.state_ranking = new_state_ranking
+            self.ranking_table = read_ranking(file_name, self.grid.width, self.num_state_ids(), {self.state_id(state) for state in decided_states}, match)
         except EnvironmentError:
             print("TODO file not available. Exiting.")
             sys.exit(1)
+        self.state_ranking = {self.state_from_id(state_id): StateValue(self.ranking_table.ranking[state_id], self.ranking_table.choices(state_id)) for state_id in self.ranking_table.state_ids}
+
+    def save_map(self, map_grid, filename):
+        """Renders a plot and saves it as filename, in the background if a plotter is set."""
+        if self.plotter is not None:
+            self.plotter.submit(map_grid, filename, self.tile_size, self.agent_pos, self.agent_dir)
+        else:
+            plt.imsave(filename, map_grid.render(self.tile_size, self.agent_pos, self.agent_dir, None, None))
 
     def printHeatMap(self, envName, bound, nr_bins=2):
         self.reset()
@@ -127,8 +115,7 @@ class PolicyRepairEnv(MiniGridEnv):
                             tile[dir] = 0.0
                     heat_map.set(x, y, HeatMapTile(tile, ranking_values, nr_bins))
 
-        img = heat_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_heatmap_C{:03}_bin_size_{}.png".format(envName,bound, nr_bins), img)
+        self.save_map(heat_map, "{}_heatmap_C{:03}_bin_size_{}.png".format(envName,bound, nr_bins))
 
     def plotTestedStates(self, envName, bound, stateSets):
         black = np.array([0,0,0])
@@ -173,8 +160,7 @@ class PolicyRepairEnv(MiniGridEnv):
 
         for key, value in tested_tiles_map_dict.items():
             tested_tiles_map.set(key[0], key[1], FixedMapTile(value))
-        img = tested_tiles_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_tested_tiles_C{:03}.png".format(envName,bound), img)
+        self.save_map(tested_tiles_map, "{}_tested_tiles_C{:03}.png".format(envName,bound))
 
     def plotTestedStatesMap(self, envName, bound, previousFixedTiles, fixedStates, statesValuesDict, previousImpliedTiles, threshold):
         black = np.array([0,0,0])
@@ -258,8 +244,7 @@ class PolicyRepairEnv(MiniGridEnv):
                     counter[2] += 1
                 elif np.array_equal(color, red * implied_result_colouring_factor) or np.array_equal(color, red):
                     counter[0] += 1
-        img = tested_tiles_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_tested_tiles_C{:03}.png".format(envName,bound), img)
+        self.save_map(tested_tiles_map, "{}_tested_tiles_C{:03}.png".format(envName,bound))
         print(f"This iteration tested {sum(counter)} states: \t{counter[0]} proven system errors, \t{counter[1]} with positive performance estimate and \t{counter[2]} states with proven positive performance. PrevFixedTiles: {len(previousFixedTiles)}, fixedStates: {len(fixedStates)}")
         return previousFixedTiles, previousImpliedTiles, counter
 
@@ -334,10 +319,9 @@ class PolicyRepairEnv(MiniGridEnv):
         for key, tile in tested_tiles_map_dict.items():
             tested_tiles_map.set(key[0], key[1], FixedMapTile(tile))
 
-        #img = tested_states_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
+        #img = tested_states_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None)
         #plt.imsave("{}_tested_states_map_C{:03}.png".format(envName,bound), img)
-        img = tested_tiles_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_tested_tiles_map_C{:03}.png".format(envName,bound), img)
+        self.save_map(tested_tiles_map, "{}_tested_tiles_map_C{:03}.png".format(envName,bound))
         return tested_states_map_dict, tested_tiles_map_dict
 
 
@@ -392,8 +376,7 @@ class PolicyRepairEnv(MiniGridEnv):
         for key, value in new_fixed_map_dict.items():
             fixed_map.set(key[0], key[1], FixedMapTile(value))
 
-        img = fixed_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_fixed_map_C{:03}.png".format(envName,bound), img)
+        self.save_map(fixed_map, "{}_fixed_map_C{:03}.png".format(envName,bound))
         return previousFixedStates
 
     def printHeatMapReduced(self, envName, bound, nr_bins=2):
@@ -421,12 +404,66 @@ class PolicyRepairEnv(MiniGridEnv):
                             pass
                     heat_map.set(x, y, HeatMapTileReduced(ranking_max, ranking_values, nr_bins))
 
-        img = heat_map.render(self.tile_size, self.agent_pos, self.agent_dir, None, None, False)
-        plt.imsave("{}_heatmap_reduced_C{:03}_bin_size_{}.png".format(envName,bound, nr_bins), img)
+        self.save_map(heat_map, "{}_heatmap_reduced_C{:03}_bin_size_{}.png".format(envName,bound, nr_bins))
 
     def reset(self, seed=None, state=None):
         return super().reset(state=state, seed=seed)
 
+    @property
+    def static_layout(self):
+        # in training the agent is placed randomly, and place_agent clears the cell it picks
+        return not getattr(self, "training", False)
+
+    def _gen_layout(self, width, height):
+        """
+        Builds the grid and the BFS reward once and restores copies of them on
+        later resets, which then only place the agent.
+        """
+        if not self.static_layout:
+            return super()._gen_layout(width, height)
+        if self.layout is None:
+            self._gen_grid(width, height)
+            self.layout = Layout(list(self.grid.grid), self.grid.encoding.copy(), list(self.grid.background), self.bfs_reward, self.mission)
+            return
+        self.grid.restore(list(self.layout.grid), self.layout.encoding)
+        self.grid.background = list(self.layout.background)
+        self.bfs_reward = self.layout.bfs_reward
+        self.mission = self.layout.mission
+        if self.agent_pos == (-1, -1) and self.agent_dir == -1:
+            self.agent_pos = self.agent_start_pos
+            self.agent_dir = self.agent_start_dir
+
+    def num_state_ids(self):
+        return self.grid.width * self.grid.height * 4
+
+    def state_id(self, state):
+        # dense index over all (x, y, dir), cells are numbered like bfs_reward
+        return (state.pos_x + self.grid.width * state.pos_y) * 4 + state.dir
+
+    def state_from_id(self, state_id):
+        cell, dir = divmod(int(state_id), 4)
+        return State(cell % self.grid.width, cell // self.grid.width, dir)
+
+    def all_states(self):
+        """All states the agent can be placed in, ordered by state id."""
+        states = []
+        for j in range(self.grid.height):
+            for i in range(self.grid.width):
+                cell = self.grid.get(i, j)
+                if cell is None or cell.can_overlap():
+                    states += [State(i, j, dir) for dir in range(4)]
+        return states
+
+    def export_explicit(self, filename, reward_structure, cell_labels=None):
+        """
+        Writes the MDP of the layout as explicit tempest input (filename.tra,
+        .lab, .choicelab and .rew) instead of a PRISM program, and returns the
+        ExplicitModel for rewriting it with restrictions.
+        """
+        model = build_explicit_model(self, cell_labels)
+        model.write(filename, reward_structure)
+        return model
+
     def top_n_states(self, n, states_values_dict, threshold):
         untested_states = {state: state_value for state, state_value in self.state_ranking.items() if states_values_dict[state][1] >= threshold and states_values_dict[state][0] < threshold}
         ordered_state_ranking = sorted(untested_states.items(), key=lambda x: (x[1].ranking, len(x[1].choices)))
@@ -1,7 +1,63 @@
-import math
+import math, os, threading
+from collections import OrderedDict
+from functools import lru_cache
 
 import numpy as np
 
+# memory cap of the rendered tile cache, in bytes
+TILE_CACHE_BYTES = int(os.environ.get("TILE_CACHE_BYTES", 64 * 2**20))
+
+
+class TileCache:
+    """
+    LRU cache of rendered tiles, bounded by the total size of the tiles in
+    bytes, that counts hits, misses and evictions. It is shared by all grids,
+    also those rendered in background threads.
+    """
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.tiles = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def get(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is None:
+                self.misses += 1
+                return None
+            self.tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key, tile):
+        # tiles are shared between all lookups
+        tile.setflags(write=False)
+        with self.lock:
+            if key in self.tiles:
+                self.bytes -= self.tiles.pop(key).nbytes
+            self.tiles[key] = tile
+            self.bytes += tile.nbytes
+            while self.bytes > self.max_bytes and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {"tiles": len(self.tiles), "bytes": self.bytes, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
 
 def downsample(img, factor):
     """
@@ -20,21 +76,41 @@ def downsample(img, factor):
     return img
 
 
+@lru_cache(maxsize=None)
+def pixel_centers(height, width):
+    return np.meshgrid((np.arange(width) + 0.5) / width, (np.arange(height) + 0.5) / height)
+
+
+@lru_cache(maxsize=None)
+def shape_mask(fn, height, width):
+    """
+    Boolean (height, width) mask of the pixels whose centers are in a shape,
+    the shape functions are evaluated on all pixel centers at once
+    """
+
+    xf, yf = pixel_centers(height, width)
+    mask = np.broadcast_to(fn(xf, yf), (height, width)).copy()
+    mask.setflags(write=False)
+
+    return mask
+
+
 def fill_coords(img, fn, color):
     """
-    Fill pixels of an image with coordinates matching a filter function
+    Fill pixels of an image with coordinates matching a filter function or boolean mask
     """
 
-    for y in range(img.shape[0]):
-        for x in range(img.shape[1]):
-            yf = (y + 0.5) / img.shape[0]
-            xf = (x + 0.5) / img.shape[1]
-            if fn(xf, yf):
-                img[y, x] = color
+    mask = fn if isinstance(fn, np.ndarray) else shape_mask(fn, img.shape[0], img.shape[1])
+    img[mask] = color
 
     return img
 
 
+# The shape functions take arrays of coordinates, they are cached so that
+# equal shapes are the same function and share their masks in shape_mask
+
+
+@lru_cache(maxsize=None)
 def rotate_fn(fin, cx, cy, theta):
     def fout(x, y):
         x = x - cx
@@ -48,6 +124,7 @@ def rotate_fn(fin, cx, cy, theta):
     return fout
 
 
+@lru_cache(maxsize=None)
 def point_in_line(x0, y0, x1, y1, r):
     p0 = np.array([x0, y0], dtype=np.float32)
     p1 = np.array([x1, y1], dtype=np.float32)
@@ -62,23 +139,23 @@ def point_in_line(x0, y0, x1, y1, r):
 
     def fn(x, y):
         # Fast, early escape test
-        if x < xmin or x > xmax or y < ymin or y > ymax:
-            return False
+        in_box = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
 
-        q = np.array([x, y])
-        pq = q - p0
+        pqx = x - p0[0]
+        pqy = y - p0[1]
 
         # Closest point on line
-        a = np.dot(pq, dir)
-        a = np.clip(a, 0, dist)
-        p = p0 + a * dir
+        a = np.clip(pqx * dir[0] + pqy * dir[1], 0, dist)
+        px = p0[0] + a * dir[0]
+        py = p0[1] + a * dir[1]
 
-        dist_to_line = np.linalg.norm(q - p)
-        return dist_to_line <= r
+        dist_to_line = np.sqrt((x - px) * (x - px) + (y - py) * (y - py))
+        return in_box & (dist_to_line <= r)
 
     return fn
 
 
+@lru_cache(maxsize=None)
 def point_in_circle(cx, cy, r):
     def fn(x, y):
         return (x - cx) * (x - cx) + (y - cy) * (y - cy) <= r * r
@@ -86,37 +163,42 @@ def point_in_circle(cx, cy, r):
     return fn
 
 
+@lru_cache(maxsize=None)
 def point_in_rect(xmin, xmax, ymin, ymax):
     def fn(x, y):
-        return x >= xmin and x <= xmax and y >= ymin and y <= ymax
+        return (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
 
     return fn
 
 
+@lru_cache(maxsize=None)
 def point_in_triangle(a, b, c):
     a = np.array(a, dtype=np.float32)
     b = np.array(b, dtype=np.float32)
     c = np.array(c, dtype=np.float32)
 
+    v0 = c - a
+    v1 = b - a
+
+    # Compute dot products
+    dot00 = np.dot(v0, v0)
+    dot01 = np.dot(v0, v1)
+    dot11 = np.dot(v1, v1)
+    inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
+
     def fn(x, y):
-        v0 = c - a
-        v1 = b - a
-        v2 = np.array((x, y)) - a
+        v2x = x - a[0]
+        v2y = y - a[1]
 
-        # Compute dot products
-        dot00 = np.dot(v0, v0)
-        dot01 = np.dot(v0, v1)
-        dot02 = np.dot(v0, v2)
-        dot11 = np.dot(v1, v1)
-        dot12 = np.dot(v1, v2)
+        dot02 = v0[0] * v2x + v0[1] * v2y
+        dot12 = v1[0] * v2x + v1[1] * v2y
 
         # Compute barycentric coordinates
-        inv_denom = 1 / (dot00 * dot11 - dot01 * dot01)
         u = (dot11 * dot02 - dot01 * dot12) * inv_denom
         v = (dot00 * dot12 - dot01 * dot02) * inv_denom
 
         # Check if point is in triangle
-        return (u >= 0) and (v >= 0) and (u + v) < 1
+        return (u >= 0) & (v >= 0) & ((u + v) < 1)
 
     return fn
 
@@ -0,0 +1,166 @@
+import os, re
+import numpy as np
+from dataclasses import dataclass
+
+# one state per line, e.g. "[xAgent=1\t& yAgent=2\t& viewAgent=0\t& !AgentDone]  Value:0.12500	 Choices:Agent_turn_right:0.5,..."
+LINE = re.compile(r"^\[([^\]]*)\]\s*(?:Result|Value):(\S+)(?:\s*Choices:(.*))?$", re.MULTILINE)
+CHOICE = re.compile(r"[a-zA-Z_]*(left|right|east|west|north|south|forward|done)[a-zA-Z_]*:(-?\d+\.?\d*(?:e[+-]?\d+)?)")
+LABEL = re.compile(r"[a-zA-Z_]*(left|right|east|west|north|south|forward|done)[a-zA-Z_]*")
+
+# columns of RankingTable.choice_values
+CHOICE_ACTIONS = ["left", "right", "east", "west", "north", "south", "forward", "done"]
+CHOICE_COLUMNS = {action: column for column, action in enumerate(CHOICE_ACTIONS)}
+
+# with --binaryresults tempest writes name.npy (and these companions for the action ranking) instead of the text file name
+RANKING_PARTS = ["", "_choices", "_row_groups", "_labels"]
+VALUATIONS_FILE = "state_valuations.npy"
+
+
+def is_binary(name):
+    return os.path.exists(f"{name}.npy")
+
+def rename_results(name, new_name):
+    """Renames a tempest result file, or the .npy files tempest wrote for it with --binaryresults."""
+    for part in RANKING_PARTS:
+        if os.path.exists(f"{name}{part}.npy"):
+            os.replace(f"{name}{part}.npy", f"{new_name}{part}.npy")
+    if os.path.exists(name):
+        os.replace(name, new_name)
+
+def load(name, part=""):
+    return np.load(f"{name}{part}.npy", mmap_mode="r")
+
+def load_positions(name):
+    """(n, 4) array of x, y, dir and done of every state, from the valuations tempest wrote next to name with --binaryresults."""
+    valuations = np.load(os.path.join(os.path.dirname(name), VALUATIONS_FILE), mmap_mode="r")
+    done = valuations["AgentDone"] if "AgentDone" in valuations.dtype.names else np.zeros(len(valuations), dtype=bool)
+    return np.stack([valuations["xAgent"], valuations["yAgent"], valuations["viewAgent"], done], axis=1).astype(np.int64)
+
+def load_labels(name):
+    """Choice labels per state of a binary action ranking, together with the row group indices."""
+    row_groups = np.asarray(load(name, "_row_groups"), dtype=np.int64)
+    labels = np.asarray(load(name, "_labels")).astype(str).tolist()
+    return [labels[start:end] for start, end in zip(row_groups[:-1], row_groups[1:])], row_groups
+
+def label_columns(labels):
+    """Column of choice_values for every choice label, -1 if it is none of CHOICE_ACTIONS."""
+    unique_labels, inverse = np.unique(labels, return_inverse=True)
+    # like CHOICE on the text lines, only the last label of a choice counts
+    columns = np.array([CHOICE_COLUMNS[match[1]] if (match := LABEL.fullmatch(label.split(", ")[-1])) else -1 for label in unique_labels], dtype=np.int64)
+    return columns[inverse.reshape(-1)]
+
+def read_lines(file_name):
+    """(valuation, value, choices) of every state line of a tempest result file."""
+    with open(file_name, "r") as f:
+        return LINE.findall(f.read())
+
+def parse_valuation(valuation):
+    x = y = dir = None
+    done = False
+    # tempest joins the variables with "\t& ", booleans are written as name or !name
+    for token in valuation.split("&"):
+        name, _, value = token.strip().partition("=")
+        if name == "xAgent": x = int(value)
+        elif name == "yAgent": y = int(value)
+        elif name == "viewAgent": dir = int(value)
+        elif name == "AgentDone": done = True
+    return x, y, dir, done
+
+def positions(lines):
+    """(n, 4) array of x, y, dir and done for the given lines."""
+    return np.array([parse_valuation(valuation) for valuation, _, _ in lines], dtype=np.int64).reshape(-1, 4)
+
+def state_ids(positions, width):
+    return (positions[:, 0] + width * positions[:, 1]) * 4 + positions[:, 2]
+
+def drop_done(ids, done):
+    # the done copy of a state shares its position, both are dropped as in the dict based parsing
+    return ~np.isin(ids, ids[done])
+
+
+@dataclass
+class MinMaxTable:
+    """
+    Minimal and maximal values of results_minimize/results_maximize. min, max
+    and gap are indexed by the dense state id of the env, NaN where the file
+    has no (undone) state. state_ids lists the states present in file order.
+    """
+    state_ids: np.ndarray
+    min: np.ndarray
+    max: np.ndarray
+    gap: np.ndarray
+
+    def as_dict(self, state_from_id):
+        return {state_from_id(state_id): (self.min[state_id], self.max[state_id], self.gap[state_id]) for state_id in self.state_ids}
+
+
+@dataclass
+class RankingTable:
+    """
+    Normalized ranking and per action choice values of action_ranking, indexed
+    by the dense state id of the env, NaN where a state or choice is missing.
+    state_ids lists the states present in file order.
+    """
+    state_ids: np.ndarray
+    ranking: np.ndarray
+    choice_values: np.ndarray
+
+    def choices(self, state_id):
+        values = self.choice_values[state_id]
+        return {action: values[column] for column, action in enumerate(CHOICE_ACTIONS) if not np.isnan(values[column])}
+
+
+def read_min_max(max_file, min_file, width, num_state_ids):
+    if is_binary(max_file):
+        file_positions = load_positions(max_file)
+        max_file_values, min_file_values = load(max_file), load(min_file)
+        if not len(max_file_values) == len(min_file_values) == len(file_positions):
+            raise ValueError("min/max files do not match.")
+    else:
+        max_lines = read_lines(max_file)
+        min_lines = read_lines(min_file)
+        file_positions = positions(max_lines)
+        if len(max_lines) != len(min_lines) or not np.array_equal(file_positions, positions(min_lines)):
+            raise ValueError("min/max files do not match.")
+        max_file_values = np.array([value for _, value, _ in max_lines], dtype=float)
+        min_file_values = np.array([value for _, value, _ in min_lines], dtype=float)
+    ids = state_ids(file_positions, width)
+    keep = drop_done(ids, file_positions[:, 3] == 1)
+    ids = ids[keep]
+    min_values = np.full(num_state_ids, np.nan)
+    max_values = np.full(num_state_ids, np.nan)
+    min_values[ids] = min_file_values[keep]
+    max_values[ids] = max_file_values[keep]
+    return MinMaxTable(ids, min_values, max_values, max_values - min_values)
+
+def read_ranking(file_name, width, num_state_ids, excluded_ids=(), match=""):
+    choice_values = np.full((num_state_ids, len(CHOICE_ACTIONS)), np.nan)
+    if is_binary(file_name):
+        if match: raise ValueError("match is only supported for text action rankings")
+        file_positions = load_positions(file_name)
+        ids = state_ids(file_positions, width)
+        keep = drop_done(ids, file_positions[:, 3] == 1) & ~np.isin(ids, np.fromiter(excluded_ids, dtype=np.int64))
+        values = np.asarray(load(file_name), dtype=float)
+        row_groups = np.asarray(load(file_name, "_row_groups"), dtype=np.int64)
+        states_of_rows = np.repeat(np.arange(len(row_groups) - 1), np.diff(row_groups))
+        columns = label_columns(np.asarray(load(file_name, "_labels")).astype(str))
+        rows = np.flatnonzero((columns >= 0) & keep[states_of_rows])
+        choice_values[ids[states_of_rows[rows]], columns[rows]] = load(file_name, "_choices")[rows]
+    else:
+        lines = read_lines(file_name)
+        if match:
+            skip_line = re.compile(f"(\[|&\s){match}")
+            lines = [line for line in lines if not skip_line.match(f"[{line[0]}")]
+        file_positions = positions(lines)
+        ids = state_ids(file_positions, width)
+        keep = drop_done(ids, file_positions[:, 3] == 1) & ~np.isin(ids, np.fromiter(excluded_ids, dtype=np.int64))
+        values = np.array([value for _, value, _ in lines], dtype=float)
+        for line_index in np.flatnonzero(keep):
+            for action, value in CHOICE.findall(lines[line_index][2]):
+                choice_values[ids[line_index], CHOICE_COLUMNS[action]] = float(value)
+    ids, values = ids[keep], values[keep]
+    ranking = np.full(num_state_ids, np.nan)
+    if len(ids) > 0:
+        span = values.max() - values.min()
+        ranking[ids] = (values - values.min()) / span if span != 0 else 0.0
+    return RankingTable(ids, ranking, choice_values)
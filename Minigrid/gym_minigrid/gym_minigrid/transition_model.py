@@ -0,0 +1,122 @@
+import numpy as np
+from dataclasses import dataclass
+
+from gym_minigrid.minigrid import DIR_TO_VEC, MiniGridEnv, Floor, Wall, isOneWay, isSlippery
+
+# what a transition ends in, the agent's cell alone does not tell since e.g. turning in front of the goal terminates as well
+NONE, GOAL, LAVA = 0, 1, 2
+
+# a slippery tile spreads a move over its 3x3 neighbourhood
+MAX_OUTCOMES = 9
+
+
+@dataclass
+class TransitionModel:
+    """
+    MiniGridEnv.step of one layout as arrays indexed by [state id, action, outcome]:
+    the next state id, whether the transition reaches the goal or lava, and the
+    cumulative probability of the outcomes. Padding outcomes have cumulative
+    probability 1 and are never drawn. start_states are the state ids place_agent
+    draws from uniformly (a state can occur twice).
+    """
+    width: int
+    next_states: np.ndarray
+    outcomes: np.ndarray
+    cdf: np.ndarray
+    start_states: np.ndarray
+
+    def sample(self, state_ids, actions, rng):
+        """Next state ids and outcomes of one step of every (state, action) pair."""
+        cdf = self.cdf[state_ids, actions]
+        drawn = (cdf <= rng.random(len(state_ids))[:, None]).sum(axis=1)
+        return self.next_states[state_ids, actions, drawn], self.outcomes[state_ids, actions, drawn]
+
+    def sample_start(self, n, rng):
+        return self.start_states[rng.integers(len(self.start_states), size=n)]
+
+
+def cannot_turn(grid, x, y):
+    return ((isinstance(grid.get(x, y - 1), Wall) and isinstance(grid.get(x, y + 1), Wall))
+        or  (isinstance(grid.get(x - 1, y), Wall) and isinstance(grid.get(x + 1, y), Wall)))
+
+def step_distribution(env, x, y, dir, action):
+    """(probability, dir, target position, target cell, moves) of every outcome, in the order MiniGridEnv.step samples them."""
+    grid, actions = env.grid, env.actions
+    current_cell = grid.get(x, y)
+    fwd_pos = (x + DIR_TO_VEC[dir][0], y + DIR_TO_VEC[dir][1])
+    fwd_cell = grid.get(*fwd_pos)
+    if action == actions.forward and isSlippery(current_cell):
+        positions, probabilities = env.get_neighbours_prob_forward((x, y), current_cell.probabilities_forward, current_cell.offset)
+        return [(p, dir, pos, grid.get(*pos), True) for pos, p in zip(positions, probabilities)]
+    if action == actions.forward:
+        # one-way tiles skip the overlap check here, step does it again before moving
+        return [(1.0, dir, fwd_pos, fwd_cell, isOneWay(current_cell) or fwd_cell is None or fwd_cell.can_overlap())]
+    if action in (actions.left, actions.right) and not cannot_turn(grid, x, y):
+        dir = (dir - 1) % 4 if action == actions.left else (dir + 1) % 4
+        if isSlippery(current_cell):
+            positions, probabilities = env.get_neighbours_prob_turn((x, y), current_cell.probabilities_turn)
+            return [(p, dir, pos, grid.get(*pos), True) for pos, p in zip(positions, probabilities)]
+    # a blocked turn, pickup, drop, toggle and done keep the position, but the cell in front still ends the episode
+    # (picking up, dropping and toggling objects is not modelled, the layouts here have no doors or boxes)
+    return [(1.0, dir, fwd_pos, fwd_cell, False)]
+
+def compile_transitions(env):
+    """Compiles the current layout of the (unwrapped) env into a TransitionModel."""
+    grid, width = env.grid, env.grid.width
+    num_state_ids, num_actions = width * grid.height * 4, len(env.actions)
+    state_ids = np.arange(num_state_ids)
+    next_states = np.repeat(state_ids[:, None, None], num_actions * MAX_OUTCOMES, axis=1).reshape(num_state_ids, num_actions, MAX_OUTCOMES)
+    outcomes = np.full((num_state_ids, num_actions, MAX_OUTCOMES), NONE, dtype=np.int8)
+    cdf = np.ones((num_state_ids, num_actions, MAX_OUTCOMES))
+    start_states = list()
+    for y in range(grid.height):
+        for x in range(width):
+            cell = grid.get(x, y)
+            if not (cell is None or cell.can_overlap()): continue
+            if not isOneWay(cell) and (cell is None or isinstance(cell, Floor)):
+                # place_agent: random direction, turned once if the agent could not turn away from a wall
+                for dir in range(4):
+                    blocked = cannot_turn(grid, x, y) and isinstance(grid.get(x + DIR_TO_VEC[dir][0], y + DIR_TO_VEC[dir][1]), Wall)
+                    start_states.append((x + width * y) * 4 + ((dir + 1) % 4 if blocked else dir))
+            for dir in range(4):
+                state_id = (x + width * y) * 4 + dir
+                for action in range(num_actions):
+                    probabilities = list()
+                    for k, (p, new_dir, (fx, fy), fwd_cell, moves) in enumerate(step_distribution(env, x, y, dir, action)):
+                        new_x, new_y, outcome = fx, fy, NONE
+                        if fwd_cell is not None and isOneWay(fwd_cell) and abs(fwd_cell.direction - new_dir) == 2:
+                            new_x, new_y = x, y
+                        elif fwd_cell is not None and fwd_cell.type == "goal":
+                            outcome = GOAL
+                        elif fwd_cell is not None and fwd_cell.type == "lava":
+                            outcome = LAVA
+                        if not (moves and (fwd_cell is None or fwd_cell.can_overlap())):
+                            new_x, new_y = x, y
+                        next_states[state_id, action, k] = (new_x + width * new_y) * 4 + new_dir
+                        outcomes[state_id, action, k] = outcome
+                        probabilities.append(p)
+                    cumulative = np.cumsum(probabilities)
+                    cdf[state_id, action, :len(probabilities)] = cumulative / cumulative[-1]
+    return TransitionModel(width, next_states, outcomes, cdf, np.array(start_states, dtype=np.int64))
+
+def rollout(model, actions, start_states, n, rng=None):
+    """
+    One episode of at most n steps from every start state, taking actions[state id]
+    in every step. Returns failed and the number of steps per episode with the
+    verdicts of simulate_from_state: lava fails, the goal passes and an episode
+    that ends neither way within n steps fails.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    states = np.array(start_states, dtype=np.int64)
+    failed = np.ones(len(states), dtype=bool)
+    steps = np.full(len(states), n, dtype=np.int64)
+    running = np.arange(len(states))
+    for step in range(n):
+        if len(running) == 0: break
+        next_states, outcomes = model.sample(states[running], actions[states[running]], rng)
+        states[running] = next_states
+        done = outcomes != NONE
+        failed[running[done]] = outcomes[done] == LAVA
+        steps[running[done]] = step + 1
+        running = running[~done]
+    return failed, steps
@@ -1,5 +1,6 @@
 import math
 import operator
+from contextlib import contextmanager
 from functools import reduce
 
 import gym
@@ -176,9 +177,14 @@ class RGBImgObsWrapper(ObservationWrapper):
         self.observation_space = spaces.Dict(
             {**self.observation_space.spaces, "image": new_image_space}
         )
+        # the partial view would be thrown away
+        self.unwrapped.partial_obs = False
 
     def observation(self, obs):
-        rgb_img = self.get_frame(highlight=False, tile_size=self.tile_size)
+        if self.unwrapped.skip_obs:
+            return {**obs, "image": None}
+        # a (height, width, 3) view of the frame, MiniWrapper transposes it back without copying
+        rgb_img = self.unwrapped.get_full_frame(self.tile_size).transpose(1, 0, 2)
 
         return {**obs, "image": rgb_img}
 
@@ -528,14 +534,38 @@ class MiniWrapper(gym.Wrapper):
 
     def reset(self, **kwargs):
         obs, _ = self.env.reset(**kwargs)
-        return obs.transpose(1,0,2)
+        return self.observation(obs)
 
-    def observations(self, obs):
-        print("miniwrapper:" ,type(obs))
-        return obs
+    def observation(self, obs):
+        return obs.transpose(1,0,2) if obs is not None else None
 
     def step(self,action):
         obs, reward, terminated, truncated, info = self.env.step(action)
         if truncated:
             info["TimeLimit.truncated"] = True
-        return obs.transpose(1,0,2), reward, terminated or truncated, info
+        return self.observation(obs), reward, terminated or truncated, info
+
+    @contextmanager
+    def no_observations(self):
+        """reset and step return None instead of an observation, e.g. while the actions come from an action table."""
+        self.unwrapped.skip_obs = True
+        try:
+            yield self
+        finally:
+            self.unwrapped.skip_obs = False
+
+    def observe(self):
+        """The observation of the current state as step would have returned it, rendered on demand."""
+        wrappers, env = list(), self
+        while isinstance(env, Wrapper):
+            wrappers.append(env)
+            env = env.env
+        skip_obs, env.skip_obs = env.skip_obs, False
+        try:
+            obs = env.gen_obs()
+            for wrapper in reversed(wrappers):
+                if isinstance(wrapper, (ObservationWrapper, MiniWrapper)):
+                    obs = wrapper.observation(obs)
+        finally:
+            env.skip_obs = skip_obs
+        return obs
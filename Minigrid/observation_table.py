@@ -0,0 +1,76 @@
+import hashlib, os
+import gym
+import numpy as np
+from gym_minigrid.minigrid import RENDER_VERSION
+
+OBSERVATION_CACHE=os.environ.get("OBSERVATION_CACHE", "~/.cache/minigrid_observations")
+
+
+def layout_hash(env):
+    grid = env.unwrapped.grid
+    return hashlib.sha256(f"{grid.width}x{grid.height}".encode() + grid.encode().tobytes()).hexdigest()[:16]
+
+
+def observation_tile_size(env):
+    """Tile size of the outermost wrapper of env that renders the observations, None if none does."""
+    # not getattr(env, "tile_size"), without an image wrapper that is the tile size of the env's window
+    while isinstance(env, gym.Wrapper):
+        if "tile_size" in vars(env): return env.tile_size
+        env = env.env
+    return None
+
+
+def observation_key(env):
+    """Env id, layout hash, tile size and RENDER_VERSION, everything the observations of env depend on."""
+    base = env.unwrapped
+    return f"{base.spec.id if base.spec else type(base).__name__}_{layout_hash(env)}_{observation_tile_size(env)}_v{RENDER_VERSION}"
+
+
+class ObservationTable:
+    """
+    Observations of every state of a static-layout PolicyRepairEnv, rendered
+    once through the full wrapper stack and stored as a memory-mapped .npy.
+
+    The file is keyed by observation_key, so runs on the same machine share
+    one table. Rows follow env.all_states().
+    """
+    def __init__(self, env, cache_dir=OBSERVATION_CACHE):
+        base = env.unwrapped
+        env.reset()
+        self.states = base.all_states()
+        self.rows = np.full(base.num_state_ids(), -1, dtype=np.int64)
+        for row, state in enumerate(self.states):
+            self.rows[base.state_id(state)] = row
+        self.base = base
+
+        cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.filename = os.path.join(cache_dir, f"{observation_key(env)}.npy")
+        if not os.path.exists(self.filename):
+            self._build(env)
+        self.table = np.load(self.filename, mmap_mode="r")
+
+    def _build(self, env):
+        first = env.reset(state=self.states[0])
+        # write under a temporary name and rename, so concurrent runs never see a half-written table
+        tmp_filename = f"{self.filename}.{os.getpid()}.tmp"
+        table = np.lib.format.open_memmap(tmp_filename, mode="w+", dtype=first.dtype, shape=(len(self.states),) + first.shape)
+        table[0] = first
+        for row, state in enumerate(self.states[1:], start=1):
+            table[row] = env.reset(state=state)
+        table.flush()
+        del table
+        os.replace(tmp_filename, self.filename)
+        env.reset()
+
+    def row(self, state):
+        row = self.rows[self.base.state_id(state)]
+        if row < 0: raise KeyError(f"{state} is not a valid agent state")
+        return row
+
+    def __getitem__(self, state):
+        return self.table[self.row(state)]
+
+    def observations(self, states):
+        """Observations of all states stacked into one array."""
+        return self.table[[self.row(state) for state in states]]
@@ -0,0 +1,66 @@
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def montage(images, axis):
+    """Concatenates images along axis (0 stacks them vertically), padding them with white to the largest size like ImageMagick's montage."""
+    other = 1 - axis
+    size = max(image.shape[other] for image in images)
+    padded = list()
+    for image in images:
+        padding = [(0, 0), (0, 0), (0, 0)]
+        padding[other] = (0, size - image.shape[other])
+        padded.append(np.pad(image, padding, constant_values=255))
+    return np.concatenate(padded, axis=axis)
+
+
+class Plotter:
+    """
+    Renders the plots of the IMT loop in a pool of background threads. Every
+    plot is submitted as a copy of its map grid, so the loop can go on changing
+    its own state. The rendered images stay in memory for the montage of all
+    iterations.
+    """
+    def __init__(self, workers=1):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = dict()
+
+    def submit(self, map_grid, filename, tile_size, agent_pos, agent_dir):
+        self.futures[filename] = self.executor.submit(self.render, map_grid.copy(), filename, tile_size, agent_pos, agent_dir)
+
+    @staticmethod
+    def render(map_grid, filename, tile_size, agent_pos, agent_dir):
+        img = map_grid.render(tile_size, agent_pos, agent_dir, None, None)
+        plt.imsave(filename, img)
+        return img
+
+    def wait(self):
+        """Waits until all submitted plots are written, raising the first error of a plot."""
+        for future in self.futures.values():
+            future.result()
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+    def images(self, pattern):
+        return [self.futures[filename].result() for filename in sorted(fnmatch.filter(self.futures, pattern))]
+
+    def concat_images(self, envname, iterations):
+        """
+        One column per iteration with its heat map, fixed map and the tested
+        states after it, and all columns next to each other in full.png.
+        """
+        columns = list()
+        for i in range(0, iterations):
+            images = self.images(f"{envname}*{i:03}*heatmap_C*png") + self.images(f"{envname}*{i:03}*fixed_map*png") + self.images(f"{envname}*{i+1:03}*tested_*png")
+            if not images: continue
+            column = montage(images, axis=0)
+            plt.imsave(f"{i:03}.png", column)
+            # like the original montage call, the column of the last iteration is not part of full.png
+            if i < iterations - 1: columns.append(column)
+        if columns:
+            plt.imsave("full.png", montage(columns, axis=1))
@@ -0,0 +1,62 @@
+import numpy as np
+
+from gym_minigrid.policyRepairEnv import State
+from gym_minigrid.transition_model import rollout
+
+
+def place_and_reset(env):
+    pos = env.place_agent()
+    return env.reset(state=State(*pos, env.agent_dir))
+
+def episode_verdict(terminated, info, steps, n):
+    """Same verdicts as simulate_from_state: True/False once the episode is decided, None while it goes on."""
+    # lava is a safety violation, and a performance violation since the goal cannot be reached anymore
+    if terminated and info["ran_into_lava"]:
+        return True
+    if terminated and info["reached_goal"]:
+        return False
+    if steps == n:
+        return not info["reached_goal"] or info["ran_into_lava"]
+    return None
+
+def random_testing(envs, policy, n, max_queries, action_table=None):
+    """
+    Random testing on len(envs) copies of the env in lockstep: every step the
+    policy is queried once for all running episodes. Yields (failed, num_queries)
+    of each episode in the order the episodes finish, new episodes are started
+    as long as the finished ones used less than max_queries queries.
+    """
+    observations = [place_and_reset(env) for env in envs]
+    steps = np.zeros(len(envs), dtype=np.int64)
+    running = np.ones(len(envs), dtype=bool)
+    finished_queries = 0
+    while running.any():
+        indices = np.flatnonzero(running)
+        if action_table is not None:
+            actions = [action_table.current(envs[k]) for k in indices]
+        else:
+            actions, _ = policy.predict(np.stack([observations[k] for k in indices]), deterministic=True)
+        for k, action in zip(indices, actions):
+            env = envs[k]
+            observations[k], _, terminated, info = env.step(env.actions(action))
+            steps[k] += 1
+            failed = episode_verdict(terminated, info, steps[k], n)
+            if failed is None: continue
+            finished_queries += steps[k]
+            yield failed, int(steps[k])
+            if finished_queries < max_queries:
+                observations[k] = place_and_reset(env)
+                steps[k] = 0
+            else:
+                running[k] = False
+
+def tabular_random_testing(model, actions, n, rng=None, batch_size=256):
+    """
+    Random testing on the compiled TransitionModel of the env, choosing
+    actions[state id]. Yields (failed, num_queries) of one episode after the
+    other, the episodes are rolled out batch_size at a time.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    while True:
+        failed, steps = rollout(model, actions, model.sample_start(batch_size, rng), n, rng)
+        yield from zip(failed.tolist(), steps.tolist())
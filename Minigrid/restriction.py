@@ -0,0 +1,285 @@
+import re
+from collections import defaultdict
+import numpy as np
+
+from gym_minigrid.minigrid import Goal, isSlippery
+from gym_minigrid.policyRepairEnv import State, convert
+from gym_minigrid.explicit_model import choice_label
+from gym_minigrid.tempest_results import is_binary, load_labels, load_positions
+
+# viewAgent -> direction used in the choice labels of Minigrid2PRISM
+DIRECTIONS = ["east", "south", "west", "north"]
+
+# number of guards per parenthesized group of the decidedStates label
+LABEL_CHUNK = 50
+
+
+def runs(values):
+    """Maximal runs of consecutive integers in values, as (first, last) pairs."""
+    result = list()
+    for value in sorted(values):
+        if result and value == result[-1][1] + 1:
+            result[-1][1] = value
+        else:
+            result.append([value, value])
+    return [tuple(run) for run in result]
+
+def range_guard(variable, first, last):
+    return f"{variable}={first}" if first == last else f"{variable}>={first}&{variable}<={last}"
+
+def rectangles(cells):
+    """
+    Covers a set of (x, y) cells with disjoint rectangles (x0, x1, y0, y1):
+    the runs of cells in a row, each extended over the rows below that have
+    the same run.
+    """
+    rows = defaultdict(set)
+    for x, y in cells: rows[y].add(x)
+    result, open_runs, previous_y = list(), dict(), None
+    for y in sorted(rows):
+        extended = dict()
+        for run in runs(rows[y]):
+            extended[run] = open_runs.pop(run) if run in open_runs and previous_y == y - 1 else y
+        result += [(x0, x1, y0, previous_y) for (x0, x1), y0 in open_runs.items()]
+        open_runs, previous_y = extended, y
+    result += [(x0, x1, y0, previous_y) for (x0, x1), y0 in open_runs.items()]
+    return sorted(result, key=lambda rectangle: (rectangle[2], rectangle[0]))
+
+def state_guards(states):
+    """
+    Guards whose disjunction holds in exactly the given states. The cells are
+    grouped by the directions the set has in them, and every group is covered
+    by rectangles, so a guard like (xAgent>=1&xAgent<=7&yAgent=3) stands for
+    all the states of a row segment instead of one guard per state.
+    """
+    directions = defaultdict(set)
+    for state in states: directions[(state.pos_x, state.pos_y)].add(state.dir)
+    groups = defaultdict(set)
+    for cell, dirs in directions.items(): groups[tuple(sorted(dirs))].add(cell)
+    guards = list()
+    for dirs in sorted(groups):
+        dir_runs = runs(dirs)
+        if len(dirs) == len(DIRECTIONS):
+            view = list()
+        elif len(dir_runs) == 1:
+            view = [range_guard("viewAgent", *dir_runs[0])]
+        else:
+            view = ["(" + "|".join(range_guard("viewAgent", *run) for run in dir_runs) + ")"]
+        for x0, x1, y0, y1 in rectangles(groups[dirs]):
+            guards.append("(" + "&".join([range_guard("xAgent", x0, x1), range_guard("yAgent", y0, y1)] + view) + ")")
+    return guards
+
+
+class ChoiceLayout:
+    """
+    State indices and choice labels of the unrestricted model, read from the
+    action_ranking tempest writes for it (text or --binaryresults). State i is
+    line i, the choices of a state are listed in the order of their (local)
+    choice index.
+    """
+    def __init__(self, action_ranking_file):
+        self.state_ids = dict()
+        self.choice_labels = list()
+        if is_binary(action_ranking_file):
+            self.choice_labels, self.row_group_indices = load_labels(action_ranking_file)
+            for state_id, (x, y, dir, done) in enumerate(load_positions(action_ranking_file)):
+                if not done: self.state_ids[State(int(x), int(y), int(dir))] = state_id
+            return
+        with open(action_ranking_file, "r") as f:
+            for state_id, line in enumerate(f):
+                valuation, _, choices = line.partition("Choices:")
+                self.choice_labels.append([label.lstrip(",").strip() for label, value in re.findall(r"([\w, ]*):(-?\d+\.?\d*)", choices)])
+                if "[AgentDone" in valuation: continue
+                stateMapping = convert(re.findall(r"([a-zA-Z]*[a-zA-Z])=(\d+)?", valuation))
+                self.state_ids[State(int(stateMapping["xAgent"]), int(stateMapping["yAgent"]), int(stateMapping["viewAgent"]))] = state_id
+        self.row_group_indices = np.cumsum([0] + [len(labels) for labels in self.choice_labels])
+
+    def choice(self, state_id, action_name, dir):
+        """Local index of the choice the env action corresponds to, None if the model has no such choice."""
+        labels = self.choice_labels[state_id]
+        slippery_turns = [i for i, label in enumerate(labels) if "turn_at_slip" in label]
+        if action_name == "left":
+            candidates = [i for i, label in enumerate(labels) if "turn_left" in label] or slippery_turns[1:2]
+        elif action_name == "right":
+            candidates = [i for i, label in enumerate(labels) if "turn_right" in label] or slippery_turns[0:1]
+        elif action_name == "forward":
+            candidates = [i for i, label in enumerate(labels) if label.endswith(f"move_{DIRECTIONS[dir]}") or "move_on_slip" in label]
+        else:
+            candidates = [i for i, label in enumerate(labels) if label.endswith("_stuck")]
+        return candidates[0] if candidates else None
+
+
+class DeltaRestriction:
+    """
+    Keeps track of the (state, choice) pairs and decided states already sent to
+    a TempestWorker, so that every iteration only sends what is new. The states
+    in restricted are skipped, the model file the worker was started on
+    restricts them already.
+    """
+    def __init__(self, layout, restricted=()):
+        self.layout = layout
+        self.fixed = dict()
+        self.decided = set()
+        self.restricted = set(restricted)
+        self.unmatched = set()
+
+    def delta(self, env, state_actions_to_trim, decided_states):
+        new_fixed = list()
+        for state, action in state_actions_to_trim:
+            if isinstance(env.grid.get(state.pos_x, state.pos_y), Goal) or state in self.restricted: continue
+            state_id = self.layout.state_ids.get(state)
+            if state_id is None or state_id in self.fixed: continue
+            choice = self.layout.choice(state_id, env.Actions(action).name, state.dir)
+            if choice is None:
+                # e.g. forward into a wall: the model files get a self loop here, which keeping one choice cannot express
+                self.unmatched.add(state)
+                continue
+            self.fixed[state_id] = choice
+            new_fixed.append((state_id, choice))
+        new_decided = [self.layout.state_ids[state] for state in decided_states if state in self.layout.state_ids and self.layout.state_ids[state] not in self.decided]
+        self.decided.update(new_decided)
+        return new_fixed, new_decided
+
+    def choice_mask(self):
+        """Boolean mask over all choices of the unrestricted model, True for the choices that are kept."""
+        mask = np.ones(self.layout.row_group_indices[-1], dtype=bool)
+        for state_id, choice in self.fixed.items():
+            mask[self.layout.row_group_indices[state_id]:self.layout.row_group_indices[state_id + 1]] = False
+            mask[self.layout.row_group_indices[state_id] + choice] = True
+        return mask
+
+    def send(self, worker, env, state_actions_to_trim, decided_states):
+        """
+        Sends the new restrictions to worker. If a tested state has no choice
+        for its action nothing is sent and False returned, the model file then
+        has to be rewritten with all restrictions so far.
+        """
+        new_fixed, new_decided = self.delta(env, state_actions_to_trim, decided_states)
+        if self.unmatched: return False
+        worker.fix(new_fixed)
+        worker.label("decidedStates", new_decided)
+        return True
+
+
+class PrismRestriction:
+    """
+    Writes the restricted PRISM model of every iteration from the unrestricted
+    one. The restrictions of all iterations so far are kept, so the formulas
+    and the decidedStates label encode their whole state set at once, with the
+    compact guards of state_guards, instead of growing by one term per state
+    and iteration.
+    """
+    def __init__(self, prism_file):
+        with open(f"{prism_file}.prism", "r") as f:
+            self.model = f.read()
+        self.commands = list()
+        self.fixed = set()
+        # slippery states in which the turn left, turn right or move forward is not allowed anymore
+        self.excluded = {"left": set(), "right": set(), "forward": set()}
+
+    def add(self, env, state_actions_to_trim):
+        for state, action in state_actions_to_trim:
+            cell = env.grid.get(state.pos_x, state.pos_y)
+            if isinstance(cell, Goal): continue
+            action_name = env.Actions(action).name
+            if isSlippery(cell):
+                kept = {"left": ["left"], "right": ["right"], "forward": ["forward"]}.get(action_name, [])
+                for name, states in self.excluded.items():
+                    if name not in kept: states.add(state)
+                continue
+            self.fixed.add(state)
+            self.commands.append(self.fixed_command(env, state, action_name))
+
+    @staticmethod
+    def fixed_command(env, state, action_name):
+        command = f"[fixed_{action_name}] xAgent={state.pos_x}&yAgent={state.pos_y}&viewAgent={state.dir} "
+        if action_name == "left":
+            command += f" -> (viewAgent'={(state.dir - 1) % 4});"
+        elif action_name == "right":
+            command += f" -> (viewAgent'={(state.dir + 1) % 4});"
+        elif action_name == "forward":
+            if state.dir == 0:
+                if state.pos_x < env.grid.width - 2:
+                    command += f"&!AgentCannotMoveEast -> (xAgent'=xAgent+1);"
+                if state.pos_x == env.grid.width - 2:
+                    command += " -> true;"
+            elif state.dir == 1:
+                if state.pos_y < env.grid.height - 2:
+                    command += f"&!AgentCannotMoveSouth -> (yAgent'=yAgent+1);"
+                if state.pos_y == env.grid.height - 2:
+                    command += " -> true;"
+            elif state.dir == 2:
+                if state.pos_x > 1:
+                    command += f"&!AgentCannotMoveWest -> (xAgent'=xAgent-1);"
+                if state.pos_x == 1:
+                    command += " -> true;"
+            elif state.dir == 3:
+                if state.pos_y > 1:
+                    command += f"&!AgentCannotMoveNorth -> (yAgent'=yAgent-1);"
+                if state.pos_y == 1:
+                    command += " -> true;"
+        else:
+            command += " -> true;"
+        return command
+
+    def model_text(self, decided_states):
+        filedata = self.model.replace('endmodule', "\n".join(self.commands) + "\n\nendmodule\n")
+        # the restrictions are put in front of what the formulas of the unrestricted model say
+        if self.fixed:
+            filedata = re.sub(r"^formula AgentIsFixed = ", "formula AgentIsFixed = " + " | ".join(state_guards(self.fixed)) + " |", filedata, flags=re.MULTILINE)
+        for name, formula in (("left", "AgentSlipperyTurnLeftAllowed"), ("right", "AgentSlipperyTurnRightAllowed"), ("forward", "AgentSlipperyMoveForwardAllowed")):
+            if not self.excluded[name]: continue
+            filedata = re.sub(rf"^formula {formula} = ", f"formula {formula} = !(" + " | ".join(state_guards(self.excluded[name])) + ") &", filedata, flags=re.MULTILINE)
+        if decided_states:
+            guards = state_guards(decided_states)
+            chunks = [" | ".join(guards[k:k + LABEL_CHUNK]) for k in range(0, len(guards), LABEL_CHUNK)]
+            filedata = re.sub(r"^label \"decidedStates\" =.*;", "label \"decidedStates\" = (" + " )|( ".join(chunks) + ");\n", filedata, flags=re.MULTILINE)
+        return filedata
+
+    @property
+    def restricted(self):
+        return self.fixed.union(*self.excluded.values())
+
+    def write(self, decided_states, out):
+        with open(f"{out}.prism", "w") as f:
+            f.write(self.model_text(decided_states))
+
+    def update(self, env, state_actions_to_trim, decided_states, out):
+        self.add(env, state_actions_to_trim)
+        self.write(decided_states, out)
+
+
+class ExplicitRestriction:
+    """
+    PrismRestriction for the explicit model exported by the env: every
+    iteration rewrites the files of the unrestricted model, with only the
+    choice of the tested action left in the fixed states.
+    """
+    def __init__(self, model, reward_structure):
+        self.model = model
+        self.reward_structure = reward_structure
+        self.fixed = dict()
+        self.restricted = set()
+        self.decided = set()
+
+    def add(self, env, state_actions_to_trim):
+        for state, action in state_actions_to_trim:
+            if isinstance(env.grid.get(state.pos_x, state.pos_y), Goal): continue
+            self.fixed[self.model.state_index(state)] = choice_label(env.Actions(action).name, state.dir)
+            self.restricted.add(state)
+
+    def write(self, decided_states, out):
+        self.decided = {self.model.state_index(state) for state in decided_states}
+        self.model.write(out, self.reward_structure, self.fixed, decided_states)
+
+    def update(self, env, state_actions_to_trim, decided_states, out):
+        self.add(env, state_actions_to_trim)
+        self.write(decided_states, out)
+
+    def choice_mask(self):
+        """One flag per choice of the model, whether the written model keeps it."""
+        mask = list()
+        for state, choices in enumerate(self.model.choices):
+            kept = [label == self.fixed[state] for label, _ in choices] if state in self.fixed else [True] * len(choices)
+            mask += kept if any(kept) else [True] * len(choices)
+        return np.array(mask, dtype=bool)
@@ -7,13 +7,28 @@ from os import listdir, system
 from os.path import isfile, join, getctime
 import argparse
 from gym_minigrid.policyRepairEnv import *
+from gym_minigrid.tempest_results import read_min_max, rename_results
 from statistics import mean
+import numpy as np
 
 import time, re, sys, csv, os
 from pathlib import Path
 from copy import deepcopy
+from contextlib import nullcontext
 
 import subprocess
+# tempest.py, artifacts.py and tracing.py are shared with the other driver
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from tempest import TempestWorker
+from restriction import ChoiceLayout, DeltaRestriction, PrismRestriction, ExplicitRestriction
+from observation_table import ObservationTable
+from action_table import ActionTable
+from artifacts import ArtifactStore, ARTIFACT_ROOT
+from random_testing import random_testing, tabular_random_testing
+from plotting import Plotter
+from tracing import Tracer
+from value_iteration import SparseModelChecker
+from gym_minigrid.transition_model import compile_transitions
 LOG_MODE = True
 
 TEMPEST_BINARY=os.environ.get("TEMPEST_BINARY", "~/projects/tempest-devel/ranking_release/bin/storm")
@@ -118,9 +133,9 @@ def min_mean_max(list):
     if not list: return ""
     return min(list), mean(list), max(list)
 
-def move_files(envname, iterations, directory, plotting):
-    files_to_move_regex = re.compile("(results_m.*|action_ranking.*|.*prism|.*heatmap.*|.*fixed.*|.*tested_states.*|.*tested_tiles.*|\d+.png|full.png|output.csv|boilerplate_tikz.pdf)$")
-    if plotting: concat_images(envname, iterations)
+def move_files(envname, iterations, directory, plotter=None):
+    files_to_move_regex = re.compile("(results_m.*|action_ranking.*|state_valuations.npy|.*prism|.*heatmap.*|.*fixed.*|.*tested_states.*|.*tested_tiles.*|\d+.png|full.png|output.csv|boilerplate_tikz.pdf)$")
+    if plotter is not None: plotter.concat_images(envname, iterations)
     if os.path.exists(directory):
         print(f"{directory} already exists, please move files manually")
         return
@@ -133,47 +148,19 @@ def move_files(envname, iterations, directory, plotting):
             except Exception as e:
                 print(e)
 
-def concat_images(envname, iterations):
-    for i in range(0, iterations):
-        command = f"montage {envname}*{i:03}*heatmap_C*png {envname}*{i:03}*fixed_map*png {envname}*{i+1:03}*tested_*png  -tile 1x -geometry +0+0 {i:03}.png"
-        print(f"Executing {command}")
-        system(command)
-    iterations -= 1
-    command = f"montage <000-{iterations-1:03}>.png  -tile x1 -geometry +0+0 full.png"
-    print(f"Executing {command}")
-    system(command)
-
-
-def compare_min_max(iteration):
-    state_to_values = {}
-    done_states = list()
+def compare_min_max(env, iteration, store):
     try:
-        with open(f"results_maximize", "r") as f:
-            max_lines = f.readlines()
-        with open(f"results_minimize", "r") as f:
-            min_lines = f.readlines()
-        for max_line, min_line in zip(max_lines, min_lines):
-            stateMapping = convert(re.findall(r"([a-zA-Z]*[a-zA-Z])=(\d+)?", max_line))
-            min_stateMapping = convert(re.findall(r"([a-zA-Z]*[a-zA-Z])=(\d+)?", min_line))
-            if stateMapping != min_stateMapping:
-                print("min/max files do not match.")
-                sys.exit(1)
-            if "[AgentDone" in max_line:
-                done_states.append(State(int(stateMapping["xAgent"]), int(stateMapping["yAgent"]), int(stateMapping["viewAgent"])))
-                continue
-            max_result = float(re.search(r"Result:([+-]?(\d*\.\d+)|\d+)", max_line)[0].replace("Result:",""))
-            min_result = float(re.search(r"Result:([+-]?(\d*\.\d+)|\d+)", min_line)[0].replace("Result:",""))
-            state = State(int(stateMapping["xAgent"]), int(stateMapping["yAgent"]), int(stateMapping["viewAgent"]))
-            value = (min_result, max_result, max_result - min_result)
-            state_to_values[state] = value
-        for state in done_states:
-            del state_to_values[state]
+        env.min_max_table = read_min_max(store.path("results_maximize"), store.path("results_minimize"), env.grid.width, env.num_state_ids())
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
     except EnvironmentError:
         print("Error: file not available. Exiting.")
         sys.exit(1)
-    system(f"mv results_maximize results_maximize_{iteration}")
-    system(f"mv results_minimize results_minimize_{iteration}")
-    return state_to_values
+    rename_results(store.path("results_maximize"), store.path(f"results_maximize_{iteration}"))
+    rename_results(store.path("results_minimize"), store.path(f"results_minimize_{iteration}"))
+    store.tag(iteration, f"results_maximize_{iteration}", f"results_minimize_{iteration}")
+    return env.min_max_table.as_dict(env.state_from_id)
 
 
 
@@ -185,7 +172,13 @@ def translate_grid_to_prism(env, filename, oneways=False):
     LOG(f"Executing '{command}'")
     system(command)
 
-def call_tempest(filename, bound, rewardStructure, threshold, use_docker=False, safety=False):
+# the reward filters leave out the states on this cell, explicit models label them instead
+EXCLUDED_CELL = (25, 25)
+EXCLUDED_CELL_LABEL = "AgentIsOnExcludedCell"
+
+def tempest_properties(bound, rewardStructure, threshold, safety=False, explicit=False):
+    # an explicit model has a single unnamed reward structure and no variables to refer to
+    reward = "R" if explicit else f"R{{\"{rewardStructure}\"}}"
     if True:
         if safety:
             prop =  f"filter(min, Pmin=? [ G !\"AgentIsInLava\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
@@ -195,31 +188,53 @@ def call_tempest(filename, bound, rewardStructure, threshold, use_docker=False,
             prop += f"filter(max, Pmax=? [ G !\"AgentIsInLava\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             prop += f"filter(avg, Pmax=? [ G !\"AgentIsInLava\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
         else:
-            property_str = "!(\"AgentCannotTurn\" |\"AgentIsOnOneWay\") & !(xAgent=25&yAgent=25)"
+            excluded = f"\"{EXCLUDED_CELL_LABEL}\"" if explicit else f"(xAgent={EXCLUDED_CELL[0]}&yAgent={EXCLUDED_CELL[1]})"
+            property_str = f"!(\"AgentCannotTurn\" |\"AgentIsOnOneWay\") & !{excluded}"
             #prop =  f"filter(min, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             #prop += f"filter(max, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             #prop += f"filter(avg, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             #prop += f"filter(min, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             #prop += f"filter(max, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
             #prop += f"filter(avg, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\" );"
-            prop =  f"filter(min, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], {property_str}  );"
-            prop += f"filter(max, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], {property_str}  );"
-            prop += f"filter(avg, R{{\"{rewardStructure}\"}}min=? [ C<={bound} ], {property_str}  );"
-            prop += f"filter(min, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], {property_str}  );"
-            prop += f"filter(max, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], {property_str}  );"
-            prop += f"filter(avg, R{{\"{rewardStructure}\"}}max=? [ C<={bound} ], {property_str}  );"
+            prop =  f"filter(min, {reward}min=? [ C<={bound} ], {property_str}  );"
+            prop += f"filter(max, {reward}min=? [ C<={bound} ], {property_str}  );"
+            prop += f"filter(avg, {reward}min=? [ C<={bound} ], {property_str}  );"
+            prop += f"filter(min, {reward}max=? [ C<={bound} ], {property_str}  );"
+            prop += f"filter(max, {reward}max=? [ C<={bound} ], {property_str}  );"
+            prop += f"filter(avg, {reward}max=? [ C<={bound} ], {property_str}  );"
         prop += f"filter(forall, Pmax>=1 [ \"decidedStates\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
         prop += f"filter(count, Pmax>=1 [ !\"decidedStates\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
-        prop += f"filter(count, R{{\"{rewardStructure}\"}}max<{threshold} [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
-        prop += f"filter(count, R{{\"{rewardStructure}\"}}min>= {threshold} [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
+        prop += f"filter(count, {reward}max<{threshold} [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
+        prop += f"filter(count, {reward}min>= {threshold} [ C<={bound} ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
         prop += f"filter(count, Pmax>=1 [ \"decidedStates\" ], !\"AgentIsInLava\" & !\"AgentIsInGoal\");"
-        prop += f"R{{\"{rewardStructure}\"}}max=? [ C<={bound} ];"
-        command = f"{TEMPEST_BINARY} --prism {filename}.prism --prop '{prop}' --buildchoicelab --buildstateval --build:explchecks; mv action_ranking action_ranking_{bound}"
+        prop += f"{reward}max=? [ C<={bound} ];"
+    return prop
+
+def tempest_arguments(filename, binary=False, explicit=False):
+    if explicit:
+        arguments = ["--io:explicit", f"{filename}.tra", f"{filename}.lab", "--io:choicelab", f"{filename}.choicelab", "--io:staterew", f"{filename}.rew"]
+    else:
+        arguments = ["--prism", f"{filename}.prism", "--buildchoicelab", "--buildstateval", "--build:explchecks"]
+    if binary: arguments.append("--binaryresults")
+    return arguments
+
+def call_tempest(filename, bound, rewardStructure, threshold, use_docker=False, safety=False, worker=None, binary=False, directory=".", explicit=False, checker=None):
+    if checker is not None:
+        # the numpy backend answers the same properties in-process and writes the same binary results
+        results = checker.check(bound, threshold, safety, directory)
+        rename_results(os.path.join(directory, "action_ranking"), os.path.join(directory, f"action_ranking_{bound}"))
+        return TestResult(*results, 0)
+    prop = tempest_properties(bound, rewardStructure, threshold, safety, explicit)
+    command = f"{TEMPEST_BINARY} {' '.join(tempest_arguments(filename, binary, explicit))} --prop '{prop}'"
     #LOG(f"Executing '{command}'")
 
     results = list()
     try:
-        output = subprocess.check_output(command, shell=True).decode("utf-8").split('\n')
+        if worker is None:
+            output = subprocess.check_output(command, shell=True, cwd=directory).decode("utf-8").split('\n')
+        else:
+            output = worker.check(prop)
+        rename_results(os.path.join(directory, "action_ranking"), os.path.join(directory, f"action_ranking_{bound}"))
         for line in output:
             if "Result" in line and not len(results) >= 10:
                 range_value = re.search(r"(.*:).*\[(-?\d+\.?\d*), (-?\d+\.?\d*)\].*", line)
@@ -234,36 +249,52 @@ def call_tempest(filename, bound, rewardStructure, threshold, use_docker=False,
     results.append(0) # placeholder for num_queries
     return TestResult(*tuple(results))
 
-def plot_heatmaps(env, name, bound, rewardStructure, previousFixedStates, fixedStates, statesValuesDict, nr_bins=1, iteration=0):
+def plot_heatmaps(env, name, bound, rewardStructure, previousFixedStates, fixedStates, statesValuesDict, store, nr_bins=1, iteration=0):
     #env.printHeatMap(name + f"_{rewardStructure}_{iteration:03}", bound, nr_bins)
     #env.printHeatMapReduced(name + f"_{rewardStructure}_{iteration:03}", bound, nr_bins)
     previousFixedStates = env.printFixedMap(name + f"_{rewardStructure}_{iteration:03}", bound, previousFixedStates, fixedStates)
-    system(f"mv action_ranking_{bound} action_ranking_{bound}_{iteration:03}")
+    rename_results(store.path(f"action_ranking_{bound}"), store.path(f"action_ranking_{bound}_{iteration:03}"))
+    store.tag(iteration, f"action_ranking_{bound}_{iteration:03}")
     return previousFixedStates
 
-def simulate_from_state(env, policy, state=None, n=20, visualize=False):
-    if visualize: env.render(mode="human")
-    #input("Hit Enter to simulate 20 steps...")
-    observation = env.reset(state=state)
-    action, info = policy.predict(observation, deterministic=True)
-    for i in range(0,n):
-        action = env.actions(action)
-        observation, _, terminated, info = env.step(action)
-        action, _ = policy.predict(observation, deterministic=True)
+def query_policy(env, policy, observation, action_table=None):
+    if action_table is not None:
+        return action_table.current(env)
+    action, _ = policy.predict(observation, deterministic=True)
+    return action
+
+def make_env(name):
+    env = gym.make(name)
+    env = RGBImgObsWrapper(env) # Get pixel observations
+    env = ImgObsWrapper(env)    # Get rid of the 'mission' field
+    env = MiniWrapper(env)      # Project specific changes
+    return env
+
+def simulate_from_state(env, policy, state=None, n=20, visualize=False, action_table=None):
+    # with an action table the observations in between are never read, so none are rendered
+    with env.no_observations() if action_table is not None else nullcontext():
         if visualize: env.render(mode="human")
-        # If we test for safety, lava is a safety violation
-        # If we test for performance, running into lava within the time bound is a performance violation, since the agent cannot reach the goal
-        if terminated and info["ran_into_lava"]:
-            return True, i+1
-        # Reaching the goal means no safety violation, or no performance violation when within the time budget
-        if terminated and info["reached_goal"]:
-            return False, i+1
-    return not info["reached_goal"] or info['ran_into_lava'], i+1
-
-def test_important_state(env, policy, state, state_actions_to_trim=None, visualize=False):
+        #input("Hit Enter to simulate 20 steps...")
+        observation = env.reset(state=state)
+        action, info = query_policy(env, policy, observation, action_table), None
+        for i in range(0,n):
+            action = env.actions(action)
+            observation, _, terminated, info = env.step(action)
+            action = query_policy(env, policy, observation, action_table)
+            if visualize: env.render(mode="human")
+            # If we test for safety, lava is a safety violation
+            # If we test for performance, running into lava within the time bound is a performance violation, since the agent cannot reach the goal
+            if terminated and info["ran_into_lava"]:
+                return True, i+1
+            # Reaching the goal means no safety violation, or no performance violation when within the time budget
+            if terminated and info["reached_goal"]:
+                return False, i+1
+        return not info["reached_goal"] or info['ran_into_lava'], i+1
+
+def test_important_state(env, policy, state, state_actions_to_trim=None, visualize=False, observation_table=None):
     #print(f"Testing state {state}...")
     #print(f"Testing: state: {state}... \tAction:", end=""); sys.stdout.flush()
-    observation = env.reset(state=state)
+    observation = observation_table[state] if observation_table is not None else env.reset(state=state)
     action, info = policy.predict(observation, deterministic=True)
     #print(f"{env.Actions(action).name}, info: {info}")
     if state_actions_to_trim is not None:
@@ -273,131 +304,34 @@ def test_important_state(env, policy, state, state_actions_to_trim=None, visuali
         simulate_from_state(env, policy, state, action)
     return state_actions_to_trim
 
-def test_all_states(env, policy, important_states, visualize=False):
+def observe_states(env, states):
+    observations = None
+    for i, state in enumerate(states):
+        observation = env.reset(state=state)
+        if observations is None:
+            observations = np.empty((len(states),) + observation.shape, dtype=observation.dtype)
+        observations[i] = observation
+    return observations
+
+def test_all_states(env, policy, important_states, visualize=False, observation_table=None, action_table=None):
     state_actions_to_trim = []
-    for state in reversed(important_states):
-        state_actions_to_trim = test_important_state(env, policy, state, state_actions_to_trim, visualize)
-    return state_actions_to_trim
+    if visualize:
+        for state in reversed(important_states):
+            state_actions_to_trim = test_important_state(env, policy, state, state_actions_to_trim, visualize, observation_table)
+        return state_actions_to_trim
+    # one batched forward pass instead of one predict call per state
+    states = list(reversed(important_states))
+    if action_table is not None:
+        return [(state, action_table[state]) for state in states]
+    if not states: return state_actions_to_trim
+    observations = observation_table.observations(states) if observation_table is not None else observe_states(env, states)
+    actions, _ = policy.predict(observations, deterministic=True)
+    return list(zip(states, actions))
 
 def update_prism_file(env, name, state_actions_to_trim, decided_states, out):
-    fixed_formula, fixed_updates = "formula AgentIsFixed = ", list()
-    slippery_left_formula, slippery_left_updates = "formula AgentSlipperyTurnLeftAllowed = ", list()
-    slippery_right_formula, slippery_right_updates = "formula AgentSlipperyTurnRightAllowed = ", list()
-    slippery_forward_formula, slippery_forward_updates = "formula AgentSlipperyMoveForwardAllowed = ", list()
-
-    windy_left_formula, windy_left_updates = "formula AgentWindyTurnLeftAllowed = ", list()
-    windy_right_formula, windy_right_updates = "formula AgentWindyTurnRightAllowed = ", list()
-    windy_forward_formula, windy_forward_updates = "formula AgentWindyMoveForwardAllowed = ", list()
-    windy_standstill_formula, windy_standstill_updates = "formula AgentWindyStandstillAllowed = ", list()
-    commands = []
-    for sa in state_actions_to_trim:
-        state_string = f"(xAgent={sa[0].pos_x}&yAgent={sa[0].pos_y}&viewAgent={sa[0].dir})"
-        cell = env.grid.get(sa[0].pos_x,sa[0].pos_y)
-        if isinstance(cell, Goal): continue
-        action_name = env.Actions(sa[1]).name
-        #print(f"Fixing action at {sa[0]} to {sa[1]}({action_name}), type = {type(cell)}")
-        if not isSlippery(cell): # and not isWindy(cell):
-            fixed_updates.append(state_string)
-            command =  f"[fixed_{action_name}] xAgent={sa[0].pos_x}&yAgent={sa[0].pos_y}&viewAgent={sa[0].dir} "
-            if action_name == "left":
-                if sa[0].dir > 0:
-                    update = (sa[0].dir - 1) % 4
-                else:
-                    update=3
-                command += f" -> (viewAgent'={update});"
-            elif action_name == "right":
-                update = (sa[0].dir + 1) % 4
-                command += f" -> (viewAgent'={update});"
-            elif action_name == "forward":
-                if sa[0].dir == 0:
-                    if sa[0].pos_x < env.grid.width - 2:
-                        command += f"&!AgentCannotMoveEast -> (xAgent'=xAgent+1);"
-                    if sa[0].pos_x == env.grid.width - 2:
-                        command += " -> true;"
-                elif sa[0].dir == 1:
-                    if sa[0].pos_y < env.grid.height - 2:
-                        command += f"&!AgentCannotMoveSouth -> (yAgent'=yAgent+1);"
-                    if sa[0].pos_y == env.grid.height - 2:
-                        command += " -> true;"
-                elif sa[0].dir == 2:
-                    if sa[0].pos_x > 1:
-                        command += f"&!AgentCannotMoveWest -> (xAgent'=xAgent-1);"
-                    if sa[0].pos_x == 1:
-                        command += " -> true;"
-                elif sa[0].dir == 3:
-                    if sa[0].pos_y > 1:
-                        command += f"&!AgentCannotMoveNorth -> (yAgent'=yAgent-1);"
-                    if sa[0].pos_y == 1:
-                        command += " -> true;"
-            else:
-                command += " -> true;"
-            commands.append(command)
-        elif isSlippery(cell):
-            if action_name == "left":
-                slippery_forward_updates.append(f"!{state_string}")
-                slippery_right_updates.append(f"!{state_string}")
-            elif action_name == "right":
-                slippery_forward_updates.append(f"!{state_string}")
-                slippery_left_updates.append(f"!{state_string}")
-            elif action_name == "forward":
-                slippery_left_updates.append(f"!{state_string}")
-                slippery_right_updates.append(f"!{state_string}")
-            else:
-                slippery_forward_updates.append(f"!{state_string}")
-                slippery_left_updates.append(f"!{state_string}")
-                slippery_right_updates.append(f"!{state_string}")
-        #elif isWindy(cell):
-        #    if action_name == "left":
-        #        windy_forward_updates.append(f"!{state_string}")
-        #        windy_right_updates.append(f"!{state_string}")
-        #        windy_standstill_updates.append(f"!{state_string}")
-        #    elif action_name == "right":
-        #        windy_forward_updates.append(f"!{state_string}")
-        #        windy_left_updates.append(f"!{state_string}")
-        #        windy_standstill_updates.append(f"!{state_string}")
-        #    elif action_name == "forward":
-        #        windy_left_updates.append(f"!{state_string}")
-        #        windy_right_updates.append(f"!{state_string}")
-        #        windy_standstill_updates.append(f"!{state_string}")
-        #    else:
-        #        windy_forward_updates.append(f"!{state_string}")
-        #        windy_left_updates.append(f"!{state_string}")
-        #        windy_right_updates.append(f"!{state_string}")
-    fixed_formula += " | ".join(fixed_updates)
-    slippery_left_formula += " & ".join(slippery_left_updates)
-    slippery_right_formula += " & ".join(slippery_right_updates)
-    slippery_forward_formula += " & ".join(slippery_forward_updates)
-    #windy_left_formula += " & ".join(windy_left_updates)
-    #windy_right_formula += " & ".join(windy_right_updates)
-    #windy_forward_formula += " & ".join(windy_forward_updates)
-    #windy_standstill_formula += " & ".join(windy_standstill_updates)
-
-    decided_states_label = "label \"decidedStates\" = ("
-    first = True
-    for decided_states_iter, decided_state in enumerate(decided_states):
-        if first:
-            first = False
-        else:
-            if decided_states_iter % 50 == 0:
-                decided_states_label += " )|( "
-            else:
-                decided_states_label += " | "
-        decided_states_label += f"(xAgent={decided_state.pos_x}&yAgent={decided_state.pos_y}&viewAgent={decided_state.dir})"
-    decided_states_label += ");\n"
-    with open(f'{name}.prism', 'r') as file :
-      filedata = file.read()
-    filedata = filedata.replace('endmodule', "\n".join(commands) + "\n\nendmodule\n")
-    if len(fixed_updates) > 0: filedata = re.sub(r"^formula AgentIsFixed = ", fixed_formula + " |", filedata, flags=re.MULTILINE)
-    if len(slippery_left_updates) > 0: filedata = re.sub(r"^formula AgentSlipperyTurnLeftAllowed = ", slippery_left_formula + " &", filedata, flags=re.MULTILINE)
-    if len(slippery_right_updates) > 0: filedata = re.sub(r"^formula AgentSlipperyTurnRightAllowed = ", slippery_right_formula + " &", filedata, flags=re.MULTILINE)
-    if len(slippery_forward_updates) > 0: filedata = re.sub(r"^formula AgentSlipperyMoveForwardAllowed = ", slippery_forward_formula + " &", filedata, flags=re.MULTILINE)
-    if len(decided_states) > 0: filedata = re.sub(r"^label \"decidedStates\" =.*;", decided_states_label, filedata, flags=re.MULTILINE)
-    #if len(windy_left_updates) > 0: filedata = re.sub(r"^formula AgentWindyTurnLeftAllowed = ", windy_left_formula + " &", filedata, flags=re.MULTILINE)
-    #if len(windy_right_updates) > 0: filedata = re.sub(r"^formula AgentWindyTurnRightAllowed = ", windy_right_formula + " &", filedata, flags=re.MULTILINE)
-    #if len(windy_forward_updates) > 0: filedata = re.sub(r"^formula AgentWindyMoveForwardAllowed = ", windy_forward_formula + " &", filedata, flags=re.MULTILINE)
-    #if len(windy_standstill_updates) > 0: filedata = re.sub(r"^formula AgentWindyStandstillAllowed = ", windy_standstill_formula + " &", filedata, flags=re.MULTILINE)
-    with open(f'{out}.prism', 'w') as file:
-      file.write(filedata)
+    """Restricts the model in name by the tested state-action pairs of one iteration and labels the decided states, see PrismRestriction."""
+    PrismRestriction(name).update(env, state_actions_to_trim, decided_states, out)
+
 # ........................................................................... #
 
 def LOG(text : str) -> None:
@@ -422,13 +356,29 @@ def main():
     parser.add_argument('--visualize', action='store_true', required=False, default=False, help='(optional) Whether to use visualize 20 steps of the agent.')
     parser.add_argument('--randomMT', action='store_true', required=False, default=False, help='Whether to run EMT instead of IMT')
     parser.add_argument('--random', type=int, required=False, default=0, help='The number of time steps to execute one random test case for.')
+    parser.add_argument('--num-envs', type=int, required=False, default=1, help='(optional) Number of env copies stepped in lockstep in random testing, the policy is queried once per step for all of them, defaults to 1.')
+    parser.add_argument('--tabular', action='store_true', required=False, default=False, help='(optional) Run random testing on the transitions compiled from the layout and the action table of the policy instead of stepping the env.')
     parser.add_argument('--safety', action='store_true', required=False, default=False, help='Compute safety estimates instead of performance.')
+    parser.add_argument('--observation-table', action='store_true', required=False, default=False, help='(optional) Render the observation of every state once into a shared memory-mapped table and look observations up from it.')
+    parser.add_argument('--action-table', action='store_true', required=False, default=False, help='(optional) Evaluate the policy once on every state, cache the actions next to the policy hash and answer all queries from that table.')
+    parser.add_argument('--binary-results', action='store_true', required=False, default=False, help='(optional) Let tempest write per-state results and the action ranking as .npy files and memory-map them instead of parsing text.')
+    parser.add_argument('--artifact-root', type=str, required=False, default=ARTIFACT_ROOT, help='(optional) Directory (e.g. on tmpfs) in which every run gets its own directory for the intermediate files, defaults to $ARTIFACT_ROOT or artifacts.')
+    parser.add_argument('--retention', type=str, required=False, default="all", help='(optional) Which intermediate files of past iterations to keep: all, last:N, final or compressed, defaults to all.')
+    parser.add_argument('--explicit', action='store_true', required=False, default=False, help='(optional) Export the MDP of the layout from the env as explicit tempest input (.tra, .lab, .choicelab, .rew) instead of translating it with Minigrid2PRISM, implies --binary-results.')
+    parser.add_argument('--backend', type=str, required=False, default="tempest", choices=["tempest", "numpy"], help='(optional) Model checker answering the properties of every iteration: tempest, or numpy for in-process value iteration on the explicit model (implies --explicit), defaults to tempest.')
+    parser.add_argument('--warm-start', action='store_true', required=False, default=False, help='(optional) With --backend numpy, start the safety value iteration of every iteration from the values of the previous one, with --trace the sweeps saved are counted.')
+    parser.add_argument('--worker', action='store_true', required=False, default=False, help='(optional) Keep one tempest process for the whole run and only send the new restrictions each iteration instead of rewriting the PRISM file.')
 
 
     parser.add_argument('--refinement-steps', type=int, required=False, default=5, help='(optional) Amount of refinement steps per iteration, defaults to 5.')
     #parser.add_argument('--bins', type=int, required=False, default=1, help='(optional) how many bins to be used for plotting the heatmaps, defaults to 1.')
     parser.add_argument('--plotting', action='store_true', required=False, default=False, help='(optional) Whether to plot the results for the individual iterations.')
+    parser.add_argument('--trace', action='store_true', required=False, default=False, help='(optional) Write the time spent in every phase of the loop as a Chrome trace (trace.json) and per iteration (trace.csv) next to output.csv.')
+    parser.add_argument('--plot-workers', type=int, required=False, default=1, help='(optional) Number of background threads rendering the plots, defaults to 1.')
     args = parser.parse_args()
+    # the states of an explicit model are only known by index, their valuations come from the exported state_valuations.npy
+    if args.backend == "numpy": args.explicit = True
+    if args.explicit: args.binary_results = True
 
 
     bound = args.bound
@@ -438,10 +388,7 @@ def main():
 
     plotting = args.plotting
 
-    env = gym.make(args.env)
-    env = RGBImgObsWrapper(env) # Get pixel observations
-    env = ImgObsWrapper(env)    # Get rid of the 'mission' field
-    env = MiniWrapper(env)      # Project specific changes
+    env = make_env(args.env)
     if args.policy:
         policyname = args.policy
 
@@ -458,8 +405,15 @@ def main():
 
     i = 0
     prism_file_name = f"{envname}_trimmed_{i:03}"
+    store = ArtifactStore(envname, args.retention, args.artifact_root)
+    tracer = Tracer()
     env.reset()
-    translate_grid_to_prism(env, prism_file_name, args.oneways)
+    with tracer.span("translation"):
+        if args.explicit:
+            explicit_model = env.unwrapped.export_explicit(store.path(prism_file_name), rewardStructure, {EXCLUDED_CELL_LABEL: [EXCLUDED_CELL]})
+        else:
+            translate_grid_to_prism(env, store.path(prism_file_name), args.oneways)
+    checker = SparseModelChecker(explicit_model, rewardStructure, EXCLUDED_CELL_LABEL, args.warm_start, args.warm_start and args.trace) if args.backend == "numpy" else None
 
     fixedStates = set()
     states_values = list()
@@ -473,8 +427,8 @@ def main():
     #for _ in range(0,1):
     if not args.policy:
         print("No policy provided, plotting heatmap and exiting!")
-        call_tempest(prism_file_name, bound, rewardStructure, args.threshold)
-        env.fillStateRanking("action_ranking_{}".format(bound))
+        call_tempest(store.path(prism_file_name), bound, rewardStructure, args.threshold, binary=args.binary_results, directory=store.root, explicit=args.explicit, checker=checker)
+        env.fillStateRanking(store.path(f"action_ranking_{bound}"))
         env.printHeatMap(prism_file_name + f"_{rewardStructure}", bound, 1)
         #env.printHeatMapReduced(prism_file_name + f"_{rewardStructure}", bound, 1)
         sys.exit(0)
@@ -486,52 +440,95 @@ def main():
     important_states = list()
     numQueries = 0
     iterationResult = StateSet(i)
+    worker, restriction, file_restriction = None, None, None
+    # the plots of every iteration are rendered in the background while the loop goes on
+    plotter = Plotter(args.plot_workers) if plotting and args.random == 0 else None
+    env.unwrapped.plotter = plotter
+    observation_table = ObservationTable(env) if args.observation_table else None
+    action_table = ActionTable(env, policy, policyname, observation_table) if args.action_table else None
+    if args.worker and args.random == 0 and checker is None:
+        worker = TempestWorker(tempest_arguments(store.path(prism_file_name), args.binary_results, args.explicit), tempest_properties(bound, rewardStructure, args.threshold, args.safety, args.explicit), cwd=store.root)
     if args.random > 0: #awkward way to test this, but means that a single cli flag is sufficient
         with open(f'output.csv', 'w') as file:
             file.write("num_queries num_failing\n")
             numFailingInstances = 0
             numQueriesTotal = 0
+            if args.tabular:
+                # episodes on the transitions compiled from the layout, the policy is only read from the action table
+                if action_table is None: action_table = ActionTable(env, policy, policyname, observation_table)
+                env.reset()
+                episodes = tabular_random_testing(compile_transitions(env.unwrapped), action_table.actions, args.random)
+            elif args.num_envs > 1:
+                # lockstep episodes on copies of the env, episodes still running at the query budget are dropped
+                envs = [env] + [make_env(args.env) for _ in range(args.num_envs - 1)]
+                for copy in envs[1:]: copy.reset()
+                episodes = random_testing(envs, policy, args.random, 2000, action_table) # hardcoded value 1
+            else:
+                episodes = None
             while numQueriesTotal < 2000: # hardcoded value 1
-                pos = env.place_agent()
-                dir = env.agent_dir
-                testState = State(*pos, dir)
-                failed, numQueries = simulate_from_state(env, policy, state=testState, n=args.random, visualize=args.visualize)
+                if episodes is not None:
+                    failed, numQueries = next(episodes)
+                else:
+                    pos = env.place_agent()
+                    dir = env.agent_dir
+                    testState = State(*pos, dir)
+                    failed, numQueries = simulate_from_state(env, policy, state=testState, n=args.random, visualize=args.visualize, action_table=action_table)
                 numQueriesTotal += numQueries
                 if failed:
                     numFailingInstances += 1
                 result = f"{numQueriesTotal} {numFailingInstances}"
                 file.write(result + "\n")
                 print(result)
-        move_files(envname, 0, dest_directory, plotting)
+        move_files(envname, 0, dest_directory)
+        store.finish(0, os.path.join(dest_directory, "artifacts"))
         sys.exit(0)
 
     while True:
         iterationResult.addTestedStates(important_states)
         decided_states.clear()
-        test_result = call_tempest(prism_file_name, bound, rewardStructure, args.threshold, safety=args.safety) # computeEstimates
+        with tracer.span("tempest", i) as span:
+            test_result = call_tempest(store.path(prism_file_name), bound, rewardStructure, args.threshold, safety=args.safety, worker=worker, binary=args.binary_results, directory=store.root, explicit=args.explicit, checker=checker) # computeEstimates
+            if checker is not None and args.safety:
+                span["sweeps"] = checker.sweeps
+                # counting the sweeps saved costs a cold check, it is only done with --trace
+                if checker.saved is not None:
+                    span["sweeps_saved"] = checker.saved
+                    LOG(f"> Value iteration took {checker.sweeps} sweeps, {checker.saved} fewer than without warm start")
+        if worker is not None and restriction is None:
+            # the first check runs on the model the worker was started on, its ranking tells us the state and choice indices
+            restriction = DeltaRestriction(ChoiceLayout(store.path(f"action_ranking_{bound}")), file_restriction.restricted if file_restriction is not None else ())
         if i == 0: iterationResult.totalTestStates = test_result.count_undecided_states
 
         csv_test_results = test_result.csv()
-        states_values_dict = compare_min_max(i) # computeEstimates part 2
-        for state, values in states_values_dict.items():
-            if values[1] < args.threshold:
-                iterationResult.addFailureState(state) # line 8
-                decided_states.add(state)
-            elif values[0] >= args.threshold:
-                iterationResult.addSuccessState(state) # line 12
-                decided_states.add(state)
+        with tracer.span("parse_results", i) as span:
+            states_values_dict = compare_min_max(env, i, store) # computeEstimates part 2
+            span["states"] = len(states_values_dict)
+        with tracer.span("state_selection", i) as span:
+            for state, values in states_values_dict.items():
+                if values[1] < args.threshold:
+                    iterationResult.addFailureState(state) # line 8
+                    decided_states.add(state)
+                elif values[0] >= args.threshold:
+                    iterationResult.addSuccessState(state) # line 12
+                    decided_states.add(state)
+                else:
+                    iterationResult.addUndecidedState(state) # line 12
+            span["decided_states"] = len(decided_states)
+        with tracer.span("ranking", i) as span:
+            env.fillStateRanking(store.path(f"action_ranking_{bound}"), decided_states)
+            span["ranked_states"] = len(env.state_ranking)
+        if plotting:
+            with tracer.span("plotting", i): env.printHeatMap(prism_file_name + f"_{rewardStructure}_{i:03}", bound, 1)
+        with tracer.span("state_selection", i):
+            if args.randomMT:
+                important_states = env.random_states(args.refinement_steps, decided_states)
             else:
-                iterationResult.addUndecidedState(state) # line 12
-        env.fillStateRanking("action_ranking_{}".format(bound), decided_states)
-        if plotting: env.printHeatMap(prism_file_name + f"_{rewardStructure}_{i:03}", bound, 1)
-        if args.randomMT:
-            important_states = env.random_states(args.refinement_steps, decided_states)
-        else:
-            important_states = env.top_n_states(args.refinement_steps, states_values_dict, args.threshold)
+                important_states = env.top_n_states(args.refinement_steps, states_values_dict, args.threshold)
         #print(iterationResult)
         numQueriesForThisIteration = len(important_states)
         numQueries += numQueriesForThisIteration
-        state_actions_to_trim = test_all_states(env, policy, important_states, args.visualize)
+        with tracer.span("policy_queries", i, queries=len(important_states)):
+            state_actions_to_trim = test_all_states(env, policy, important_states, args.visualize, observation_table, action_table)
 
         all_test_results.append(test_result)
         test_result.updateStateStatistics(iterationResult.stateStatistics(), numQueries)
@@ -540,9 +537,11 @@ def main():
             print(abs(test_result.init_check_opt_avg - test_result.init_check_pes_avg) == 0)
             print(test_result.all_states_tested > 0)
             print(len(env.state_ranking) == 0)
-            if plotting: env.plotTestedStates(prism_file_name, bound, iterationResult)
-            #env.plotTestedStatesMap(prism_file_name, bound, previousTestedTiles, previous_important_states, states_values_dict, previousImpliedTiles, args.threshold)
-            if plotting: env.previousFixedStates = plot_heatmaps(env, prism_file_name, bound, rewardStructure, previousFixedStates, state_actions_to_trim, states_values_dict, 1, i)
+            if plotting:
+                with tracer.span("plotting", i):
+                    env.plotTestedStates(prism_file_name, bound, iterationResult)
+                    #env.plotTestedStatesMap(prism_file_name, bound, previousTestedTiles, previous_important_states, states_values_dict, previousImpliedTiles, args.threshold)
+                    env.previousFixedStates = plot_heatmaps(env, prism_file_name, bound, rewardStructure, previousFixedStates, state_actions_to_trim, states_values_dict, store, 1, i)
             print("... Aborting!")
             break
 
@@ -556,14 +555,30 @@ def main():
         #    test_result.count_undecided_states = total_states_to_be_tested - test_result.count_proven_failure_states - test_result.count_proven_good_states
 
         i += 1
-        previous_file_name = prism_file_name
-        prism_file_name = f"{envname}_trimmed_{i:03}"
-        update_prism_file(env, previous_file_name, state_actions_to_trim, decided_states, prism_file_name) # restrictMDP
+        # the rest of the loop still belongs to the iteration just tested, i - 1
+        with tracer.span("restriction", i - 1, restricted_pairs=len(state_actions_to_trim)):
+            # every model is written from the unrestricted one with the restrictions of all iterations so far
+            if file_restriction is None: file_restriction = ExplicitRestriction(explicit_model, rewardStructure) if args.explicit else PrismRestriction(store.path(prism_file_name))
+            file_restriction.add(env, state_actions_to_trim)
+            if worker is None or not restriction.send(worker, env, state_actions_to_trim, decided_states): # restrictMDP
+                previous_file_name = prism_file_name
+                prism_file_name = f"{envname}_trimmed_{i:03}"
+                file_restriction.write(decided_states, store.path(prism_file_name))
+                if checker is not None: checker.restrict(file_restriction.choice_mask(), file_restriction.decided)
+                store.tag(i - 1, previous_file_name)
+            if worker is not None and restriction.unmatched:
+                # the worker can only keep choices of its model, the rewritten model has the self loops of the other paths
+                LOG(f"> {len(restriction.unmatched)} tested states have no matching choice, restarting the worker on {prism_file_name}")
+                worker.close()
+                worker = TempestWorker(tempest_arguments(store.path(prism_file_name), args.binary_results, args.explicit), tempest_properties(bound, rewardStructure, args.threshold, args.safety, args.explicit), cwd=store.root)
+                restriction = None
         states_values.append(states_values_dict)
 
         #print("Start plotting ... ", end=""); sys.stdout.flush()
-        if plotting: previousFixedStates = plot_heatmaps(env, prism_file_name, bound, rewardStructure, previousFixedStates, state_actions_to_trim, states_values_dict, 1, i)
-        if plotting: env.plotTestedStates(prism_file_name, bound, iterationResult)
+        if plotting:
+            with tracer.span("plotting", i - 1):
+                previousFixedStates = plot_heatmaps(env, prism_file_name, bound, rewardStructure, previousFixedStates, state_actions_to_trim, states_values_dict, store, 1, i)
+                env.plotTestedStates(prism_file_name, bound, iterationResult)
         #print("... Done", end="")
 
         nextIterationResult = StateSet(i)
@@ -574,6 +589,8 @@ def main():
         nextIterationResult.totalTestStates = iterationResult.totalTestStates
         iterationResult = nextIterationResult
         previous_important_states = important_states
+        with tracer.span("file_moves", i - 1):
+            store.end_iteration(i - 1)
         #input("")
 
     final_test_results = list()
@@ -591,11 +608,18 @@ def main():
             file.write(test_result.csv(ws=" "))
             file.write("\n")
             print(i, "\t\t", test_result.csv(ws="\t\t"))
-    if plotting: system(f"lualatex -shell-escape boilerplate_tikz.tex --jobname {dest_directory}")
+    if plotting:
+        with tracer.span("plotting"):
+            if plotter is not None: plotter.close()
+            system(f"lualatex -shell-escape boilerplate_tikz.tex --jobname {dest_directory}")
 
     env.close()
+    if worker is not None: worker.close()
     LOG("> Finished Application!")
-    move_files(envname, i, dest_directory, plotting)
+    with tracer.span("file_moves"):
+        move_files(envname, i, dest_directory, plotter)
+        store.finish(i, os.path.join(dest_directory, "artifacts"))
+    if args.trace: tracer.write(os.path.join(dest_directory, "trace.json"), os.path.join(dest_directory, "trace.csv"))
 
 
 
@@ -0,0 +1,201 @@
+import argparse, os, sys
+import numpy as np
+from dataclasses import astuple
+
+from gym_minigrid.tempest_results import VALUATIONS_FILE
+
+# tempest's default precision of (unbounded) value iteration
+PRECISION = 1e-6
+
+# the envs validate() compares on by default, the ones of experiments.json
+ENVS = ["MyCliffWalking-S9-v0", "Barcelona-v0"]
+
+
+class SparseModelChecker:
+    """
+    Answers the properties call_tempest asks tempest for in-process, by value
+    iteration with sparse matrix-vector products over the ExplicitModel the env
+    exports. Like tempest with --binaryresults it writes the per-state values
+    of the bounded cumulative rewards and the ranking of the choices of the
+    maximum (computeStateActionRanking), and returns the values of the filters.
+    The reward filters also leave out the states of excluded_label.
+
+    With warm_start, the safety probabilities start from the values of the
+    previous check as long as the restrictions only removed choices since.
+    sweeps counts the sweeps of the last check and, with count_cold, saved
+    how many fewer they were than from zero.
+    """
+    def __init__(self, model, reward_structure, excluded_label=None, warm_start=False, count_cold=False):
+        self.model = model
+        self.warm_start, self.count_cold = warm_start, count_cold
+        # P min=? [ F lava ] of the previous check
+        self.previous, self.sweeps, self.saved = None, 0, None
+        self.num_states = len(model.choices)
+        rows, targets, probabilities, labels = list(), list(), list(), list()
+        for choice, (label, transitions) in enumerate(choice for choices in model.choices for choice in choices):
+            rows += [choice] * len(transitions)
+            targets += list(transitions)
+            probabilities += list(transitions.values())
+            labels.append(label or "")
+        self.rows, self.targets, self.probabilities = np.array(rows), np.array(targets), np.array(probabilities, dtype=float)
+        self.labels = np.array(labels)
+        self.choice_states = np.repeat(np.arange(self.num_states), [len(choices) for choices in model.choices])
+        self.state_rewards = model.rewards[reward_structure]
+        mask = lambda label: np.isin(np.arange(self.num_states), model.labels.get(label, []))
+        self.lava, self.goal = mask("AgentIsInLava"), mask("AgentIsInGoal")
+        # !"AgentIsInLava" & !"AgentIsInGoal", and the states of the reward filters
+        self.live = ~self.lava & ~self.goal
+        self.reward_states = ~(mask("AgentCannotTurn") | mask("AgentIsOnOneWay")) & ~mask(excluded_label)
+        self.restrict()
+
+    def restrict(self, choice_mask=None, decided=()):
+        """Keeps the choices of choice_mask (one flag per choice of the model, all by default) and labels the state indices decided as decidedStates."""
+        choice_mask = np.ones(len(self.labels), dtype=bool) if choice_mask is None else np.asarray(choice_mask, dtype=bool)
+        # with fewer choices P min=? [ F lava ] can only grow, the previous values stay a lower bound
+        if self.previous is not None and np.any(choice_mask & ~self.choice_mask): self.previous = None
+        self.choice_mask = choice_mask
+        kept = np.flatnonzero(self.choice_mask)
+        # renumber the kept choices, tempest's restrictRows does the same
+        choice_index = np.full(len(self.labels), -1)
+        choice_index[kept] = np.arange(len(kept))
+        entries = self.choice_mask[self.rows]
+        self.matrix = (choice_index[self.rows[entries]], self.targets[entries], self.probabilities[entries])
+        self.row_groups = np.concatenate(([0], np.cumsum(np.bincount(self.choice_states[kept], minlength=self.num_states))))
+        if np.any(np.diff(self.row_groups) == 0): raise ValueError("the choice mask leaves a state without choices.")
+        self.choice_rewards = self.state_rewards[self.choice_states[kept]]
+        self.choice_labels = self.labels[kept]
+        self.decided = np.zeros(self.num_states, dtype=bool)
+        self.decided[list(decided)] = True
+
+    def multiply(self, x, b=None):
+        """The value of every kept choice, b + P·x."""
+        rows, targets, probabilities = self.matrix
+        values = np.bincount(rows, weights=probabilities * x[targets], minlength=len(self.choice_rewards))
+        return values if b is None else values + b
+
+    def reduce(self, choice_values, maximize):
+        return (np.maximum if maximize else np.minimum).reduceat(choice_values, self.row_groups[:-1])
+
+    def cumulative_rewards(self, bound, maximize):
+        """R min/max=? [ C<=bound ] per state and the choice values of its last step, like repeatedMultiplyAndReduceWithChoices."""
+        values, choice_values = np.zeros(self.num_states), np.zeros(len(self.choice_rewards))
+        for _ in range(bound):
+            choice_values = self.multiply(values, self.choice_rewards)
+            values = self.reduce(choice_values, maximize)
+        return values, choice_values
+
+    def reachability(self, target, maximize, lower=None):
+        """
+        P min/max=? [ F target ] per state and the number of sweeps, iterated
+        until no state changes by more than PRECISION. Starts from lower, which
+        has to be below the result for the iteration to reach the least fixpoint.
+        """
+        values = np.where(target, 1.0, 0.0 if lower is None else lower)
+        sweeps = 0
+        while True:
+            next_values = np.where(target, 1.0, self.reduce(self.multiply(values), maximize))
+            sweeps += 1
+            if np.max(np.abs(next_values - values), initial=0.0) <= PRECISION: return next_values, sweeps
+            values = next_values
+
+    def safety(self):
+        """P min/max=? [ G !lava ] per state, the complements of P max/min=? [ F lava ]."""
+        warm = self.warm_start and self.previous is not None
+        reach_min, min_sweeps = self.reachability(self.lava, False, self.previous if warm else None)
+        # the minimum is a lower bound of the maximum
+        reach_max, max_sweeps = self.reachability(self.lava, True, reach_min if warm else None)
+        self.sweeps = min_sweeps + max_sweeps
+        self.saved = None
+        if self.count_cold:
+            # the same check from zero, only to count its sweeps
+            self.saved = self.reachability(self.lava, False)[1] + self.reachability(self.lava, True)[1] - self.sweeps if warm else 0
+        self.previous = reach_min
+        return 1 - reach_max, 1 - reach_min
+
+    def ranking(self, choice_values):
+        """computeStateActionRanking: the spread of the choice values of every state, normalized over all states."""
+        spread = np.maximum.reduceat(choice_values, self.row_groups[:-1]) - np.minimum.reduceat(choice_values, self.row_groups[:-1])
+        span = spread.max() - spread.min()
+        return (spread - spread.min()) / span if span != 0 else np.zeros(self.num_states)
+
+    def write(self, directory, min_values, max_values, choice_values):
+        """Writes the files tempest writes with --binaryresults into directory."""
+        np.save(os.path.join(directory, "results_minimize.npy"), min_values)
+        np.save(os.path.join(directory, "results_maximize.npy"), max_values)
+        np.save(os.path.join(directory, "action_ranking.npy"), self.ranking(choice_values))
+        np.save(os.path.join(directory, "action_ranking_choices.npy"), choice_values)
+        np.save(os.path.join(directory, "action_ranking_row_groups.npy"), self.row_groups.astype(np.uint64))
+        np.save(os.path.join(directory, "action_ranking_labels.npy"), self.choice_labels.astype(f"S{max(1, max(map(len, self.choice_labels)))}"))
+        np.save(os.path.join(directory, VALUATIONS_FILE), self.model.valuations)
+
+    def check(self, bound, threshold, safety=False, directory="."):
+        """The ten filter values call_tempest reads from the output of tempest_properties, in the same order."""
+        min_values, _ = self.cumulative_rewards(bound, False)
+        max_values, choice_values = self.cumulative_rewards(bound, True)
+        if safety:
+            # G !lava is the complement of F lava, with the opposite optimization direction
+            estimates, states = list(self.safety()), self.live
+        else:
+            estimates, states = [min_values, max_values], self.reward_states
+        results = list()
+        for values in estimates:
+            values = values[states]
+            results += [values.min(), values.max(), values.mean()] if len(values) > 0 else [np.nan] * 3
+        live = self.live
+        results += [float(self.decided[live].all()), np.count_nonzero(~self.decided & live)]
+        results += [np.count_nonzero((max_values < threshold) & live), np.count_nonzero((min_values >= threshold) & live)]
+        self.write(directory, min_values, max_values, choice_values)
+        return [float(value) for value in results]
+
+
+def validate(env_name, reward_structure, bound, threshold, safety, directory):
+    """
+    Checks the explicit model of env_name with tempest and with the numpy
+    backend, each in its own subdirectory of directory, and returns the
+    largest difference of the filter values, the per-state results and the
+    action ranking.
+    """
+    # test_model imports this module, it is only needed here
+    from test_model import EXCLUDED_CELL, EXCLUDED_CELL_LABEL, call_tempest, make_env
+    env = make_env(env_name)
+    env.reset()
+    runs = dict()
+    for backend in ("tempest", "numpy"):
+        backend_directory = os.path.abspath(os.path.join(directory, backend))
+        os.makedirs(backend_directory, exist_ok=True)
+        filename = os.path.join(backend_directory, "model")
+        model = env.unwrapped.export_explicit(filename, reward_structure, {EXCLUDED_CELL_LABEL: [EXCLUDED_CELL]})
+        checker = SparseModelChecker(model, reward_structure, EXCLUDED_CELL_LABEL) if backend == "numpy" else None
+        result = call_tempest(filename, bound, reward_structure, threshold, safety=safety, binary=True, directory=backend_directory, explicit=True, checker=checker)
+        files = {name: np.load(os.path.join(backend_directory, f"{name}.npy")) for name in ("results_minimize", "results_maximize", f"action_ranking_{bound}", f"action_ranking_{bound}_choices")}
+        runs[backend] = (astuple(result), files)
+    (tempest_result, tempest_files), (numpy_result, numpy_files) = runs["tempest"], runs["numpy"]
+    differences = {"filters": np.nanmax(np.abs(np.subtract(tempest_result, numpy_result)))}
+    for name in tempest_files:
+        if tempest_files[name].shape != numpy_files[name].shape: raise ValueError(f"{name} has {tempest_files[name].shape} entries from tempest but {numpy_files[name].shape} from the numpy backend.")
+        differences[name] = np.max(np.abs(tempest_files[name] - numpy_files[name]), initial=0.0)
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the numpy backend with tempest on the explicit models of the envs.")
+    parser.add_argument('--envs', type=str, nargs="+", required=False, default=ENVS, help='(optional) Envs to compare on, defaults to the envs of the experiments.')
+    parser.add_argument('--reward', type=str, required=False, default="SafetyNoBFS", help='(optional) Reward Structure, defaults to SafetyNoBFS')
+    parser.add_argument('--bound', type=int, required=False, default=100, help='(optional) Cumulative Reward Bound, defaults to 100')
+    parser.add_argument('--threshold', type=float, required=False, default=0, help='The threshold delta_varphi.')
+    parser.add_argument('--safety', action='store_true', required=False, default=False, help='Compare the safety estimates instead of performance.')
+    parser.add_argument('--dir', type=str, required=False, default="validation", help='(optional) Directory for the models and results, defaults to validation.')
+    parser.add_argument('--tolerance', type=float, required=False, default=10 * PRECISION, help='(optional) Largest accepted difference, defaults to 10 times the precision of value iteration.')
+    args = parser.parse_args()
+    matching = True
+    for env_name in args.envs:
+        differences = validate(env_name, args.reward, args.bound, args.threshold, args.safety, os.path.join(args.dir, env_name))
+        for name, difference in differences.items():
+            print(f"{env_name}\t{name}\t{difference:.3g}")
+            matching &= bool(difference <= args.tolerance)
+    print("numpy backend matches tempest" if matching else "numpy backend differs from tempest")
+    return matching
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -9,6 +9,11 @@ import argparse
 from translate import translateTransitions, readLabels
 #from plotting import VisVisPlotter # DISABLED IN DOCKER IMAGE
 from simulation import Simulator, Verdict
+# tempest.py, artifacts.py and tracing.py are shared with the other driver
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "common"))
+from tempest import TempestWorker
+from artifacts import ArtifactStore, ARTIFACT_ROOT
+from tracing import Tracer
 
 import time
 
@@ -38,6 +43,12 @@ def traFileWithIteration(filename, iteration):
 def copyFile(filename, newFilename):
     shutil.copy(filename, newFilename)
 
+def copyResults(filename, newFilename):
+    # with --binaryresults tempest writes filename.npy (and the _choices/_row_groups/_labels companions of the ranking)
+    for part in ["", "_choices", "_row_groups", "_labels"]:
+        if os.path.exists(f"{filename}{part}.npy"): copyFile(f"{filename}{part}.npy", f"{newFilename}{part}.npy")
+    if os.path.exists(filename): copyFile(filename, newFilename)
+
 
 def execute(command, verbose=False):
     if verbose: print(f"Executing {command}")
@@ -99,7 +110,7 @@ def queryStrategy(strategy, stateId):
         return -1
 
 
-def callTempest(files, reward, bound=3):
+def tempestProperties(bound=3):
     property_str = "!(\"failed\" | \"reached\")"
     if True:
         prop =  f"filter(min, Pmax=? [ true U<={bound} \"failed\" ], {property_str} );"
@@ -117,11 +128,24 @@ def callTempest(files, reward, bound=3):
         prop += f"filter(min, Rmax=? [ C<={bound} ], {property_str}  );"
         prop += f"filter(max, Rmax=? [ C<={bound} ], {property_str}  );"
         prop += f"filter(avg, Rmax=? [ C<={bound} ], {property_str}  );"
-    command = f"{TEMPEST_BINARY} --io:explicit {files} --io:staterew MDP_Abstraction_interval.lab.{reward} --prop '{prop}' "
+    return prop
+
+def tempestArguments(files, reward, binaryResults=False):
+    # absolute paths, tempest runs inside the artifact directory of the run
+    arguments = ["--io:explicit", *files.split(), "--io:staterew", os.path.abspath(f"MDP_Abstraction_interval.lab.{reward}")]
+    if binaryResults: arguments.append("--binaryresults")
+    return arguments
+
+def callTempest(files, reward, bound=3, worker=None, binaryResults=False, directory="."):
+    prop = tempestProperties(bound)
+    command = f"{TEMPEST_BINARY} {' '.join(tempestArguments(files, reward, binaryResults))} --prop '{prop}' "
 
     results = list()
     try:
-        output = subprocess.check_output(command, shell=True).decode("utf-8").split('\n')
+        if worker is None:
+            output = subprocess.check_output(command, shell=True, cwd=directory).decode("utf-8").split('\n')
+        else:
+            output = worker.check(prop)
         for line in output:
             if "Result" in line and not len(results) >= 10:
                 range_value = re.search(r"(.*:).*\[(-?\d+\.?\d*), (-?\d+\.?\d*)\].*", line)
@@ -137,19 +161,32 @@ def callTempest(files, reward, bound=3):
     #results.append(-1)
     return TestResult(*(tuple(results)))
 
+def loadRanking(filename, allStates):
+    state_ranking = dict()
+    rankingValues = np.load(f"{filename}.npy", mmap_mode="r")
+    choiceValues = np.load(f"{filename}_choices.npy", mmap_mode="r")
+    rowGroups = np.load(f"{filename}_row_groups.npy", mmap_mode="r")
+    for stateId, ranking_value in enumerate(rankingValues.tolist()):
+        choices = dict(enumerate(choiceValues[rowGroups[stateId]:rowGroups[stateId+1]].tolist()))
+        state_ranking[allStates[stateId]] = StateValue(ranking_value, choices)
+    return state_ranking
+
 def parseRanking(filename, allStates):
     state_ranking = dict()
     try:
-        with open(filename, "r") as f:
-            filecontent = f.readlines()
-        for line in filecontent:
-            stateId = int(re.findall(r"^\d+", line)[0])
-            values = re.findall(r":(-?\d+\.?\d*),?", line)
-            ranking_value = float(values[0])
-            choices = {i : float(value) for i,value in enumerate(values[1:])}
-            state = allStates[stateId]
-            value = StateValue(ranking_value, choices)
-            state_ranking[state] = value
+        if os.path.exists(f"{filename}.npy"):
+            state_ranking = loadRanking(filename, allStates)
+        else:
+            with open(filename, "r") as f:
+                filecontent = f.readlines()
+            for line in filecontent:
+                stateId = int(re.findall(r"^\d+", line)[0])
+                values = re.findall(r":(-?\d+\.?\d*),?", line)
+                ranking_value = float(values[0])
+                choices = {i : float(value) for i,value in enumerate(values[1:])}
+                state = allStates[stateId]
+                value = StateValue(ranking_value, choices)
+                state_ranking[state] = value
         if len(state_ranking) == 0: return
         all_values = [x.ranking for x in state_ranking.values()]
         max_value = max(all_values)
@@ -184,9 +221,17 @@ def parseStateValuations(filename):
     all_states[maxStateId + 1] = State(*dummy_values)
     return all_states
 
-def parseResults(allStates):
+def parseResults(allStates, directory="."):
     state_to_values = dict()
-    with open("prob_results_maximize") as maximizer, open("prob_results_minimize") as minimizer:
+    maximizerFile, minimizerFile = os.path.join(directory, "prob_results_maximize"), os.path.join(directory, "prob_results_minimize")
+    if os.path.exists(f"{maximizerFile}.npy"):
+        maxValues = np.load(f"{maximizerFile}.npy", mmap_mode="r")
+        minValues = np.load(f"{minimizerFile}.npy", mmap_mode="r")
+        if len(maxValues) != len(minValues):
+            print("min/max files do not match.")
+            assert(False)
+        return {stateId: (min_result, max_result, max_result - min_result) for stateId, (min_result, max_result) in enumerate(zip(minValues.tolist(), maxValues.tolist()))}
+    with open(maximizerFile) as maximizer, open(minimizerFile) as minimizer:
         for max_line, min_line in zip(maximizer, minimizer):
             max_values = re.findall(r"(-?\d+\.?\d*),?", max_line)
             min_values = re.findall(r"(-?\d+\.?\d*),?", min_line)
@@ -237,18 +282,23 @@ def getNRandomStates(rankedStates, n, testedStates):
     else:
         return notYetTestedStates
 
-def main(traFile, labFile, straFile, horizonBound, refinementSteps, refinementBound, ablationTesting, plotting=False, stepwisePlotting=False):
+def main(traFile, labFile, straFile, horizonBound, refinementSteps, refinementBound, ablationTesting, plotting=False, stepwisePlotting=False, useWorker=False, binaryResults=False, retention="all", artifactRoot=ARTIFACT_ROOT, tracer=None):
+    tracer = tracer if tracer is not None else Tracer()
 
-    all_states = parseStateValuations("MDP_state_valuations")
-    deadlockStates, reachedStates, maxStateId = readLabels(labFile)
-    stateToActions, allStateActionPairs = translateTransitions(traFile, deadlockStates, reachedStates, maxStateId)
-    strategy = parseStrategy(straFile, stateToActions)
+    with tracer.span("translation") as span:
+        all_states = parseStateValuations("MDP_state_valuations")
+        deadlockStates, reachedStates, maxStateId = readLabels(labFile)
+        stateToActions, allStateActionPairs = translateTransitions(traFile, deadlockStates, reachedStates, maxStateId)
+        strategy = parseStrategy(straFile, stateToActions)
+        span["states"] = len(all_states)
 
     #if plotting: plotter = VisVisPlotter(all_states, reachedStates, deadlockStates, stepwisePlotting) # DISABLED IN DOCKER IMAGE
     #if plotting: plotter.plotScenario() # DISABLED IN DOCKER IMAGE
 
 
-    copyFile("MDP_" + traFile, "MDP_" + os.path.splitext(getBasename(traFile))[0] + f"_000.tra")
+    store = ArtifactStore(os.path.splitext(getBasename(traFile))[0], retention, artifactRoot)
+    labels = os.path.abspath(f"MDP_{labFile}")
+    copyFile("MDP_" + traFile, store.path(traFileWithIteration("MDP_" + getBasename(traFile), 0)))
 
     iteration = 0
     #testsPerIteration = refinementSteps
@@ -257,63 +307,89 @@ def main(traFile, labFile, straFile, horizonBound, refinementSteps, refinementBo
     totalIterations = 52
 
     testedStates = list()
+    worker = None
+    if useWorker:
+        # the restrictions are applied inside the worker, the _000 transition file is the only one tempest reads
+        worker = TempestWorker(tempestArguments(f"{store.path(traFileWithIteration('MDP_' + getBasename(traFile), 0))} {labels}", "saferew", binaryResults), tempestProperties(horizonBound), cwd=store.root)
     while iteration < totalIterations:
         print(f"{iteration:03}", end="\t")
         sys.stdout.flush()
-        currentTraFile = traFileWithIteration("MDP_" + traFile, iteration)
-        nextTraFile = traFileWithIteration("MDP_" + traFile, iteration+1)
-        testResult = callTempest(f"{currentTraFile} MDP_{labFile}",  "saferew", horizonBound)
-        state_ranking = parseRanking("action_ranking", all_states)
-        copyFile("action_ranking", f"action_ranking_{iteration:03}")
-        copyFile("prob_results_maximize", f"prob_results_maximize_{iteration:03}")
-        copyFile("prob_results_minimize", f"prob_results_minimize_{iteration:03}")
-
-        if not ablationTesting:
-            importantStates = getTopNStates(state_ranking, refinementSteps, refinementBound)
-            statesToTest = [state.id for state in importantStates.keys()]
-            statesToPlot = importantStates
-        else:
-            statesToTest = list(getNRandomStates(state_ranking, refinementSteps, testedStates))
-            testedStates += statesToTest
-            statesToPlot = {all_states[stateId]:StateValue(0,{}) for stateId in statesToTest}
-
-
-        copyFile(currentTraFile, nextTraFile)
-        stateActionPairsToTrim = dict()
-        for testState in statesToTest:
-            chosenActionIndex = queryStrategy(strategy, testState)
-            if chosenActionIndex != -1:
-                stateActionPairsToTrim[testState] = chosenActionIndex
-        stateEstimates = parseResults(all_states)
+        currentTraFile = store.path(traFileWithIteration("MDP_" + getBasename(traFile), iteration))
+        nextTraFile = store.path(traFileWithIteration("MDP_" + getBasename(traFile), iteration+1))
+        with tracer.span("tempest", iteration):
+            testResult = callTempest(f"{currentTraFile} {labels}",  "saferew", horizonBound, worker, binaryResults, store.root)
+        with tracer.span("ranking", iteration) as span:
+            state_ranking = parseRanking(store.path("action_ranking"), all_states)
+            span["ranked_states"] = len(state_ranking or ())
+        with tracer.span("file_moves", iteration):
+            for results in ["action_ranking", "prob_results_maximize", "prob_results_minimize"]:
+                copyResults(store.path(results), store.path(f"{results}_{iteration:03}"))
+                store.tag(iteration, f"{results}_{iteration:03}")
+
+        with tracer.span("state_selection", iteration):
+            if not ablationTesting:
+                importantStates = getTopNStates(state_ranking, refinementSteps, refinementBound)
+                statesToTest = [state.id for state in importantStates.keys()]
+                statesToPlot = importantStates
+            else:
+                statesToTest = list(getNRandomStates(state_ranking, refinementSteps, testedStates))
+                testedStates += statesToTest
+                statesToPlot = {all_states[stateId]:StateValue(0,{}) for stateId in statesToTest}
+
+
+        if worker is None:
+            with tracer.span("file_moves", iteration): copyFile(currentTraFile, nextTraFile)
+        with tracer.span("policy_queries", iteration, queries=len(statesToTest)):
+            stateActionPairsToTrim = dict()
+            for testState in statesToTest:
+                chosenActionIndex = queryStrategy(strategy, testState)
+                if chosenActionIndex != -1:
+                    stateActionPairsToTrim[testState] = chosenActionIndex
+        with tracer.span("parse_results", iteration) as span:
+            stateEstimates = parseResults(all_states, store.root)
+            span["states"] = len(stateEstimates)
         results = [0,0,0]
 
         failureStates = list()
         validatedStates = list()
-        for state, estimates in stateEstimates.items():
-            if state in deadlockStates or state in reachedStates:
-                continue
-            if estimates[0] > 0.05:
-                results[1] += 1
-                failureStates.append(all_states[state])
-                #print(f"{state}: {estimates}")
-            elif estimates[1] <= 0.05:
-                results[0] += 1
-                validatedStates.append(all_states[state])
-            else:
-                results[2] += 1
+        with tracer.span("state_selection", iteration):
+            for state, estimates in stateEstimates.items():
+                if state in deadlockStates or state in reachedStates:
+                    continue
+                if estimates[0] > 0.05:
+                    results[1] += 1
+                    failureStates.append(all_states[state])
+                    #print(f"{state}: {estimates}")
+                elif estimates[1] <= 0.05:
+                    results[0] += 1
+                    validatedStates.append(all_states[state])
+                else:
+                    results[2] += 1
 
 
-        removeActionsFromTransitionFile(stateActionPairsToTrim, nextTraFile, iteration)
+        with tracer.span("restriction", iteration, restricted_pairs=len(stateActionPairsToTrim)):
+            if worker is None:
+                removeActionsFromTransitionFile(stateActionPairsToTrim, nextTraFile, iteration)
+                store.tag(iteration, getBasename(os.path.splitext(currentTraFile)[0]))
+            else:
+                worker.fix(stateActionPairsToTrim.items())
         print(f"{numTestedStates}\t{testResult.csv(' ')}\t{results[0]}\t{results[1]}\t{results[2]}\t{sum(results)}")
         if results[2] == 0:
+            if worker is not None: worker.close()
+            with tracer.span("file_moves"): store.finish(iteration)
             toc()
             sys.exit(0)
         numTestedStates += len(statesToTest)
         iteration += 1
+        with tracer.span("file_moves", iteration - 1):
+            store.end_iteration(iteration - 1)
 
-        if plotting: plotter.plotStates(failureStates, coloring=(0.8,0.0,0.0,0.6), removeMeshes=True)
-        if plotting: plotter.plotStates(validatedStates, coloring=(0.0,0.8,0.0,0.6))
-        if plotting: plotter.takeScreenshot(iteration, prefix="stepwise_0.05")
+        if plotting:
+            with tracer.span("plotting", iteration - 1):
+                plotter.plotStates(failureStates, coloring=(0.8,0.0,0.0,0.6), removeMeshes=True)
+                plotter.plotStates(validatedStates, coloring=(0.0,0.8,0.0,0.6))
+                plotter.takeScreenshot(iteration, prefix="stepwise_0.05")
+    with tracer.span("file_moves"): store.finish(iteration)
 
 def randomTesting(traFile, labFile, straFile, bound, maxQueries, plotting=False):
     all_states = parseStateValuations("MDP_state_valuations")
@@ -366,6 +442,11 @@ def parseArgs():
     random_testing.add_argument('-a', '--ablation', action='store_true', help="(optional) Run ablation testing for the importance ranking, i.e. model-based random testing.")
     random_testing.add_argument('-r', '--random', type=int, default=0, help='(optional) The amount of queries allowed for random testing.')
 
+    parser.add_argument('--worker', action='store_true', help='(optional) Keep a single tempest process alive for the whole run instead of starting one per iteration.')
+    parser.add_argument('--binary-results', action='store_true', help='(optional) Let tempest write per-state results and the action ranking as .npy files and memory-map them instead of parsing text.')
+    parser.add_argument('--artifact-root', type=str, default=ARTIFACT_ROOT, help='(optional) Directory (e.g. on tmpfs) in which every run gets its own directory for the intermediate files, defaults to $ARTIFACT_ROOT or artifacts.')
+    parser.add_argument('--retention', type=str, default="all", help='(optional) Which intermediate files of past iterations to keep: all, last:N, final or compressed, defaults to all.')
+    parser.add_argument('--trace', action='store_true', help='(optional) Write the time spent in every phase of the loop as a Chrome trace (trace.json) and per iteration (trace.csv) into the working directory.')
     parser.add_argument('-p', '--plotting', action='store_true', help='(optional) Enable plotting.')
     parser.add_argument('--stepwise', action='store_true', help='(optional) Remove states before plotting the next iteration.')
     return parser.parse_args()
@@ -389,9 +470,10 @@ if __name__ == '__main__':
     refinementBound = args.refinement_bound
 
     tic()
+    tracer = Tracer()
     try:
         if maxQueriesForRandomTesting == 0: #awkward way to test for this...
-            main(traFile, labFile, straFile, horizonBound, refinementSteps, refinementBound, ablationTesting, plotting, stepwisePlotting)
+            main(traFile, labFile, straFile, horizonBound, refinementSteps, refinementBound, ablationTesting, plotting, stepwisePlotting, args.worker, args.binary_results, args.retention, args.artifact_root, tracer)
         else:
             randomTesting(traFile, labFile, straFile, horizonBound, maxQueriesForRandomTesting, plotting)
 
@@ -399,4 +481,6 @@ if __name__ == '__main__':
         pass
     except Exception as e:
         print(e)
+    # main exits from inside the loop once all states are decided, the spans are written here
+    if args.trace: tracer.write()
     toc() ## FIXME!
@@ -0,0 +1,66 @@
+import gzip, os, shutil, time
+
+# e.g. ARTIFACT_ROOT=/dev/shm/imt keeps the intermediate files of all runs on tmpfs
+ARTIFACT_ROOT=os.environ.get("ARTIFACT_ROOT", "artifacts")
+
+RETENTION_POLICIES = ["all", "final", "compressed", "last:N"]
+
+
+def parse_retention(retention):
+    if retention in ("all", "final", "compressed"):
+        return retention, 1
+    policy, _, n = retention.partition(":")
+    if policy != "last" or not n.isdigit() or int(n) < 1:
+        raise ValueError(f"Unknown retention policy {retention}, expected one of {', '.join(RETENTION_POLICIES)}")
+    return policy, int(n)
+
+
+class ArtifactStore:
+    """
+    Directory holding the intermediate files of one run (model copies, tempest
+    output, per-iteration archives), so concurrent runs never share files.
+
+    Files that are not needed anymore are tagged with their iteration and pruned
+    at the end of every iteration according to the retention policy: "all"
+    keeps everything, "last:N" the files of the last N iterations, "final" only
+    those of the last iteration and "compressed" keeps everything gzipped.
+    """
+    def __init__(self, name, retention="all", root=ARTIFACT_ROOT):
+        self.policy, self.keep = parse_retention(retention)
+        self.root = os.path.abspath(os.path.join(os.path.expanduser(root), f"{name}_{int(time.time())}_{os.getpid()}"))
+        os.makedirs(self.root)
+        self.tagged = dict()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def files(self, name):
+        # name itself and the files derived from it (name.prism, name_choices.npy, ...), but not name_10 for name_1
+        return [f for f in os.listdir(self.root) if f == name or f.startswith(name + ".") or (f.startswith(name + "_") and not f[len(name) + 1:len(name) + 2].isdigit())]
+
+    def tag(self, iteration, *names):
+        """Marks the files of the given names as belonging to iteration and no longer being written or read by the run."""
+        for name in names:
+            self.tagged.setdefault(iteration, set()).update(self.files(name))
+
+    def end_iteration(self, iteration):
+        if self.policy == "compressed":
+            for files in self.tagged.values():
+                for f in [f for f in files if not f.endswith(".gz")]:
+                    with open(self.path(f), "rb") as src, gzip.open(self.path(f + ".gz"), "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(self.path(f))
+                    files.remove(f)
+                    files.add(f + ".gz")
+        elif self.policy in ("last", "final"):
+            for tagged_iteration in [i for i in self.tagged if i <= iteration - self.keep]:
+                for f in self.tagged.pop(tagged_iteration):
+                    if os.path.exists(self.path(f)): os.remove(self.path(f))
+
+    def finish(self, iteration, destination=None):
+        """Applies the retention policy a last time and moves the run directory to destination (if given)."""
+        self.end_iteration(iteration)
+        if destination is not None and os.path.abspath(destination) != self.root:
+            shutil.move(self.root, destination)
+            self.root = os.path.abspath(destination)
+        return self.root
@@ -0,0 +1,75 @@
+import os, subprocess
+
+TEMPEST_BINARY=os.environ.get("TEMPEST_BINARY", "~/projects/tempest-devel/ranking_release/bin/storm")
+
+# tempest prints this line after it finished answering a command in --worker mode
+DONE_MARKER = "<<done>>"
+
+
+class TempestWorker:
+    """
+    One tempest process that stays alive for the whole run.
+
+    The model is parsed and built once; property batches and restrictions
+    (keep a single choice per state) are sent over stdin and the output is
+    read back from stdout, instead of starting a new process per iteration.
+    """
+    def __init__(self, model_args, properties, binary=TEMPEST_BINARY, cwd=None):
+        command = [os.path.expanduser(binary)] + list(model_args) + ["--prop", properties, "--worker"]
+        # tempest writes its result files (action_ranking, results_*) into its working directory
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1, cwd=cwd)
+        # the properties given on the command line are checked right away,
+        # keep that output for the first check() of the same properties
+        self.pending = (properties, self._read_output())
+
+    def _send(self, command):
+        self.process.stdin.write(command + "\n")
+        self.process.stdin.flush()
+        return self._read_output()
+
+    def _read_output(self):
+        lines = list()
+        for line in self.process.stdout:
+            line = line.rstrip("\n")
+            if line == DONE_MARKER:
+                return lines
+            lines.append(line)
+        raise RuntimeError(f"tempest worker exited with code {self.process.wait()}")
+
+    def check(self, properties):
+        if self.pending is not None and self.pending[0] == properties:
+            lines = self.pending[1]
+            self.pending = None
+            return lines
+        self.pending = None
+        return self._send(f"check {properties}")
+
+    def fix(self, state_choices):
+        """Keep only the given choice (index local to the state, as in the unrestricted model) for each (state, choice)."""
+        pairs = " ".join(f"{state}:{choice}" for state, choice in state_choices)
+        if not pairs: return list()
+        self.pending = None
+        return self._send(f"fix {pairs}")
+
+    def label(self, name, states):
+        """Add the given state indices to the state label name."""
+        states = " ".join(str(state) for state in states)
+        if not states: return list()
+        self.pending = None
+        return self._send(f"label {name} {states}")
+
+    def reset(self):
+        self.pending = None
+        return self._send("reset")
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.write("quit\n")
+            self.process.stdin.close()
+            self.process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,56 @@
+import csv, json, os, threading, time
+from contextlib import contextmanager
+
+# phases of an IMT iteration, in the order of the columns of the summary table
+PHASES = ["translation", "tempest", "parse_results", "ranking", "state_selection", "policy_queries", "restriction", "plotting", "file_moves"]
+
+
+class Tracer:
+    """
+    Records spans of the phases of a run. Every span carries its iteration
+    (None outside the loop) and sizes such as the number of states parsed.
+    The spans are written as a Chrome trace (chrome://tracing or Perfetto) and
+    summed per iteration and phase into a CSV table.
+    """
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = list()
+
+    @contextmanager
+    def span(self, phase, iteration=None, **sizes):
+        """Times the body as one span of phase, sizes known only at its end can be added to the yielded dict."""
+        start = time.perf_counter()
+        try:
+            yield sizes
+        finally:
+            self.spans.append((phase, iteration, start - self.origin, time.perf_counter() - start, threading.get_ident(), sizes))
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": phase, "cat": "imt", "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": tid, "args": {"iteration": iteration, **sizes}}
+                  for phase, iteration, start, duration, tid, sizes in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def summary(self):
+        """Seconds per phase and summed sizes of every iteration, the spans outside the loop in the row of iteration None."""
+        rows = dict()
+        for phase, iteration, _, duration, _, sizes in self.spans:
+            row = rows.setdefault(iteration, dict())
+            row[phase] = row.get(phase, 0.0) + duration
+            for name, size in sizes.items():
+                row[name] = row.get(name, 0) + size
+        return rows
+
+    def write(self, trace_file="trace.json", summary_file="trace.csv"):
+        with open(trace_file, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        rows = self.summary()
+        phases = PHASES + sorted({phase for phase, *_ in self.spans} - set(PHASES))
+        sizes = sorted({name for *_, span_sizes in self.spans for name in span_sizes})
+        with open(summary_file, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["iteration"] + [f"{phase}_s" for phase in phases] + sizes)
+            # the row of the spans outside the loop comes first
+            for iteration in sorted(rows, key=lambda iteration: -1 if iteration is None else iteration):
+                row = rows[iteration]
+                writer.writerow(["run" if iteration is None else iteration] + [f"{row.get(phase, 0.0):.6f}" for phase in phases] + [row.get(name, 0) for name in sizes])
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+
+import argparse, csv, itertools, json, os, subprocess, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MINIGRID = os.path.join(ROOT, "Minigrid")
+UAV = os.path.join(ROOT, "UAV_Reach_Avoid")
+
+# resources test_model.py expects relative to its working directory
+MINIGRID_RESOURCES = ["Minigrid2PRISM", "trained_models", "boilerplate_tikz.tex"]
+
+# read-only files of a noise level that are linked into the sandboxes besides the model and strategy of the run
+UAV_INPUT_EXTENSIONS = [".sta", ".pctl"]
+
+# every run writes its intermediate files (results_maximize, action_ranking, *.prism, ...) into its own sandbox
+RUNS_DIRECTORY = os.path.join(ROOT, "runs")
+
+
+@dataclass
+class Run:
+    name: str
+    driver: str
+    arguments: list
+    links: dict = field(default_factory=dict)
+
+@dataclass
+class RunResult:
+    name: str
+    driver: str
+    returncode: int
+    seconds: float
+    directory: str
+    result: str
+
+
+def expand(entry):
+    """All combinations of the list valued fields of one matrix entry."""
+    keys = [key for key, value in entry.items() if isinstance(value, list) and key != "args"]
+    for values in itertools.product(*[entry[key] for key in keys]):
+        yield {**entry, **dict(zip(keys, values))}
+
+def minigrid_run(entry):
+    policy = entry["policy"]
+    arguments = ["--env", entry["env"], "--policy", policy, "--reward", entry["reward"]] + entry.get("args", [])
+    if entry["mode"] == "RT":
+        arguments += ["--random", str(entry["random_steps"])]
+    else:
+        arguments += ["--refinement-steps", str(entry["refinement_steps"])]
+        if entry["mode"] == "EMT": arguments.append("--randomMT")
+    arguments += ["--dest", entry["mode"]]
+    links = {resource: os.path.join(MINIGRID, resource) for resource in MINIGRID_RESOURCES if os.path.exists(os.path.join(MINIGRID, resource))}
+    steps = entry["random_steps"] if entry["mode"] == "RT" else entry["refinement_steps"]
+    name = f"minigrid_{entry['env']}_{os.path.basename(policy)}_{entry['mode']}_{entry['reward']}_{steps}"
+    return Run(name, "minigrid", arguments, links)
+
+def uav_run(entry):
+    data = os.path.join(UAV, entry["data"])
+    arguments = ["--tra", entry["tra"], "--lab", entry["lab"], "--rew", entry["reward"], "--stra", entry["stra"], "--refinement-steps", str(entry["refinement_steps"])] + entry.get("args", [])
+    if entry["mode"] == "EMT": arguments.append("--ablation")
+    if entry["mode"] == "RT": arguments += ["--random", str(entry["random_queries"])]
+    # only the inputs are linked, translate.py writes MDP_<tra>, MDP_<lab> and its .optrew/.saferew into the working directory
+    inputs = {entry["tra"], entry["lab"], entry["stra"]}
+    links = {f: os.path.join(data, f) for f in os.listdir(data) if f in inputs or os.path.splitext(f)[1] in UAV_INPUT_EXTENSIONS}
+    # as in run_auv.sh, the shared state valuations replace the ones of the noise level
+    links["MDP_state_valuations"] = os.path.join(UAV, "MDP_state_valuations")
+    name = f"uav_{entry['data']}_{entry['mode']}_{entry['reward']}_{entry['refinement_steps']}"
+    return Run(name, "uav", arguments, links)
+
+def read_matrix(filename, drivers):
+    with open(filename, "r") as f:
+        matrix = json.load(f)
+    runs = list()
+    for entry in matrix.get("minigrid", []) if "minigrid" in drivers else []:
+        runs += [minigrid_run(run) for run in expand(entry)]
+    for entry in matrix.get("uav", []) if "uav" in drivers else []:
+        runs += [uav_run(run) for run in expand(entry)]
+    return runs
+
+def pool_size(memory_per_run):
+    cores = os.cpu_count() or 1
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError):
+        return cores
+    return max(1, min(cores, int(available // (memory_per_run * 2**30))))
+
+def python_for(driver_directory):
+    # the docker image has one virtual environment per driver
+    python = os.path.join(driver_directory, "env", "bin", "python3")
+    return python if os.path.exists(python) else sys.executable
+
+def last_result(log_file, driver):
+    result = ""
+    with open(log_file, "r", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if driver == "minigrid" and line.startswith("CSV:"):
+                result = line.replace("CSV:", "").strip()
+            elif driver == "uav" and line:
+                result = line
+    return result
+
+def execute(run, directory):
+    sandbox = os.path.join(directory, run.name)
+    os.makedirs(sandbox)
+    for name, target in run.links.items():
+        os.symlink(target, os.path.join(sandbox, name))
+    driver_directory = MINIGRID if run.driver == "minigrid" else UAV
+    command = [python_for(driver_directory), os.path.join(driver_directory, "test_model.py")] + run.arguments
+    start = time.time()
+    with open(os.path.join(sandbox, "log.txt"), "w") as log:
+        log.write(" ".join(command) + "\n")
+        log.flush()
+        returncode = subprocess.call(command, cwd=sandbox, stdout=log, stderr=subprocess.STDOUT)
+    return RunResult(run.name, run.driver, returncode, time.time() - start, sandbox, last_result(os.path.join(sandbox, "log.txt"), run.driver))
+
+def main(matrix, drivers, jobs, memory_per_run, directory):
+    runs = read_matrix(matrix, drivers)
+    directory = os.path.join(directory, f"{int(time.time())}")
+    jobs = jobs or pool_size(memory_per_run)
+    print(f"Running {len(runs)} experiments with {jobs} parallel jobs in {directory}")
+    os.makedirs(directory)
+    results = list()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(execute, run, directory) for run in runs]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{'done' if result.returncode == 0 else 'FAILED'}\t{result.seconds:8.1f}s\t{result.name}\t{result.result}")
+            results.append(result)
+    with open(os.path.join(directory, "summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "driver", "returncode", "seconds", "directory", "result"])
+        for result in sorted(results, key=lambda result: result.name):
+            writer.writerow([result.name, result.driver, result.returncode, f"{result.seconds:.1f}", result.directory, result.result])
+    return all(result.returncode == 0 for result in results)
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Runs the IMT/EMT/RT experiment matrix in parallel, each run in its own sandbox directory.")
+    parser.add_argument('--matrix', type=str, required=False, default=os.path.join(ROOT, "experiments.json"), help='(optional) JSON file with the experiment matrix, defaults to experiments.json.')
+    parser.add_argument('--drivers', type=str, nargs='+', required=False, default=["minigrid", "uav"], choices=["minigrid", "uav"], help='(optional) Which parts of the matrix to run.')
+    parser.add_argument('--jobs', type=int, required=False, default=0, help='(optional) Number of parallel runs, defaults to what the available cores and memory allow.')
+    parser.add_argument('--memory-per-run', type=float, required=False, default=2.0, help='(optional) Memory in GB to reserve for one run when sizing the pool, defaults to 2.')
+    parser.add_argument('--directory', type=str, required=False, default=RUNS_DIRECTORY, help='(optional) Where the sandboxes and the summary are created, defaults to runs/.')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parseArgs()
+    sys.exit(0 if main(args.matrix, args.drivers, args.jobs, args.memory_per_run, args.directory) else 1)
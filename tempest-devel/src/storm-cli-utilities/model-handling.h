@@ -996,6 +996,99 @@ namespace storm {
             });
         }
 
+        // Printed after every answered worker command, so clients reading from a pipe know when the output is complete.
+        static const std::string workerDoneMarker = "<<done>>";
+
+        /*!
+         * Keeps the built MDP in memory and answers commands read line by line from standard input:
+         *   check <properties>       checks the given properties (same syntax as --prop) on the current model
+         *   fix <state>:<choice> ... keeps only the given (local) choice in each state, choices refer to the unrestricted model
+         *   label <name> <state> ... adds the given states to a state label (the label is created if necessary)
+         *   reset                    drops all restrictions
+         *   quit                     ends the session
+         * The properties given on the command line are checked first; they determine which labels and reward models are built.
+         */
+        template <typename ValueType>
+        void runWorkerSession(std::shared_ptr<storm::models::sparse::Model<ValueType>>& sparseModel, SymbolicInput const& input, std::function<std::unique_ptr<storm::modelchecker::CheckResult>(std::shared_ptr<storm::logic::Formula const> const& formula, std::shared_ptr<storm::logic::Formula const> const& states, std::shared_ptr<storm::logic::ShieldExpression const> const& shieldExpression)> const& verificationCallback, std::function<void(std::unique_ptr<storm::modelchecker::CheckResult> const&)> const& postprocessingCallback) {
+            STORM_LOG_THROW(sparseModel->isOfType(storm::models::ModelType::Mdp), storm::exceptions::NotSupportedException, "Worker sessions are only supported for MDPs.");
+            auto originalModel = sparseModel->template as<storm::models::sparse::Mdp<ValueType>>();
+            auto const& rowGroupIndices = originalModel->getTransitionMatrix().getRowGroupIndices();
+            storm::storage::BitVector removedChoices(originalModel->getNumberOfChoices(), false);
+
+            verifyProperties<ValueType>(input, verificationCallback, postprocessingCallback);
+            std::cout << workerDoneMarker << std::endl;
+
+            std::string line;
+            while (std::getline(std::cin, line)) {
+                std::istringstream command(line);
+                std::string keyword;
+                command >> keyword;
+                if (keyword == "quit") {
+                    break;
+                }
+                try {
+                    if (keyword == "check") {
+                        std::string propertyString;
+                        std::getline(command >> std::ws, propertyString);
+                        SymbolicInput batch;
+                        batch.model = input.model;
+                        if (input.model) {
+                            batch.properties = storm::api::parsePropertiesForSymbolicModelDescription(propertyString, input.model.get(), boost::none);
+                        } else {
+                            batch.properties = storm::api::parseProperties(propertyString, boost::none);
+                        }
+                        verifyProperties<ValueType>(batch, verificationCallback, postprocessingCallback);
+                    } else if (keyword == "fix") {
+                        std::string stateChoice;
+                        while (command >> stateChoice) {
+                            auto separator = stateChoice.find(':');
+                            STORM_LOG_THROW(separator != std::string::npos, storm::exceptions::InvalidArgumentException, "Expected <state>:<choice>, got '" << stateChoice << "'.");
+                            uint64_t state = std::stoull(stateChoice.substr(0, separator));
+                            uint64_t keptChoice = rowGroupIndices.at(state) + std::stoull(stateChoice.substr(separator + 1));
+                            STORM_LOG_THROW(keptChoice < rowGroupIndices.at(state + 1) && !removedChoices.get(keptChoice), storm::exceptions::InvalidArgumentException, "Choice '" << stateChoice << "' is not available.");
+                            for (uint64_t choice = rowGroupIndices[state]; choice < rowGroupIndices[state + 1]; ++choice) {
+                                if (choice != keptChoice) {
+                                    removedChoices.set(choice);
+                                }
+                            }
+                        }
+                        storm::modelchecker::SparseMdpPrctlModelChecker<storm::models::sparse::Mdp<ValueType>> checker(*originalModel);
+                        sparseModel = checker.restrictMdp(removedChoices);
+                        STORM_PRINT("Restricted model to " << sparseModel->getNumberOfChoices() << " choices." << std::endl);
+                    } else if (keyword == "label") {
+                        std::string label;
+                        command >> label;
+                        STORM_LOG_THROW(!label.empty(), storm::exceptions::InvalidArgumentException, "Expected a label name.");
+                        auto& labeling = originalModel->getStateLabeling();
+                        storm::storage::BitVector labeledStates = labeling.containsLabel(label) ? labeling.getStates(label) : storm::storage::BitVector(originalModel->getNumberOfStates(), false);
+                        uint64_t state;
+                        while (command >> state) {
+                            STORM_LOG_THROW(state < labeledStates.size(), storm::exceptions::InvalidArgumentException, "State " << state << " does not exist.");
+                            labeledStates.set(state);
+                        }
+                        // The restricted model holds its own copy of the labeling.
+                        for (auto* model : {static_cast<storm::models::sparse::Model<ValueType>*>(originalModel.get()), sparseModel.get()}) {
+                            if (model->getStateLabeling().containsLabel(label)) {
+                                model->getStateLabeling().setStates(label, labeledStates);
+                            } else {
+                                model->getStateLabeling().addLabel(label, labeledStates);
+                            }
+                        }
+                    } else if (keyword == "reset") {
+                        removedChoices.clear();
+                        sparseModel = originalModel;
+                    } else if (!keyword.empty()) {
+                        STORM_LOG_ERROR("Unknown worker command '" << keyword << "'.");
+                    }
+                } catch (storm::exceptions::BaseException const& ex) {
+                    STORM_LOG_ERROR("Cannot handle worker command '" << keyword << "': " << ex.what());
+                } catch (std::exception const& ex) {
+                    STORM_LOG_ERROR("Cannot handle worker command '" << keyword << "': " << ex.what());
+                }
+                std::cout << workerDoneMarker << std::endl;
+            }
+        }
+
         template <typename ValueType>
         void verifyWithSparseEngine(std::shared_ptr<storm::models::ModelBase> const& model, SymbolicInput const& input, ModelProcessingInformation const& mpi) {
             auto sparseModel = model->as<storm::models::sparse::Model<ValueType>>();
@@ -1050,7 +1143,11 @@ namespace storm {
                                             }
                                             ++exportCount;
                                         };
-            verifyProperties<ValueType>(input,verificationCallback, postprocessingCallback);
+            if (ioSettings.isWorkerSet()) {
+                runWorkerSession<ValueType>(sparseModel, input, verificationCallback, postprocessingCallback);
+            } else {
+                verifyProperties<ValueType>(input,verificationCallback, postprocessingCallback);
+            }
             if (ioSettings.isComputeSteadyStateDistributionSet()) {
                 storm::utility::Stopwatch watch(true);
                 std::unique_ptr<storm::modelchecker::CheckResult> result;
@@ -1,5 +1,8 @@
 #include "storm/modelchecker/prctl/SparseMdpPrctlModelChecker.h"
 
+#include <algorithm>
+#include <cstring>
+
 #include "storm/utility/constants.h"
 #include "storm/utility/macros.h"
 #include "storm/utility/vector.h"
@@ -28,7 +31,10 @@
 
 #include "storm/shields/ShieldHandling.h"
 
+#include "storm/settings/SettingsManager.h"
 #include "storm/settings/modules/GeneralSettings.h"
+#include "storm/settings/modules/IOSettings.h"
+#include "storm/utility/npy.h"
 #include "storm/exceptions/InvalidStateException.h"
 #include "storm/exceptions/InvalidPropertyException.h"
 #include "storm/storage/expressions/Expressions.h"
@@ -401,6 +407,16 @@ namespace storm {
 
             std::ofstream outData;
             std::string direction = dir == OptimizationDirection::Minimize ? "minimize" : "maximize";
+            if (storm::settings::getModule<storm::settings::modules::IOSettings>().isBinaryResultsSet()) {
+                std::vector<double> values;
+                values.reserve(result.size());
+                for (auto const& value : result) {
+                    values.push_back(storm::utility::convertNumber<double>(value));
+                }
+                storm::utility::npy::write(prefix + "results_" + direction + ".npy", "'<f8'", values);
+                this->writeStateValuations(prefix + "state_valuations.npy");
+                return;
+            }
             outData.open(prefix + "results_" + direction);
             for (std::size_t i = 0; i < result.size(); i++) {
 
@@ -416,12 +432,99 @@ namespace storm {
         }
 
 
+        template<typename SparseMdpModelType>
+        void SparseMdpPrctlModelChecker<SparseMdpModelType>::writeStateValuations(std::string const& filename) {
+            if (!this->getModel().hasStateValuations() || this->getModel().getNumberOfStates() == 0) {
+                return;
+            }
+            auto const& valuations = this->getModel().getStateValuations();
+
+            // one record per state, the fields are the variables of the first state (all states of a PRISM model share them)
+            std::string descr = "[";
+            std::size_t recordSize = 0;
+            for (auto valIt = valuations.at(0).begin(); valIt != valuations.at(0).end(); ++valIt) {
+                if (valIt.isVariableAssignment() && valIt.isBoolean()) {
+                    descr += "('" + valIt.getName() + "', '|b1'), ";
+                    recordSize += 1;
+                } else if (valIt.isVariableAssignment() && valIt.isRational()) {
+                    descr += "('" + valIt.getName() + "', '<f8'), ";
+                    recordSize += 8;
+                } else {
+                    descr += "('" + valIt.getName() + "', '<i8'), ";
+                    recordSize += 8;
+                }
+            }
+            descr += "]";
+
+            std::vector<char> records(recordSize * this->getModel().getNumberOfStates());
+            char* record = records.data();
+            for (std::size_t i = 0; i < this->getModel().getNumberOfStates(); i++) {
+                for (auto valIt = valuations.at(i).begin(); valIt != valuations.at(i).end(); ++valIt) {
+                    if (valIt.isVariableAssignment() && valIt.isBoolean()) {
+                        *record = valIt.getBooleanValue() ? 1 : 0;
+                        record += 1;
+                        continue;
+                    }
+                    if (valIt.isVariableAssignment() && valIt.isRational()) {
+                        double const value = storm::utility::convertNumber<double>(valIt.getRationalValue());
+                        std::memcpy(record, &value, 8);
+                    } else {
+                        int64_t const value = valIt.isLabelAssignment() ? valIt.getLabelValue() : valIt.getIntegerValue();
+                        std::memcpy(record, &value, 8);
+                    }
+                    record += 8;
+                }
+            }
+            storm::utility::npy::write(filename, descr, {this->getModel().getNumberOfStates()}, records.data(), records.size());
+        }
+
+        template<typename SparseMdpModelType>
+        void SparseMdpPrctlModelChecker<SparseMdpModelType>::writeStateActionRanking(const std::vector<ValueType>& choiceValues) {
+            auto const& rowGroupIndices = this->getModel().getTransitionMatrix().getRowGroupIndices();
+
+            std::vector<double> ranking;
+            ranking.reserve(stateValueMapping.size());
+            for (auto const& value : stateValueMapping) {
+                ranking.push_back(storm::utility::convertNumber<double>(value));
+            }
+            std::vector<double> values;
+            values.reserve(choiceValues.size());
+            for (auto const& value : choiceValues) {
+                values.push_back(storm::utility::convertNumber<double>(value));
+            }
+            std::vector<uint64_t> rowGroups(rowGroupIndices.begin(), rowGroupIndices.end());
+
+            std::vector<std::string> labelNames(choiceValues.size());
+            std::size_t maxLength = 1;
+            if (this->getModel().hasChoiceLabeling()) {
+                for (std::size_t rowIdx = 0; rowIdx < labelNames.size(); rowIdx++) {
+                    for (auto const& label : this->getModel().getChoiceLabeling().getLabelsOfChoice(rowIdx)) {
+                        labelNames[rowIdx] += (labelNames[rowIdx].empty() ? "" : ", ") + label;
+                    }
+                    maxLength = std::max(maxLength, labelNames[rowIdx].size());
+                }
+            }
+            std::vector<char> labels(maxLength * labelNames.size(), '\0');
+            for (std::size_t rowIdx = 0; rowIdx < labelNames.size(); rowIdx++) {
+                std::memcpy(labels.data() + rowIdx * maxLength, labelNames[rowIdx].data(), labelNames[rowIdx].size());
+            }
+
+            storm::utility::npy::write("action_ranking.npy", "'<f8'", ranking);
+            storm::utility::npy::write("action_ranking_choices.npy", "'<f8'", values);
+            storm::utility::npy::write("action_ranking_row_groups.npy", "'<u8'", rowGroups);
+            storm::utility::npy::write("action_ranking_labels.npy", "'|S" + std::to_string(maxLength) + "'", {labelNames.size()}, labels.data(), labels.size());
+            this->writeStateValuations("state_valuations.npy");
+        }
+
         template<typename SparseMdpModelType>
         void SparseMdpPrctlModelChecker<SparseMdpModelType>::computeStateActionRanking(const std::vector<ValueType>& choiceValues) {
+            bool const binaryResults = storm::settings::getModule<storm::settings::modules::IOSettings>().isBinaryResultsSet();
             std::ofstream outData;
-            outData.open("action_ranking");
+            if (!binaryResults) {
+                outData.open("action_ranking");
+                STORM_LOG_ERROR_COND(outData.is_open(), "File of 'action_ranking' couldn't be opened!");
+            }
 
-            STORM_LOG_ERROR_COND(outData.is_open(), "File of 'action_ranking' couldn't be opened!");
             STORM_LOG_ERROR_COND(choiceValues.size() == this->getModel().getTransitionMatrix().getRowCount(), "State-Action Ranking requires choiceValues!");
 
             this->stateValueMapping.reserve(this->getModel().getTransitionMatrix().getRowGroupCount());
@@ -476,6 +579,11 @@ namespace storm {
 
             std::transform(stateValueMapping.cbegin(), stateValueMapping.cend(), stateValueMapping.begin(), (normFactor != 0 ? regularNorm : constantZero));
 
+            if (binaryResults) {
+                this->writeStateActionRanking(choiceValues);
+                return;
+            }
+
             //STORM_LOG_ASSERT(stateValueMapping.size() == this->getModel().getTransitionMatrix().getRowGroupCount(), "Count of state-value map entries doesn't match transition matrix group count!");
             //STORM_LOG_ASSERT(std::find_if(stateValueMapping.cbegin(), stateValueMapping.cend(), [=](const auto& val) { return (val > 1 || val < 0); }) == stateValueMapping.cend(), "Normalization Failure - Values are not between [0; 1]!");
 
@@ -76,6 +76,16 @@ namespace storm {
             void computeStateActionRanking(const std::vector<ValueType>& choiceValues);
 
             void printResultsPerState(const std::vector<ValueType>& result, const storm::OptimizationDirection dir, const std::string prefix = "");
+
+            /*!
+             * Writes the valuations of all states as a structured .npy array with one field per variable (used with --binaryresults).
+             */
+            void writeStateValuations(std::string const& filename);
+
+            /*!
+             * Writes the normalized stateValueMapping, the choice values, the row groups and the choice labels as .npy files (used with --binaryresults).
+             */
+            void writeStateActionRanking(const std::vector<ValueType>& choiceValues);
             // </state_action_ranking>
         };
     } // namespace modelchecker
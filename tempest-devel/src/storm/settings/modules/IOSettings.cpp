@@ -47,6 +47,8 @@ namespace storm {
             const std::string IOSettings::propertyOptionName = "prop";
             const std::string IOSettings::propertyOptionShortName = "prop";
             const std::string IOSettings::steadyStateDistrOptionName = "steadystate";
+            const std::string IOSettings::workerOptionName = "worker";
+            const std::string IOSettings::binaryResultsOptionName = "binaryresults";
             
             const std::string IOSettings::qvbsInputOptionName = "qvbs";
             const std::string IOSettings::qvbsInputOptionShortName = "qvbs";
@@ -100,6 +102,8 @@ namespace storm {
                 this->addOption(storm::settings::OptionBuilder(moduleName, janiPropertyOptionName, false, "Specifies the properties from the jani model (given by --" + janiInputOptionName + ") to be checked.").setShortName(janiPropertyOptionShortName)
                                 .addArgument(storm::settings::ArgumentBuilder::createStringArgument("values", "A comma separated list of properties to be checked").setDefaultValueString("").makeOptional().build()).build());
                 this->addOption(storm::settings::OptionBuilder(moduleName,  steadyStateDistrOptionName, false, "Computes the steady state distribution. Result can be exported using --" + exportCheckResultOptionName +".").setIsAdvanced().build());
+                this->addOption(storm::settings::OptionBuilder(moduleName, workerOptionName, false, "Keeps the built model in memory after checking the given properties and reads further commands (check, fix, label, reset, quit) from standard input.").setIsAdvanced().build());
+                this->addOption(storm::settings::OptionBuilder(moduleName, binaryResultsOptionName, false, "Writes the per-state results and the state-action ranking as little-endian .npy files instead of text.").setIsAdvanced().build());
 
                 this->addOption(storm::settings::OptionBuilder(moduleName, qvbsInputOptionName, false, "Selects a model from the Quantitative Verification Benchmark Set.").setShortName(qvbsInputOptionShortName)
                         .addArgument(storm::settings::ArgumentBuilder::createStringArgument("model", "The short model name as in the benchmark set.").build())
@@ -298,6 +302,14 @@ namespace storm {
                 return this->getOption(steadyStateDistrOptionName).getHasOptionBeenSet();
             }
             
+            bool IOSettings::isWorkerSet() const {
+                return this->getOption(workerOptionName).getHasOptionBeenSet();
+            }
+
+            bool IOSettings::isBinaryResultsSet() const {
+                return this->getOption(binaryResultsOptionName).getHasOptionBeenSet();
+            }
+
             bool IOSettings::isQvbsInputSet() const {
                 return this->getOption(qvbsInputOptionName).getHasOptionBeenSet();
             }
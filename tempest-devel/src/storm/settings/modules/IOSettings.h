@@ -318,6 +318,16 @@ namespace storm {
                  * Retrieves whether the steady-state distribution is to be computed.
                  */
                 bool isComputeSteadyStateDistributionSet() const;
+
+                /*!
+                 * Retrieves whether the built model is to be kept in memory to answer further commands read from standard input.
+                 */
+                bool isWorkerSet() const;
+
+                /*!
+                 * Retrieves whether per-state results and the state-action ranking are to be written as .npy files instead of text.
+                 */
+                bool isBinaryResultsSet() const;
                 
                 /*!
                  * Retrieves whether the input model is to be read from the quantitative verification benchmark set (QVBS)
@@ -385,6 +395,8 @@ namespace storm {
                 static const std::string propertyOptionName;
                 static const std::string propertyOptionShortName;
                 static const std::string steadyStateDistrOptionName;
+                static const std::string workerOptionName;
+                static const std::string binaryResultsOptionName;
                 static const std::string qvbsInputOptionName;
                 static const std::string qvbsInputOptionShortName;
                 static const std::string qvbsRootOptionName;
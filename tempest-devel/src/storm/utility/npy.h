@@ -0,0 +1,63 @@
+#ifndef STORM_UTILITY_NPY_H_
+#define STORM_UTILITY_NPY_H_
+
+#include <cstdint>
+#include <fstream>
+#include <string>
+#include <vector>
+
+#include "storm/utility/macros.h"
+#include "storm/exceptions/FileIoException.h"
+
+namespace storm {
+    namespace utility {
+        namespace npy {
+
+            /*!
+             * Writes raw data as a NumPy .npy file (format version 1.0), so it can be memory-mapped with numpy.load(..., mmap_mode="r").
+             * The data is written as is, the descriptor has to match the (little-endian) in-memory layout.
+             *
+             * @param filename The file to write.
+             * @param descr The NumPy type descriptor, e.g. "'<f8'" or "[('x', '<i8'), ('done', '|b1')]".
+             * @param shape The shape of the array.
+             * @param data Pointer to the first byte of the data.
+             * @param numberOfBytes The size of the data in bytes.
+             */
+            inline void write(std::string const& filename, std::string const& descr, std::vector<uint64_t> const& shape, char const* data, std::size_t numberOfBytes) {
+                std::string shapeString = "(";
+                for (auto const& dimension : shape) {
+                    shapeString += std::to_string(dimension) + ", ";
+                }
+                if (shape.size() > 1) {
+                    shapeString.resize(shapeString.size() - 2);
+                } else if (shape.size() == 1) {
+                    shapeString.resize(shapeString.size() - 1);
+                }
+                shapeString += ")";
+
+                std::string header = "{'descr': " + descr + ", 'fortran_order': False, 'shape': " + shapeString + ", }";
+                // magic string, version and header length take 10 bytes, the whole preamble is padded to a multiple of 64
+                std::size_t const preambleLength = 10 + header.size() + 1;
+                header.append((64 - preambleLength % 64) % 64, ' ');
+                header += '\n';
+
+                std::ofstream out(filename, std::ios::binary | std::ios::trunc);
+                STORM_LOG_THROW(out.is_open(), storm::exceptions::FileIoException, "File '" << filename << "' couldn't be opened!");
+                out.write("\x93NUMPY\x01\x00", 8);
+                uint16_t const headerLength = static_cast<uint16_t>(header.size());
+                char const lengthBytes[2] = {static_cast<char>(headerLength & 0xff), static_cast<char>(headerLength >> 8)};
+                out.write(lengthBytes, 2);
+                out.write(header.data(), header.size());
+                out.write(data, numberOfBytes);
+            }
+
+            template<typename T>
+            void write(std::string const& filename, std::string const& descr, std::vector<T> const& values) {
+                write(filename, descr, {values.size()}, reinterpret_cast<char const*>(values.data()), values.size() * sizeof(T));
+            }
+
+        }
+    }
+}
+
+#endif // STORM_UTILITY_NPY_H_